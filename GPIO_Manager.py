@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+#
+# LEDs, GO button and switches of the front panel, shared by all the modes.
+# The LED patterns are driven by a single timer thread and the inputs by
+# edge callbacks, so nothing polls the pins.
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import time
+import threading
+import RPi.GPIO as GPIO
+from conf import pins
+
+
+class GPIOManager(object):
+    def __init__(self, bouncetime=200):
+        # pin -> [half period, time of the next toggle, current output]
+        self.blinking = dict()
+        self.condition = threading.Condition()
+        self.go = threading.Event()
+        self.switched = threading.Event()
+        self.go_listeners = list()
+
+        GPIO.add_event_detect(pins.BTN_GO, GPIO.FALLING, callback=self.go_pushed, bouncetime=bouncetime)
+        for pin in (pins.SW_ROLE, pins.SW_MODE):
+            GPIO.add_event_detect(pin, GPIO.BOTH, callback=self.switch_changed, bouncetime=bouncetime)
+
+        self.timer = threading.Thread(target=self.run_timer, name="gpio-timer")
+        self.timer.daemon = True
+        self.timer.start()
+        print("Initialized GPIO manager")
+
+    ################
+    #    INPUTS    #
+    ################
+
+    def go_pushed(self, channel):
+        """ Edge callback of the GO button (thread of RPi.GPIO) """
+
+        self.go.set()
+        for listener in list(self.go_listeners):
+            listener()
+
+    def switch_changed(self, channel):
+        """ Edge callback of the role and mode switches (thread of RPi.GPIO) """
+
+        self.switched.set()
+
+    def add_go_listener(self, listener):
+        """ The listener is called (from the thread of RPi.GPIO) every time GO is pushed """
+
+        self.go_listeners.append(listener)
+
+    def remove_go_listener(self, listener):
+        self.go_listeners.remove(listener)
+
+    def wait_for_go(self, timeout=None):
+        """ Blocks until GO is pushed again. Returns False if the timeout expires """
+
+        self.go.clear()
+        return self.go.wait(timeout)
+
+    def wait_for_switch(self, timeout=None):
+        """ Blocks until the role or mode switch changes. Returns False if the timeout expires """
+
+        self.switched.clear()
+        return self.switched.wait(timeout)
+
+    ##############
+    #    LEDS    #
+    ##############
+
+    def run_timer(self):
+        """ Toggles the blinking LEDs when they are due and sleeps until the next toggle """
+
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                timeout = None
+                for pin, pattern in self.blinking.items():
+                    if pattern[1] <= now:
+                        pattern[2] = 1 - pattern[2]
+                        GPIO.output(pin, pattern[2])
+                        pattern[1] = max(pattern[1] + pattern[0], now)
+                    remaining = pattern[1] - now
+                    if timeout is None or remaining < timeout:
+                        timeout = remaining
+                self.condition.wait(timeout)
+
+    def blink(self, pin, period):
+        """ Starts blinking the LED, period seconds on and period seconds off """
+
+        with self.condition:
+            self.blinking[pin] = [period, time.monotonic(), 0]
+            self.condition.notify()
+
+    def set_led(self, pin, value):
+        """ Stops blinking the LED and sets its output """
+
+        with self.condition:
+            self.blinking.pop(pin, None)
+            GPIO.output(pin, value)
+
+    def set_leds(self, code):
+        self.set_led(pins.LED_WAIT, code)
+        self.set_led(pins.LED_PROCESS, code)
+        self.set_led(pins.LED_SUCCESS, code)
+
+    def leds_off(self):
+        self.set_leds(0)
+
+    ##########################
+    #    NETWORK MODE (NM)   #
+    ##########################
+
+    def network_starting(self):
+        self.leds_off()
+        self.set_led(pins.LED_WAIT, 1)
+
+    def network_tx(self):
+        self.leds_off()
+        self.set_led(pins.LED_PROCESS, 1)
+
+    def network_rx(self):
+        self.leds_off()
+        self.set_led(pins.LED_PROCESS, 1)
+        self.set_led(pins.LED_WAIT, 1)
+
+    def network_error(self):
+        self.leds_off()
+
+    def network_success(self):
+        self.set_leds(1)
@@ -1,4 +1,5 @@
 from libraries.lib_nrf24 import NRF24
+from conf.defaults import *  # noqa: F401,F403 (options explained in conf/defaults.py)
 
 # Packet size parameters
 DATA_SIZE = 28
@@ -39,6 +40,15 @@ SENDER_PIPE = pipes[0]
 RECEIVER_CHANNEL = channels[1]
 RECEIVER_PIPE = pipes[1]
 
+# Files of the options of conf/defaults.py
+CODEC_CACHE_PATH = "/home/pi/MTP-TeamB-2019/files/input/burst/codecs.json"
+OUT_PATH_STORE = "/home/pi/MTP-TeamB-2019/files/output/burst/store/"
+CAPTURE_PATH = "/home/pi/MTP-TeamB-2019/logs/burst_sender.cap"
+PROFILE_LOG_PATH = "/home/pi/MTP-TeamB-2019/logs/phases_burst_sender.log"
+
+# Burst transfer
+BURST = True
+
 # Radio parameters
 SENDER_CSN = 25
 SENDER_CE = 0
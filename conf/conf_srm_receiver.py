@@ -1,4 +1,5 @@
 from libraries.lib_nrf24 import NRF24
+from conf.defaults import *  # noqa: F401,F403 (options explained in conf/defaults.py)
 
 # Packet size parameters
 DATA_SIZE = 28
@@ -36,6 +37,11 @@ SENDER_PIPE = pipes[1]
 RECEIVER_CHANNEL = channels[0]
 RECEIVER_PIPE = pipes[0]
 
+# Files of the options of conf/defaults.py
+OUT_PATH_STORE = "/home/pi/MTP-TeamB-2019/files/output/srm/store/"
+CAPTURE_PATH = "/home/pi/MTP-TeamB-2019/logs/srm_receiver.cap"
+PROFILE_LOG_PATH = "/home/pi/MTP-TeamB-2019/logs/phases_srm_receiver.log"
+
 # Radio parameters
 SENDER_CSN = 25
 SENDER_CE = 0
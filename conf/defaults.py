@@ -0,0 +1,83 @@
+# Options of the SRM and BURST configurations, with their explanation. Every conf_*.py imports them and only sets the
+# values of its mode: the paths below and the options it changes
+
+# Compression
+# CODEC can be "7z", "zlib", "zlib-dict", "bz2", "lzma", "none" or "auto" (chosen for each file by util.select_codec).
+# 7z stays the default until the receiver reports the codecs it supports
+CODEC = "7z"
+# Codecs chosen by "auto" for the last files, by md5: a file always gets the same codec (and session id).
+# CODEC_CACHE_PATH is set by each sender
+
+# Time spent by the host on each frame, used to estimate the air time
+FRAME_OVERHEAD = 0.003
+
+# Preset dictionary for the "zlib-dict" codec (python3 -m src.dictionary <corpus> <file>)
+DICTIONARY_PATH = "/home/pi/MTP-TeamB-2019/files/dictionary/text.dict"
+
+# Parallel compression in independent blocks, for files of PARALLEL_MIN_SIZE bytes or more
+PARALLEL_BLOCK_SIZE = 262144
+PARALLEL_MIN_SIZE = 1048576
+COMPRESSION_PROCESSES = 4
+
+# Dedup: only the chunks that the receiver does not have in its store (OUT_PATH_STORE) are sent. The sender enables
+# it, the receiver fills the store only with the files sent this way. The chunking runs in python and is slow: files
+# bigger than DEDUP_MAX_SIZE are sent whole. The store keeps the DEDUP_STORE_SIZE bytes of the last used chunks
+DEDUP = False
+DEDUP_MAX_SIZE = 4194304
+DEDUP_STORE_SIZE = 67108864
+
+# Delta: only the differences with the file received in the previous execution are sent. Enabled in both ends, the
+# receiver keeps its previous output as the basis
+DELTA = False
+DELTA_BLOCK_SIZE = 2048
+
+# asyncio core: the transfer, the LEDs and the GO button run on one event loop (src/aio.py). Not supported in the
+# BURST mode
+ASYNC_CORE = False
+
+# Batch mode: transfer every file in IN_PATH_RAW in one session
+BATCH_MODE = False
+SOLID_COMPRESSION = True
+SOLID_MAX_FILE_SIZE = 65536
+
+# Channel survey: before the transfer both ends measure every channel (RPD) and move to the two cleanest ones
+# (channels above 83 are outside the 2.4 GHz ISM band)
+CHANNEL_SCAN = False
+SCAN_SWEEPS = 20
+ALLOWED_CHANNELS = range(0, 84)
+
+# Frequency hopping: both ends change channel every HOP_DWELL seconds following a shared pseudo random sequence
+HOPPING = False
+HOP_DWELL = 0.05
+
+# Multicast: the file is broadcast once to MULTICAST_RECEIVERS receivers (up to 5), each one answers the polls of
+# the sender on its own pipe (MULTICAST_PIPES[RECEIVER_ID], pipes 1 to 5 of the sender only differ in the last byte)
+MULTICAST = False
+MULTICAST_RECEIVERS = 2
+RECEIVER_ID = 0
+MULTICAST_PIPES = [[0xc2, 0xc2, 0xc2, 0xc2, 0xc3], [0xc2, 0xc2, 0xc2, 0xc2, 0xc4], [0xc2, 0xc2, 0xc2, 0xc2, 0xc5],
+                   [0xc2, 0xc2, 0xc2, 0xc2, 0xc6], [0xc2, 0xc2, 0xc2, 0xc2, 0xc7]]
+
+# Capture: the radios record the frames they write and read in a ring file (CAPTURE_PATH) of the last
+# CAPTURE_RECORDS frames (python3 -m src.capture analyse|replay)
+CAPTURE = False
+CAPTURE_RECORDS = 65536
+
+# Phase profile: time spent in each phase of the transfer (compression, SPI writes, ACK waits...), appended to
+# PROFILE_LOG_PATH after every execution
+PROFILE_PHASES = False
+
+# Real-time: the radio loop runs on REALTIME_CPU (None: the first isolated core, or the last one) with SCHED_FIFO
+# priority REALTIME_PRIORITY and locked memory, and the GC only runs between executions (needs root)
+REALTIME = False
+REALTIME_CPU = None
+REALTIME_PRIORITY = 50
+
+# Burst transfer (src/burst.py): the sender keeps up to BURST_SIZE data frames in flight, the receiver advertises
+# in every ACK the free slots of its queue of BURST_SIZE frames and the sender never has more frames in flight
+BURST = False
+BURST_SIZE = 20
+
+# Radio initialization: register profile without fixed sleeps, radios reused between executions
+FAST_RADIO_INIT = True
+PRINT_RADIO_DETAILS = False
@@ -1,6 +1,115 @@
 
+# Power on reset of the nRF24L01+ is 100 ms
+RADIO_READY_TIMEOUT = 0.2
+
+# Unix socket of the service (src/service.py)
+SERVICE_SOCKET = "/tmp/mtp-teamb.sock"
+
 CODE_ERROR = 0
 CODE_SUCCESS = 1
 
 PROCESS_BLINK_PERIOD = 0.1
 WAIT_BLINK_PERIOD = 1
+
+HEADER_TAG = b'HDR'
+FILE_SIZE_SIZE = 4
+SESSION_ID_SIZE = 4
+SESSION_SYNC_INTERVAL = 256
+SESSION_EXTENSION = ".session"
+
+QUERY_TAG = b'BMP'
+PAGE_NUM_SIZE = 2
+QUERY_SEQ_NUM = 0
+
+MANIFEST_LEN_SIZE = 4
+
+CODEC_IDS = {"none": 0, "7z": 1, "zlib": 2, "bz2": 3, "lzma": 4, "batch": 5, "blocks": 6, "zlib-dict": 7}
+CODEC_SAMPLE_SIZE = 65536
+CODEC_MAX_ENTROPY = 7.9
+CODEC_CACHE_SIZE = 64
+FRAME_BITS_OVERHEAD = 73
+BLOCK_SIZE_SIZE = 4
+
+# The file is compressed with the preset dictionary of "zlib-dict" (directly or in blocks), the header carries its id
+FLAG_DICTIONARY = 4
+DICTIONARY_TAG = b'DIC'
+DICTIONARY_ID_SIZE = 4
+
+FLAG_DEDUP = 1
+
+OFFER_TAG = b'HAS'
+CHUNK_HASH_SIZE = 6
+CHUNK_COUNT_SIZE = 4
+DEDUP_EXTENSION = ".dedup"
+
+FLAG_DELTA = 2
+
+BASIS_TAG = b'BAS'
+SIGNATURE_TAG = b'SIG'
+WEAK_CHECKSUM_SIZE = 4
+STRONG_CHECKSUM_SIZE = 4
+SIGNATURE_SIZE = WEAK_CHECKSUM_SIZE + STRONG_CHECKSUM_SIZE
+DELTA_EXTENSION = ".delta"
+BASIS_EXTENSION = ".basis"
+
+CHANNEL_TAG = b'CHN'
+SURVEY_CHANNELS = 126
+SURVEY_DWELL = 0.0002
+CHANNEL_CANDIDATES = 11
+CHANNEL_SEPARATION = 4
+RENDEZVOUS_TIMEOUT = 0.5
+
+HOP_TAG = b'HOP'
+SEED_SIZE = 4
+CHANNEL_BITMAP_SIZE = 16
+HOP_SYNC_PERIOD = 32
+HOP_SYNC_TIMEOUT = 0.5
+HOP_MIN_SAMPLES = 20
+HOP_MAX_LOSS = 0.5
+
+NACK_TAG = b'NAK'
+NACK_BITMAP = b'B'
+NACK_LIST = b'L'
+NACK_END = b'E'
+MULTICAST_HEADER_REPEATS = 5
+MULTICAST_EOT_REPEATS = 10
+MULTICAST_MAX_ROUNDS = 100
+MULTICAST_LINGER = 2.0
+
+# TDMA of the Network Mode (src/tdma.py): beacon slot + TDMA_NODES slots of TDMA_SLOT_TIME
+TDMA_BEACON = b'B'
+TDMA_DATA = b'D'
+TDMA_NODES = 8
+TDMA_SLOT_TIME = 0.02
+TDMA_GUARD_TIME = 0.002
+TDMA_FRAME_TIME = 0.0005
+TDMA_SYNC_TIMEOUT = 3
+TDMA_BEACON_DELAY = 0.0003
+
+# File dissemination of the Network Mode (src/dissemination.py), NM_FRAME_SIZE bytes of payload per TDMA frame
+NM_ADVERT = b'A'
+NM_TOKEN = b'T'
+NM_CHUNK = b'C'
+NM_FRAME_SIZE = 30
+NM_CHUNK_SIZE = NM_FRAME_SIZE - 1 - PAGE_NUM_SIZE
+NM_TOKEN_BURST = 64
+
+# Neighbour discovery and ETX routing of the Network Mode (src/neighbours.py)
+NM_HELLO = b'H'
+HELLO_PERIOD = 1.0
+NEIGHBOUR_WINDOW = 16
+NEIGHBOUR_TIMEOUT = 5
+MAX_ROUTE_ETX = 30
+ROUTE_SEQ_SLACK = 2
+
+# Capture of the radio traffic (src/capture.py), frames of up to MAX_FRAME_SIZE bytes (nRF24L01+ payload)
+MAX_FRAME_SIZE = 32
+
+# Per-phase timing of the transfers (src/phases.py), times kept per phase
+PHASE_SAMPLES = 65536
+
+# Real-time options of the radio loop (src/realtime.py), sleeps measured for each jitter report
+JITTER_SAMPLES = 200
+
+# Burst transfer (src/burst.py): poll period of the thread that empties the RX FIFO (3 frames)
+BURST_POLL_INTERVAL = 0.0002
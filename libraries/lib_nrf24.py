@@ -195,6 +195,7 @@ class NRF24:
         self.dynamic_payloads_enabled = False #*< Whether dynamic payloads are enabled.
         self.ack_payload_length = 5 #*< Dynamic size of pending ack payload.
         self.pipe0_reading_address = None #*< Last address set on pipe 0 for reading.
+        self.capture = None # Records the frames written and read (src/capture.py), if enabled
 
     def ce(self, level):
         if self.ce_pin == 0:
@@ -265,6 +266,8 @@ class NRF24:
             blank = [0x00 for i in range(blank_len)]
             txbuffer.extend(blank)
 
+        if self.capture is not None:
+            self.capture.sent(buf)
         return self.spidev.xfer2(txbuffer)
 
     def read_payload(self, buf, buf_len=-1):
@@ -281,6 +284,8 @@ class NRF24:
         payload = self.spidev.xfer2(txbuffer)
         del buf[:]
         buf.extend(payload[1:data_len + 1])
+        if self.capture is not None:
+            self.capture.received(buf)
         return data_len
 
     def flush_rx(self):
@@ -417,6 +422,51 @@ class NRF24:
         self.flush_rx()
         self.flush_tx()
 
+    # Fast initialization: instead of begin (fixed sleeps and read-modify-write
+    # of every register) the caller opens the SPI bus, waits until the chip
+    # answers and writes a complete register profile, a list of (register, value).
+
+    def open(self, csn_pin, ce_pin=0):
+        self.spidev.open(0, csn_pin)
+        self.spidev.max_speed_hz = 1000000
+        self.ce_pin = ce_pin
+
+        if ce_pin:
+            self.GPIO.setup(self.ce_pin, self.GPIO.OUT)
+
+    def wait_ready(self, timeout):
+        # SETUP_AW is never 0 (illegal) nor 0xff (no chip on the bus) once the chip is up
+        start_time = time.time()
+        while self.read_register(NRF24.SETUP_AW) not in (1, 2, 3):
+            if time.time() - start_time > timeout:
+                return False
+            time.sleep(1 / 1000.0)
+        return True
+
+    def write_profile(self, profile):
+        self.ce(NRF24.LOW)
+        for reg, value in profile:
+            self.write_register(reg, value)
+            if reg == NRF24.FEATURE and self.read_register(NRF24.FEATURE) != value:
+                # Features not activated (non-P variant)
+                self.toggle_features()
+                self.write_register(reg, value)
+
+        self.write_register(NRF24.STATUS, _BV(NRF24.RX_DR) | _BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT))
+        self.flush_rx()
+        self.flush_tx()
+
+    def check_profile(self, profile):
+        # Single readback of the registers of the profile. PWR_UP and PRIM_RX are
+        # set by startListening / startWrite, they are not part of the profile
+        for reg, value in profile:
+            mask = 0xff
+            if reg == NRF24.CONFIG:
+                mask = ~(_BV(NRF24.PWR_UP) | _BV(NRF24.PRIM_RX)) & 0xff
+            if self.read_register(reg) & mask != value & mask:
+                return False
+        return True
+
     def end(self):
         if self.spidev:
             self.spidev.close()
@@ -663,6 +713,10 @@ class NRF24:
     def testRPD(self):
         return self.read_register(NRF24.RPD) & 1
 
+    def rxFifoFull(self):
+        # The RX FIFO holds 3 payloads, the ones received while it is full are lost
+        return self.read_register(NRF24.FIFO_STATUS) & _BV(NRF24.RX_FULL) != 0
+
     def setPALevel(self, level):
         setup = self.read_register(NRF24.RF_SETUP)
         setup &= ~( _BV(NRF24.RF_PWR_LOW) | _BV(NRF24.RF_PWR_HIGH))
@@ -7,25 +7,20 @@
 # Version: 1.0
 
 
+from src import startup
+
 import time
 import RPi.GPIO as GPIO
-from threading import Thread
-
-from src import util
-
-from src.sender import Sender
-from src.receiver import Receiver
 
-from conf import conf_nm
-from conf import conf_srm_receiver, conf_srm_sender
-from conf import conf_burst_receiver, conf_burst_sender
 from conf import pins
 
 from const import mode, role, const
 
-from NM import network_mode
-from conf.conf_nm import team_configuration
-from GPIO_Manager_NM import GPIOManager
+from GPIO_Manager import GPIOManager
+
+# The modules of each mode (confs, radios, codecs, NM) are only imported once
+# the switches select it, see select_conf and load_device
+startup.mark("imports")
 
 
 # Initialization
@@ -42,21 +37,27 @@ ROLE = role.NONE
 GO = False
 TX_SUCCESS = False
 
+# LEDs and inputs of the front panel
+LEDS = None
+
 
 def init_radios(config):
     global SENDER, RECEIVER
-    
+    from src import util
+
     # Initialize the sender radio and print details
     SENDER = util.initialize_radios(config.SENDER_CE, config.SENDER_CSN, config.SENDER_CHANNEL, config)
     SENDER.openWritingPipe(config.SENDER_PIPE)
-    print("Sender Information")
-    SENDER.printDetails()
+    if config.PRINT_RADIO_DETAILS:
+        print("Sender Information")
+        SENDER.printDetails()
 
     # Initialize the receiver radio and print details
     RECEIVER = util.initialize_radios(config.RECEIVER_CE, config.RECEIVER_CSN, config.RECEIVER_CHANNEL, config)
     RECEIVER.openReadingPipe(0, config.RECEIVER_PIPE)
-    print("Receiver Information")
-    RECEIVER.printDetails()
+    if config.PRINT_RADIO_DETAILS:
+        print("Receiver Information")
+        RECEIVER.printDetails()
 
 
 def check_role():
@@ -88,6 +89,7 @@ def check_mode():
 
 
 def setup_gpio():
+    global LEDS
     # Setup inputs
     GPIO.setup(pins.SW_ROLE, GPIO.IN)
     GPIO.setup(pins.SW_MODE, GPIO.IN)
@@ -96,18 +98,23 @@ def setup_gpio():
     GPIO.setup(pins.LED_WAIT, GPIO.OUT, initial=GPIO.LOW)
     GPIO.setup(pins.LED_PROCESS, GPIO.OUT, initial=GPIO.LOW)
     GPIO.setup(pins.LED_SUCCESS, GPIO.OUT, initial=GPIO.LOW)
+    # Edge callbacks and LED timer
+    LEDS = GPIOManager()
 
 
 def select_conf():
     if ROLE == role.TX:
         if MODE == mode.SRM:
             print("Entering SRM-TX Mode...")
+            from conf import conf_srm_sender
             return conf_srm_sender
         elif MODE == mode.NM:
             print("Entering NM...")
+            from conf import conf_nm
             return conf_nm
         elif MODE == mode.BURST:
             print("Entering BURST-TX Mode...")
+            from conf import conf_burst_sender
             return conf_burst_sender
         elif MODE == mode.NONE:
             print("No mode selected. Exiting...")
@@ -115,12 +122,15 @@ def select_conf():
     elif ROLE == role.RX:
         if MODE == mode.SRM:
             print("Entering SRM-RX Mode...")
+            from conf import conf_srm_receiver
             return conf_srm_receiver
         elif MODE == mode.NM:
             print("Entering NM Mode...")
+            from conf import conf_nm
             return conf_nm
         elif MODE == mode.BURST:
             print("Entering BURST-RX Mode...")
+            from conf import conf_burst_receiver
             return conf_burst_receiver
         elif MODE == mode.NONE:
             print("No mode selected. Exiting...")
@@ -130,67 +140,77 @@ def select_conf():
         exit(0)
 
 
+def load_device(config):
+    """ Imports the sender or the receiver (and the codecs) and creates it """
+
+    if config.BURST and config.ASYNC_CORE:
+        # The bursts block on the radios (send_window) and BurstReceiver needs its reader thread
+        print("The BURST mode does not run on the asyncio core, set ASYNC_CORE = False. Exiting...")
+        return None
+    if config.MULTICAST:
+        from src.multicast import MulticastSender, MulticastReceiver
+        startup.mark("import multicast")
+        if ROLE == role.TX:
+            return MulticastSender(config, SENDER, RECEIVER)
+        elif ROLE == role.RX:
+            return MulticastReceiver(config, SENDER, RECEIVER)
+    elif config.BURST:
+        from src.burst import BurstSender, BurstReceiver
+        startup.mark("import burst")
+        if ROLE == role.TX:
+            return BurstSender(config, SENDER, RECEIVER)
+        elif ROLE == role.RX:
+            return BurstReceiver(config, SENDER, RECEIVER)
+    elif ROLE == role.TX:
+        from src.sender import Sender
+        startup.mark("import sender")
+        return Sender(config, SENDER, RECEIVER)
+    elif ROLE == role.RX:
+        from src.receiver import Receiver
+        startup.mark("import receiver")
+        return Receiver(config, SENDER, RECEIVER)
+    return None
+
+
 def wait_for_go():
     global GO
-    # Wait until GO is pushed
-    while not GO:
-        go_sw = GPIO.input(pins.BTN_GO)
-        if go_sw == 0:
-            GO = True
-            print("GO pushed, starting transmission/reception...")
-        else:
-            time.sleep(0.05)
+    # Wait until GO is pushed (edge callback)
+    LEDS.wait_for_go()
+    GO = True
+    print("GO pushed, starting transmission/reception...")
 
 
 def start_process_blink():
-    blink_thread = Thread(target=blink_process, args=(const.PROCESS_BLINK_PERIOD,))
-    blink_thread.start()
+    LEDS.blink(pins.LED_PROCESS, const.PROCESS_BLINK_PERIOD)
 
 
 def start_wait_blink():
-    blink_thread = Thread(target=blink_wait, args=(const.WAIT_BLINK_PERIOD,))
-    blink_thread.start()
-
-
-def blink_process(blink_period):
-    while GO:
-        GPIO.output(pins.LED_PROCESS, 1)
-        time.sleep(blink_period)
-        GPIO.output(pins.LED_PROCESS, 0)
-        time.sleep(blink_period)
-    print("Process blink ended")
-
-
-def blink_wait(blink_period):
-    while not TX_SUCCESS and not GO:
-        GPIO.output(pins.LED_WAIT, 1)
-        time.sleep(blink_period)
-        GPIO.output(pins.LED_WAIT, 0)
-        time.sleep(blink_period)
-    print("Wait blink ended")
+    LEDS.blink(pins.LED_WAIT, const.WAIT_BLINK_PERIOD)
 
 
 def set_success_led(code):
-    GPIO.output(pins.LED_WAIT, code)
-    GPIO.output(pins.LED_PROCESS, code)
-    GPIO.output(pins.LED_SUCCESS, code)
+    LEDS.set_leds(code)
 
 
 def main():
     global GO, TX_SUCCESS
 
     setup_gpio()
+    startup.mark("GPIO setup")
 
     while not (check_mode() and check_role()):
         print("Mode and/or role checked unsuccessfully. Retrying...")
-        time.sleep(0.5)
+        LEDS.wait_for_switch(0.5)
 
     if MODE is mode.NM:
         print("Entered NM code")
-        led_manager = GPIOManager()
+        from NM import network_mode
+        from conf.conf_nm import team_configuration
+        startup.mark("import NM")
+        startup.report()
         start_wait_blink()
         wait_for_go()
-        network_mode.start(ROLE, led_manager, team_configuration)
+        network_mode.start(ROLE, LEDS, team_configuration)
 
     ####################################################
     # This code will not be executed if the mode is NM #
@@ -213,40 +233,65 @@ def main():
             if not check_mode():
                 break
 
+            # The start-up of the next executions is profiled from here
+            if execution_number > 1:
+                startup.restart()
+
             # Read proper configuration file
             config_file = select_conf()
+            startup.mark("import conf")
 
             # Initialize radios and tx/rx devices
             init_radios(config_file)
-            if ROLE == role.TX:
-                device = Sender(config_file, SENDER, RECEIVER)
-            elif ROLE == role.RX:
-                device = Receiver(config_file, SENDER, RECEIVER)
-            else:
+            startup.mark("radio init")
+            device = load_device(config_file)
+            if device is None:
                 break
-
-            # Show program is waiting for the GO
-            start_wait_blink()
-            print("Waiting for the GO...")
-
-            wait_for_go()
-
-            # Clear output folders
-            print("Clearing outputs...")
-            util.clear_outputs(config_file)
-
-            # Start tx/rx
-            if ROLE == role.TX:
-                start_process_blink()
-                success = device.transmit()
-            elif ROLE == role.RX:
-                start_process_blink()
-                success = device.receive()
+            startup.mark("device init")
+            if config_file.REALTIME:
+                from src import realtime
+                realtime.setup(config_file)
+                startup.mark("real-time setup")
+            startup.report()
+
+            if config_file.ASYNC_CORE:
+                # The GO, the LEDs and the tx/rx run on the asyncio event loop
+                from src import aio
+                print("Waiting for the GO...")
+                success = aio.run_execution(device, config_file, LEDS)
             else:
-                break
+                # Show program is waiting for the GO
+                start_wait_blink()
+                print("Waiting for the GO...")
+
+                wait_for_go()
+                LEDS.set_led(pins.LED_WAIT, 0)
+
+                # Clear output folders
+                print("Clearing outputs...")
+                from src import util
+                util.clear_outputs(config_file)
+
+                # Start tx/rx
+                if ROLE not in (role.TX, role.RX):
+                    break
+                from src import phases
+                from src import realtime
+                phases.begin(config_file)
+                realtime.begin_transfer(config_file)
+                start_process_blink()
+                try:
+                    if ROLE == role.TX:
+                        success = device.transmit()
+                    else:
+                        success = device.receive()
+                finally:
+                    realtime.end_transfer(config_file)
+                    phases.end(config_file, ROLE.upper() + " execution " + str(execution_number))
 
             # Set success LED according to the result
             GO = False
+            LEDS.set_led(pins.LED_PROCESS, 0)
             if success:
                 TX_SUCCESS = True
                 time.sleep(0.5)
@@ -257,15 +302,11 @@ def main():
             # Wait for the user to see that the program has ended successfully
             # If ANOTHER EXECUTION is desired, GO must be pushed
             # If END OF PROGRAM is desired, NOTHING should be done
-            while not execution_ended:
-                go_sw = GPIO.input(pins.BTN_GO)
-                if go_sw == 0:
-                    execution_ended = True
-                    # Switching off the LEDs
-                    set_success_led(const.CODE_ERROR)
-                    print("GO pushed, ending execution ...")
-                else:
-                    time.sleep(0.05)
+            LEDS.wait_for_go()
+            execution_ended = True
+            # Switching off the LEDs
+            set_success_led(const.CODE_ERROR)
+            print("GO pushed, ending execution ...")
 
         # Print the success of the execution
         if TX_SUCCESS:
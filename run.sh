@@ -6,3 +6,6 @@ date_str="$(date +%Y-%m-%d_%k-%M-%S)"
 
 stdbuf -oL python3 /home/pi/MTP-TeamB-2019/main.py > "/home/pi/MTP-TeamB-2019/logs/log__$date_str.log"
 
+
+# Service mode (radios and codecs kept warm, jobs from GO or "python3 -m src.service tx"):
+# cd /home/pi/MTP-TeamB-2019 && stdbuf -oL python3 -m src.service serve > "/home/pi/MTP-TeamB-2019/logs/service__$date_str.log"
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+#
+# asyncio core of the protocol: radio readiness, retransmission timeouts
+# and GPIO events are awaitables of one event loop (the LEDs are driven by
+# GPIO_Manager). The loop runs one transfer at a time: the phase profile
+# and the real-time settings are global to the process
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import asyncio
+from src import util
+from src import phases
+from src import realtime
+from src.sender import Sender
+from conf import pins
+from const import const
+
+
+# The IRQ pin of the radios is not wired (see conf/pins.py), so their
+# readiness is polled, giving the loop back between two polls
+POLL_INTERVAL = 0.0005
+
+
+async def wait_available(radio, pipe, timeout=None):
+    """ Waits until the radio has a frame in the pipe or until the
+    timeout (in seconds) expires. Returns True if there is a frame. """
+
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while not radio.available(pipe):
+        if deadline is not None and loop.time() >= deadline:
+            return False
+        await asyncio.sleep(POLL_INTERVAL)
+    return True
+
+
+async def wait_for_go(leds):
+    """ Waits until GO is pushed, blinking the wait LED. The edge callback
+    of the GPIO manager runs in the thread of RPi.GPIO, so the event is set
+    from the loop with call_soon_threadsafe. """
+
+    loop = asyncio.get_running_loop()
+    pushed = asyncio.Event()
+    listener = lambda: loop.call_soon_threadsafe(pushed.set)
+    leds.add_go_listener(listener)
+    leds.blink(pins.LED_WAIT, const.WAIT_BLINK_PERIOD)
+    try:
+        await pushed.wait()
+    finally:
+        leds.remove_go_listener(listener)
+        leds.set_led(pins.LED_WAIT, 0)
+    print("GO pushed, starting transmission/reception...")
+
+
+class AsyncSender(object):
+    """ Runs the protocol steps of a Sender (see Sender.transmission) on the event loop """
+
+    def __init__(self, device):
+        self.device = device
+        self.config = device.config
+
+    async def transmit_frame(self, payload, seq_num, patient=False):
+        """ Same as Sender.transmit_frame (see Sender.frame_steps), but the
+        waits for the ACKs, also the ones of the hopping syncs, give the
+        loop back """
+
+        device = self.device
+        steps = device.frame_steps(payload, seq_num, patient)
+        try:
+            next(steps)
+            while True:
+                start = phases.start()
+                available = await wait_available(device.receiver, self.config.RECEIVER_PIPE, self.config.ACK_TIMEOUT)
+                phases.stop(phases.ACK_WAIT, start)
+                steps.send(available)
+        except StopIteration as end:
+            return end.value
+
+    async def transmit(self):
+        self.device.receiver.startListening()
+        steps = self.device.transmission()
+        try:
+            frame = next(steps)
+            while True:
+                ack = await self.transmit_frame(*frame)
+                frame = steps.send(ack)
+        except StopIteration as end:
+            return end.value
+
+
+class AsyncReceiver(object):
+    """ Runs a Receiver (see Receiver.handle_frame) on the event loop """
+
+    def __init__(self, device):
+        self.device = device
+        self.config = device.config
+
+    async def receive(self):
+        device = self.device
+        device.start_reception()
+        device.receiver.startListening()
+        try:
+            while not device.rx_success:
+                start = phases.start()
+                available = await wait_available(device.receiver, self.config.RECEIVER_PIPE, self.config.DATA_TIMEOUT)
+                phases.stop(phases.DATA_WAIT, start)
+                if not available:
+                    device.check_rendezvous()
+                    device.follow_hops()
+                    continue
+                rx_buffer = []
+                device.receiver.read(rx_buffer, device.receiver.getDynamicPayloadSize())
+                device.handle_frame(rx_buffer)
+                device.follow_hops()
+        except IOError:
+            print("ERROR when saving the file")
+            return False
+        finally:
+            if device.session is not None:
+                device.session.close()
+
+        # Uncompressing does not wait for the radio, it runs in another thread to keep the loop free
+        return await asyncio.get_running_loop().run_in_executor(None, device.finish_reception)
+
+
+async def execute(device, config, leds):
+    """ Waits for the GO and runs the transmission or reception with the
+    process LED blinking. Returns True if success """
+
+    await wait_for_go(leds)
+    print("Clearing outputs...")
+    util.clear_outputs(config)
+
+    leds.blink(pins.LED_PROCESS, const.PROCESS_BLINK_PERIOD)
+    phases.begin(config)
+    realtime.begin_transfer(config)
+    try:
+        if isinstance(device, Sender):
+            return await AsyncSender(device).transmit()
+        else:
+            return await AsyncReceiver(device).receive()
+    finally:
+        realtime.end_transfer(config)
+        phases.end(config, "TX" if isinstance(device, Sender) else "RX")
+        leds.set_led(pins.LED_PROCESS, 0)
+
+
+def run_execution(device, config, leds):
+    """ Runs one execution (see execute) on a new event loop """
+
+    return asyncio.run(execute(device, config, leds))
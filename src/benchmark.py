@@ -0,0 +1,511 @@
+#!/usr/bin/python3
+#
+# Benchmarks for the host-side parts of the protocol
+# Usage: python3 -m src.benchmark <name>
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import sys
+import time
+import tempfile
+import zlib
+import lzma
+import hashlib
+import tracemalloc
+import random
+import types
+import collections
+from src import util
+from src import dictionary
+from src import hopping
+from src import tdma
+from src import dissemination
+from src import neighbours
+from const import const
+from conf import conf_srm_sender
+
+
+MB = 1024 * 1024
+
+
+def read_file_list(config, file_path):
+    """ Previous version of util.read_file, kept for comparison """
+
+    payload_list = list()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(config.DATA_SIZE)
+            if chunk:
+                payload_list.append(chunk)
+            else:
+                break
+    return payload_list
+
+
+def measure(function, *args):
+    """ Runs the function and returns (result, seconds, peak python memory in bytes) """
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start_time
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def timed(function, *args):
+    """ Runs the function and returns (result, seconds), without tracing memory """
+
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def iterate_chunks(payload_list):
+    total = 0
+    for chunk in payload_list:
+        total = total + len(chunk)
+    return total
+
+
+def bench_read_file():
+    """ Compares the list based reader with the mmap ChunkView at 1 MB and 100 MB """
+
+    config = conf_srm_sender
+    for size in (1 * MB, 100 * MB):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(os.urandom(size))
+            f.flush()
+            print("File size: " + str(size // MB) + " MB")
+            for name, reader in (("list", read_file_list), ("mmap", util.ChunkView)):
+                if reader is util.ChunkView:
+                    payload_list, load_time, load_peak = measure(reader, f.name, config.DATA_SIZE)
+                else:
+                    payload_list, load_time, load_peak = measure(reader, config, f.name)
+                total, iter_time = timed(iterate_chunks, payload_list)
+                random_access, index_time = timed(payload_list.__getitem__, len(payload_list) // 2)
+                print("    {0}: load {1:.3f} s, peak {2:.1f} MB | iterate {3:.3f} s | index {4:.1f} us".format(
+                    name, load_time, load_peak / MB, iter_time, index_time * 1000000))
+                del payload_list, random_access
+
+
+def bench_dictionary():
+    """ Compression ratio of zlib with and without a preset dictionary on
+    the sample inputs of the repository. The dictionary used for each
+    file is trained with all the other (distinct) samples. """
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = dict()
+    for file_path in dictionary.corpus_files(os.path.join(project_root, "files", "input")):
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        if data:
+            samples.setdefault(hashlib.md5(data).hexdigest(), (file_path, data))
+
+    print("{0:<40} {1:>9} {2:>9} {3:>9} {4:>9}".format("file", "size", "zlib-9", "dict-9", "lzma-6"))
+    for key, (file_path, data) in sorted(samples.items(), key=lambda item: len(item[1][1])):
+        corpus = [path for other, (path, _) in samples.items() if other != key]
+        zdict = dictionary.train_dictionary(corpus)
+        plain = zlib.compress(data, 9)
+        compressor = zlib.compressobj(9, zdict=zdict)
+        with_dict = compressor.compress(data) + compressor.flush()
+        xz = lzma.compress(data, preset=6)
+        print("{0:<40} {1:>9} {2:>9} {3:>9} {4:>9}".format(
+            os.path.relpath(file_path, project_root)[-40:], len(data), len(plain), len(with_dict), len(xz)))
+
+
+def wifi_interference(channel, now, rng):
+    """ Wi-Fi on its channel 6 (2426-2448 MHz) busy 70% of the time, and a
+    microwave oven sweeping 2450-2480 MHz, on half of every 20 ms """
+
+    if 26 <= channel <= 48 and rng.random() < 0.7:
+        return True
+    if 50 <= channel <= 80 and now % 0.02 < 0.01 and rng.random() < 0.9:
+        return True
+    return False
+
+
+class SimulatedRadio(object):
+    """ Radio of simulate_transfer. What it writes reaches the peer radio
+    if both are on the same channel and there is no interference on it
+    (wifi_interference). The peer calls before_frame (follow_hops of the
+    receiver) before every frame it could hear, and handles the frame with
+    on_frame, or queues it for read if on_frame is None. """
+
+    def __init__(self, clock, rng, channel, overhead=0.0):
+        self.clock = clock
+        self.rng = rng
+        self.channel = channel
+        self.overhead = overhead
+        self.peer = None
+        self.before_frame = None
+        self.on_frame = None
+        self.frames = collections.deque()
+        self.written = 0
+
+    def ce(self, level):
+        pass
+
+    def setChannel(self, channel):
+        self.channel = channel
+
+    def write(self, buf):
+        self.written = self.written + 1
+        self.clock.sleep(self.overhead)
+        peer = self.peer
+        if peer.before_frame is not None:
+            peer.before_frame()
+        if peer.channel == self.channel and not wifi_interference(self.channel, self.clock.time(), self.rng):
+            if peer.on_frame is not None:
+                peer.on_frame(list(buf))
+            else:
+                peer.frames.append(bytes(buf))
+        return True
+
+    def available(self, pipe_num=None):
+        return bool(self.frames)
+
+    def getDynamicPayloadSize(self):
+        return len(self.frames[0])
+
+    def read(self, buf, buf_len=-1):
+        buf[:] = self.frames.popleft()
+
+
+class VirtualClock(object):
+    """ time.time and time.sleep of the simulations """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now = self.now + seconds
+
+
+class LineCounter(object):
+    """ stdout that only counts the lines that start with text """
+
+    def __init__(self, text):
+        self.text = text
+        self.count = 0
+
+    def write(self, data):
+        if data.startswith(self.text):
+            self.count = self.count + 1
+
+    def flush(self):
+        pass
+
+
+def simulate_transfer(config, size, channels, hopping_mode, rng):
+    """ Stop and wait transfer of size bytes (whole frames) in virtual time, between the
+    real Sender and Receiver over simulated radios (SimulatedRadio): on
+    fixed (data, ack) channels, or hopping from them (hopping_mode
+    "blacklist", or "plain" without blacklisting). The sender runs
+    transmit_frame, follow_hops and hop_sync, the receiver handle_frame
+    and follow_hops, which loses the schedule without frames for
+    HOP_SYNC_TIMEOUT. Returns (seconds, attempts, longest stall in
+    seconds, resyncs), seconds is None if it aborts. """
+
+    from src.sender import Sender
+    from src.receiver import Receiver
+
+    clock = VirtualClock()
+    tx_data = SimulatedRadio(clock, rng, channels[0], config.FRAME_OVERHEAD)
+    tx_ack = SimulatedRadio(clock, rng, channels[1])
+    rx_data = SimulatedRadio(clock, rng, channels[0])
+    rx_ack = SimulatedRadio(clock, rng, channels[1])
+    tx_data.peer, rx_ack.peer = rx_data, tx_ack
+    sender = Sender(config, tx_data, tx_ack)
+    receiver = Receiver(config, rx_ack, rx_data)
+
+    acks = [0.0]
+    stall = [0.0]
+
+    def ack_received(frame):
+        stall[0] = max(stall[0], clock.time() - acks[0])
+        acks[0] = clock.time()
+        tx_ack.frames.append(bytes(frame))
+
+    tx_ack.on_frame = ack_received
+    rx_data.before_frame = lambda: receiver.follow_hops()
+    rx_data.on_frame = receiver.handle_frame
+
+    payload_list = [bytes(config.DATA_SIZE)] * (size // config.DATA_SIZE)
+    header = util.build_header(len(payload_list) * config.DATA_SIZE, 1, "none")
+
+    def transfer():
+        yield header, 1, True
+        sent = yield from sender.send_chunks(payload_list, None)
+        return sent
+
+    real_time, real_sleep, real_stdout = time.time, time.sleep, sys.stdout
+    resyncs = LineCounter("Hopping out of sync")
+    time.time, time.sleep, sys.stdout = clock.time, clock.sleep, resyncs
+    try:
+        receiver.start_reception()
+        if hopping_mode is not None:
+            sender.start_hopping()
+            sender.hopper.seed = rng.getrandbits(32)
+            sender.hopper.sequence = hopping.hop_sequence(sender.hopper.seed, config.ALLOWED_CHANNELS)
+            if hopping_mode != "blacklist":
+                sender.hopper.record = lambda channel, success: False
+        sent = sender.run(transfer())
+    finally:
+        time.time, time.sleep, sys.stdout = real_time, real_sleep, real_stdout
+        if receiver.session is not None:
+            receiver.session.close()
+    stall[0] = max(stall[0], clock.time() - acks[0])
+    return clock.time() if sent else None, tx_data.written, stall[0], resyncs.count
+
+
+def bench_hopping():
+    """ Transfer of 1 MB (in 28 byte frames) with simulated Wi-Fi and
+    microwave interference: fixed channels against frequency hopping """
+
+    config = types.SimpleNamespace(**{key: getattr(conf_srm_sender, key) for key in dir(conf_srm_sender)
+                                      if key.isupper()})
+    config.CHANNEL_SCAN = False
+    print("{0:<32} {1:>9} {2:>9} {3:>13} {4:>8}".format("scenario", "time (s)", "attempts", "longest stall",
+                                                        "resyncs"))
+    for name, channels, hopping_mode in (("fixed 30/40 (default)", (30, 40), None),
+                                         ("fixed 2/10 (clean)", (2, 10), None),
+                                         ("hopping, no blacklist", (30, 40), "plain"),
+                                         ("hopping + blacklist", (30, 40), "blacklist")):
+        with tempfile.TemporaryDirectory() as out_path:
+            config.OUT_FILEPATH_COMPRESSED = os.path.join(out_path, "received")
+            seconds, attempts, stall, resyncs = simulate_transfer(config, MB, channels, hopping_mode,
+                                                                  random.Random(1))
+        print("{0:<32} {1:>9} {2:>9} {3:>13} {4:>8}".format(
+            name, "aborted" if seconds is None else "{0:.1f}".format(seconds), attempts,
+            "{0:.2f} s".format(stall), resyncs))
+
+
+# Air time of a 32 byte frame at 2 Mbps (with preamble, address and CRC)
+FRAME_AIR_TIME = 0.00017
+
+
+def simulate_network(nodes, frames, use_tdma, rng):
+    """ nodes on one channel broadcasting frames payloads each, in virtual
+    time (ticks of FRAME_AIR_TIME). The clocks of the nodes have random
+    offsets. With TDMA the nodes follow src/tdma.py, without it they send
+    whenever their queue is not empty. Every node needs TDMA_FRAME_TIME
+    between frames, and two frames in the same tick collide.
+    Returns (seconds until all the queues are empty, seconds until the
+    first beacon, delivered fraction, collisions) """
+
+    now = [0.0]
+    air = list()
+    macs = list()
+    for address in range(nodes):
+        offset = rng.uniform(0, 10)
+        mac = tdma.TDMA(address, air.append, nodes, clock=lambda offset=offset: now[0] + offset)
+        for frame in range(frames):
+            mac.send(bytes(28))
+        macs.append(mac)
+    ready = [rng.uniform(0, const.TDMA_FRAME_TIME) for mac in macs]
+    delivered = collisions = 0
+    synced = None
+    while any(mac.queue for mac in macs) and now[0] < 60:
+        for address, mac in enumerate(macs):
+            if now[0] < ready[address]:
+                continue
+            if use_tdma:
+                sent = mac.step()
+            else:
+                sent = bool(mac.queue)
+                if sent:
+                    mac.transmit(const.TDMA_DATA + bytes([address]) + mac.queue.popleft())
+            if sent:
+                ready[address] = now[0] + const.TDMA_FRAME_TIME * rng.uniform(0.8, 1.2)
+        if synced is None and any(frame[:1] == const.TDMA_BEACON for frame in air):
+            synced = now[0]
+        if len(air) == 1:
+            for mac in macs:
+                if mac.address != air[0][1] and mac.receive(air[0]) is not None:
+                    delivered = delivered + 1
+        elif len(air) > 1:
+            collisions = collisions + 1
+        del air[:]
+        now[0] = now[0] + FRAME_AIR_TIME
+    return now[0], synced or 0.0, delivered / (nodes * (nodes - 1) * frames), collisions
+
+
+def bench_tdma():
+    """ N simulated nodes on one host broadcasting 200 frames each:
+    blind contention against TDMA with one slot per node (the time
+    includes the sync timeout until the first beacon) """
+
+    print("{0:>5} {1:<12} {2:>9} {3:>9} {4:>10} {5:>11}".format(
+        "nodes", "access", "time (s)", "sync (s)", "delivered", "collisions"))
+    for nodes in (2, 4, 8):
+        for name, use_tdma in (("contention", False), ("tdma", True)):
+            seconds, synced, delivered, collisions = simulate_network(nodes, 200, use_tdma, random.Random(1))
+            print("{0:>5} {1:<12} {2:>9.2f} {3:>9.2f} {4:>9.1f}% {5:>11}".format(
+                nodes, name, seconds, synced, delivered * 100, collisions))
+
+
+def simulate_dissemination(topology, source, chunks, loss, rng, pipelined=True, most_missing=True):
+    """ Dissemination of a file of chunks from the source to all the nodes
+    of the topology (see src/dissemination.py), counting frame slots. Each
+    node transmits on its own channel, so all the hops of the path can send
+    in the same slot, and a frame is lost in a hop with probability loss
+    (then sent again). The flooded token and advertisements take one slot
+    per frame and node. The token goes to the node that misses the most
+    chunks, or to the nodes in turns (round robin).
+    Returns (slots until all the nodes have the file, turns) """
+
+    nodes = {address: dissemination.Node(address, chunks, topology) for address in topology}
+    nodes[source].load([bytes(const.NM_CHUNK_SIZE)] * chunks)
+    slots = 0
+    frames = [frame for node in nodes.values() for frame in node.advertisement()]
+    turn = 0
+    holder = None
+    while True:
+        for frame in frames:
+            for node in nodes.values():
+                node.handle(frame)
+        slots = slots + len(frames) * len(nodes)
+
+        # The holder passes the token
+        view = nodes[source]
+        if most_missing:
+            holder = view.next_holder()
+        else:
+            pending = [address for address in sorted(nodes) if view.missing[address]]
+            later = [address for address in pending if holder is None or address > holder]
+            holder = (later or pending or [None])[0]
+        if holder is None:
+            return slots, turn
+        path = view.route(holder)
+        if path is None:
+            return None, turn
+        turn = turn + 1
+        token = view.token(turn % 65536, path)
+        for node in nodes.values():
+            node.handle(token)
+        slots = slots + len(nodes)
+
+        # Stream, the hops far from the source first so that a frame moves one hop per slot
+        while not nodes[holder].has_stream():
+            slots = slots + 1
+            for position in range(len(path) - 2, -1, -1):
+                node = nodes[path[position]]
+                frame = node.next_frame(pipelined)
+                if frame is not None and rng.random() >= loss:
+                    node.frame_sent()
+                    nodes[path[position + 1]].handle(frame)
+        frames = [frame for address in path for frame in nodes[address].advertisement()]
+
+
+def bench_dissemination():
+    """ Frame slots (and seconds, with FRAME_OVERHEAD per slot) until all
+    the nodes have a 27 KB file, with 10% loss per hop """
+
+    config = conf_srm_sender
+    line = {address: {address - 1, address + 1} & set(range(5)) for address in range(5)}
+    grid = {address: set(other for other in range(6)
+                         if abs(other % 3 - address % 3) + abs(other // 3 - address // 3) == 1)
+            for address in range(6)}
+    print("{0:<10} {1:<26} {2:>8} {3:>9} {4:>6}".format("topology", "scheme", "slots", "time (s)", "turns"))
+    for name, topology in (("line 5", line), ("grid 2x3", grid)):
+        for scheme, pipelined, most_missing in (("store and forward", False, True),
+                                               ("pipelined, round robin", True, False),
+                                               ("pipelined, most missing", True, True)):
+            slots, turns = simulate_dissemination(topology, 0, 1000, 0.1, random.Random(1), pipelined, most_missing)
+            print("{0:<10} {1:<26} {2:>8} {3:>9.1f} {4:>6}".format(
+                name, scheme, slots, slots * config.FRAME_OVERHEAD, turns))
+
+
+def link_pdr(positions, a, b):
+    """ Delivery ratio of a frame between two nodes: 1 up to 30 m, 0 from
+    60 m, falling linearly in between (grey zone) """
+
+    distance = ((positions[a][0] - positions[b][0]) ** 2 + (positions[a][1] - positions[b][1]) ** 2) ** 0.5
+    return max(0.0, min(1.0, (60 - distance) / 30))
+
+
+def send_hop_by_hop(path, positions, rng):
+    """ Frame sent over the path with up to 50 attempts per hop (frame and
+    ACK must arrive). Returns (transmissions, delivered) """
+
+    transmissions = 0
+    for a, b in zip(path, path[1:]):
+        for attempt in range(50):
+            transmissions = transmissions + 1
+            if rng.random() < link_pdr(positions, a, b) and rng.random() < link_pdr(positions, b, a):
+                break
+        else:
+            return transmissions, False
+    return transmissions, True
+
+
+def bench_routing():
+    """ 8 nodes at random in 100 x 100 m learn their neighbours with 30
+    hellos, then every node sends 50 frames to every other one: routes
+    with the fewest hops against routes with the smallest ETX """
+
+    print("{0:>5} {1:<10} {2:>14} {3:>10}".format("seed", "routing", "transmissions", "delivered"))
+    for seed in range(3):
+        rng = random.Random(seed)
+        positions = [(rng.uniform(0, 100), rng.uniform(0, 100)) for address in range(8)]
+        now = [0.0]
+        tables = [neighbours.NeighbourTable(address, clock=lambda: now[0]) for address in range(8)]
+        for period in range(30):
+            now[0] = period * const.HELLO_PERIOD
+            for table in tables:
+                hello = table.hello()
+                for other in tables:
+                    if other is not table and rng.random() < link_pdr(positions, table.address, other.address):
+                        other.handle_hello(hello, rng.random() < link_pdr(positions, table.address, other.address))
+
+        hops = {table.address: set(table.links()) for table in tables}
+        for name in ("min hops", "ETX"):
+            transmissions = delivered = 0
+            for source in range(8):
+                for destination in range(8):
+                    if source == destination:
+                        continue
+                    if name == "ETX":
+                        path = [source]
+                        while path[-1] != destination and path[-1] is not None and len(path) <= 8:
+                            path.append(tables[path[-1]].next_hop(destination))
+                    else:
+                        parents = neighbours.shortest_paths(hops, destination)[1]
+                        path = [source] if source in parents else [None]
+                        while path[-1] is not None and path[-1] != destination:
+                            path.append(parents[path[-1]])
+                    if path[-1] != destination:
+                        continue
+                    for frame in range(50):
+                        sent, success = send_hop_by_hop(path, positions, rng)
+                        transmissions = transmissions + sent
+                        delivered = delivered + success
+            print("{0:>5} {1:<10} {2:>14} {3:>10}".format(seed, name, transmissions, delivered))
+
+
+BENCHMARKS = {
+    "read_file": bench_read_file,
+    "dictionary": bench_dictionary,
+    "hopping": bench_hopping,
+    "tdma": bench_tdma,
+    "dissemination": bench_dissemination,
+    "routing": bench_routing,
+}
+
+
+def main():
+    names = sys.argv[1:] or sorted(BENCHMARKS)
+    for name in names:
+        print("### " + name)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
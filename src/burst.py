@@ -0,0 +1,231 @@
+#!/usr/bin/python3
+#
+# BURST mode: the sender keeps several data frames in flight instead of
+# waiting for every ACK, limited by the receive window that the receiver
+# advertises in its ACKs (the free slots of its queue of frames)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import time
+import queue
+import threading
+import itertools
+import collections
+from src import util
+from src import phases
+from src.sender import Sender
+from src.receiver import Receiver
+from const import const
+
+
+def advertised_window(config, ack):
+    """ Window of the ACK of a data frame: b'ACK' + free slots of the queue
+    of the receiver. The ACKs without window (stop and wait) allow one frame """
+
+    return min(config.BURST_SIZE, ack[3]) if len(ack) > 3 else 1
+
+
+class BurstSender(Sender):
+    """ The header, the requests and the EOT are stop and wait, the data
+    frames are sent in bursts: the sender has up to the receive window of
+    unacknowledged frames (at least one, so a window of 0 is stop and
+    wait). The receiver processes the frames in order, so the ACK of a
+    frame means that the frames sent before it that are still unacknowledged
+    were lost: they are sent again at once. If no ACK arrives in ACK_TIMEOUT
+    all the frames in flight are sent again. Frequency hopping is point to
+    point per frame, it is not used. """
+
+    def start_hopping(self):
+        print("Frequency hopping is not used in the BURST mode")
+
+    def parse_ack(self, rx_buffer):
+        """ (sequence number, payload) of the ACK, or None if it is corrupted """
+
+        if not util.check_crc(rx_buffer[:self.config.CRC_SIZE], rx_buffer[self.config.CRC_SIZE:]):
+            print("        Received incorrect ACK")
+            return None
+        seq = int.from_bytes(
+            rx_buffer[self.config.CRC_SIZE:self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE],
+            byteorder='big')
+        return seq, bytes(rx_buffer[self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE:])
+
+    def send_chunks(self, payload_list, bitmap):
+        """ The first chunk is sent alone (stop and wait), its ACK opens the window """
+
+        indexes = [index for index in range(len(payload_list))
+                   if bitmap is None or not util.bitmap_has(bitmap, index)]
+        if not indexes:
+            return True
+        ack = yield payload_list[indexes[0]], indexes[0] + 2, False
+        while ack is not None and ack[:3] != b'ACK':
+            print("        Unknown error when transmitting packet number " + str(indexes[0] + 2))
+            ack = yield payload_list[indexes[0]], indexes[0] + 2, False
+        if ack is None:
+            return False
+        return self.send_window(payload_list, indexes[1:], advertised_window(self.config, ack))
+
+    def send_window(self, payload_list, indexes, window):
+        """ Sends the chunks keeping up to window frames in flight.
+        Returns True when all of them are acknowledged """
+
+        pending = collections.deque(indexes)
+        in_flight = collections.OrderedDict()  # Unacknowledged chunks, in the order they were sent
+        timeouts = 0
+        while pending or in_flight:
+            while pending and len(in_flight) < max(1, window):
+                index = pending.popleft()
+                util.send_packet(self.sender, self.build_frame(payload_list[index], index + 2))
+                in_flight[index] = True
+            if pending:
+                phases.count("burst window full")
+
+            if not self.wait_for_ack(self.receiver):
+                timeouts = timeouts + 1
+                if timeouts > 1000:
+                    print("Transmission ended after more than 1000 ACK timeouts")
+                    return False
+                print("    ACK timeout, sending again " + str(len(in_flight)) + " packets")
+                phases.count("burst ACK timeouts")
+                phases.count("burst retransmissions", len(in_flight))
+                pending.extendleft(reversed(list(in_flight)))
+                in_flight.clear()
+                continue
+            timeouts = 0
+
+            while self.receiver.available(self.config.RECEIVER_PIPE):
+                rx_buffer = []
+                self.receiver.read(rx_buffer, self.receiver.getDynamicPayloadSize())
+                ack = self.parse_ack(rx_buffer)
+                # The ERROR ACKs carry the last correct frame, the corrupted one is lost
+                if ack is None or ack[0] - 2 not in in_flight or ack[1][:3] != b'ACK':
+                    continue
+                index = ack[0] - 2
+                lost = list(itertools.takewhile(lambda sent: sent != index, in_flight))
+                for sent in lost + [index]:
+                    del in_flight[sent]
+                if lost:
+                    phases.count("burst retransmissions", len(lost))
+                    pending.extendleft(reversed(lost))
+                window = advertised_window(self.config, ack[1])
+                print("Packet number " + str(index + 2) + " transmitted successfully")
+        return True
+
+
+class BurstReceiver(Receiver):
+    """ Receives the bursts of a BurstSender. A thread moves the frames from
+    the RX FIFO of the radio (3 frames) to a queue as soon as they arrive,
+    so the FIFO does not overflow while the loop that processes the queue
+    is slow (writes, prints), and the ACK of every data frame advertises the
+    free slots of the queue (BURST_SIZE frames): the sender slows down as
+    the queue grows. The radios are shared with the processing loop through
+    radio_lock, which only takes it for the requests (they may retune).
+
+    Metrics: the times the RX FIFO was full when read (frames may have been
+    lost), the data frames missing in the sequence (lost in the air or in
+    an overrun) and the longest queue.
+
+    Without reader_thread the processing loop reads the FIFO itself when
+    the queue is empty, so a capture replay (src/capture.py) runs on one
+    thread. """
+
+    reader_thread = True
+
+    def start_reception(self):
+        super().start_reception()
+        self.frames = queue.Queue()
+        self.radio_lock = threading.Lock()
+        self.reading = True
+        self.next_seq = 2
+        self.fifo_full = 0
+        self.missing = 0
+        self.longest_queue = 0
+
+    def data_ack(self):
+        return b'ACK' + bytes([max(0, self.config.BURST_SIZE - self.frames.qsize())])
+
+    def read_fifo(self):
+        """ Moves the frames of the RX FIFO to the queue. Returns False if it was empty """
+
+        with self.radio_lock:
+            if not self.receiver.available(self.config.RECEIVER_PIPE):
+                return False
+            if self.receiver.rxFifoFull():
+                self.fifo_full = self.fifo_full + 1
+                phases.count("RX FIFO full")
+            while self.receiver.available(self.config.RECEIVER_PIPE):
+                rx_buffer = []
+                self.receiver.read(rx_buffer, self.receiver.getDynamicPayloadSize())
+                self.frames.put(rx_buffer)
+            self.longest_queue = max(self.longest_queue, self.frames.qsize())
+            return True
+
+    def read_frames(self):
+        """ Thread that moves the frames of the RX FIFO to the queue """
+
+        while self.reading:
+            if not self.read_fifo():
+                time.sleep(const.BURST_POLL_INTERVAL)
+
+    def next_frame(self, reader):
+        """ Next frame of the queue, or None if none arrives in DATA_TIMEOUT.
+        Without reader thread the FIFO is read here once the queue is empty """
+
+        if reader is not None:
+            try:
+                return self.frames.get(timeout=self.config.DATA_TIMEOUT)
+            except queue.Empty:
+                return None
+        start_time = time.time()
+        while self.frames.empty() and not self.read_fifo():
+            if time.time() - start_time >= self.config.DATA_TIMEOUT:
+                return None
+            time.sleep(const.BURST_POLL_INTERVAL)
+        return self.frames.get()
+
+    def handle_frame(self, rx_buffer):
+        seq = int.from_bytes(
+            rx_buffer[self.config.CRC_SIZE:self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE],
+            byteorder='big')
+        if seq > self.next_seq and self.session is not None and \
+                util.check_crc(rx_buffer[:self.config.CRC_SIZE], rx_buffer[self.config.CRC_SIZE:]):
+            self.missing = self.missing + seq - self.next_seq
+            phases.count("data frames missing in sequence", seq - self.next_seq)
+        if seq >= self.next_seq:
+            self.next_seq = seq + 1
+        if seq == const.QUERY_SEQ_NUM:
+            with self.radio_lock:
+                return super().handle_frame(rx_buffer)
+        return super().handle_frame(rx_buffer)
+
+    def receive(self):
+        """ Receives the file, processing the frames of the queue """
+
+        self.start_reception()
+        self.receiver.startListening()
+        reader = None
+        if self.reader_thread:
+            reader = threading.Thread(target=self.read_frames, daemon=True)
+            reader.start()
+
+        try:
+            while not self.rx_success:
+                rx_buffer = self.next_frame(reader)
+                if rx_buffer is not None:
+                    self.handle_frame(rx_buffer)
+                else:
+                    with self.radio_lock:
+                        self.check_rendezvous()
+        except IOError:
+            print("ERROR when saving the file")
+            return False
+        finally:
+            self.reading = False
+            if reader is not None:
+                reader.join()
+            if self.session is not None:
+                self.session.close()
+            print("Flow control: RX FIFO full " + str(self.fifo_full) + " times, " + str(self.missing) +
+                  " data frames missing in sequence, longest queue " + str(self.longest_queue) + " frames")
+
+        return self.finish_reception()
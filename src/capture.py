@@ -0,0 +1,313 @@
+#!/usr/bin/python3
+#
+# Capture of the radio traffic: the NRF24 driver records every frame it
+# writes or reads in a ring file, which can be analysed offline or replayed
+# into the sender / receiver with the timing of the capture
+# Usage: python3 -m src.capture analyse <capture> [conf module]
+#        python3 -m src.capture replay <capture> <conf module> tx|rx
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import sys
+import time
+import mmap
+import struct
+import threading
+import importlib
+import collections
+from src import util
+from const import const
+
+
+# Ring file: header (magic, number of records, records written) + records
+# (time in us, direction, length, frame padded to MAX_FRAME_SIZE)
+MAGIC = b'NRFCAP1\x00'
+HEADER = struct.Struct('>8sIQ')
+RECORD = struct.Struct('>QBB' + str(const.MAX_FRAME_SIZE) + 's')
+
+TX = 0
+RX = 1
+
+# Seconds that a replay waits for the frames of the capture that the device did not write
+END_WAIT = 1.0
+
+Record = collections.namedtuple('Record', ['time', 'direction', 'frame'])
+
+# Captures opened by open_capture, by path: the radios of all the executions share them
+CAPTURES = dict()
+
+
+class Capture(object):
+    """ Ring file of the last records frames. The file is mapped in memory,
+    so recording a frame is a copy and the frames recorded until a crash
+    are not lost. An existing capture of the same size is continued. """
+
+    def __init__(self, file_path, records):
+        self.records = records
+        self.lock = threading.Lock()
+        size = HEADER.size + records * RECORD.size
+        mode = 'r+b' if os.path.isfile(file_path) and os.path.getsize(file_path) == size else 'w+b'
+        self.file = open(file_path, mode)
+        if mode == 'w+b':
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        magic, capacity, self.written = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or capacity != records:
+            self.written = 0
+            HEADER.pack_into(self.map, 0, MAGIC, records, 0)
+
+    def record(self, direction, frame):
+        frame = bytes(frame[:const.MAX_FRAME_SIZE])
+        # Both radios record here, the reader thread of BurstReceiver reads while the ACKs are written
+        with self.lock:
+            RECORD.pack_into(self.map, HEADER.size + self.written % self.records * RECORD.size,
+                             int(time.time() * 1000000), direction, len(frame), frame)
+            self.written = self.written + 1
+            HEADER.pack_into(self.map, 0, MAGIC, self.records, self.written)
+
+    def sent(self, frame):
+        self.record(TX, frame)
+
+    def received(self, frame):
+        self.record(RX, frame)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def open_capture(config):
+    capture = CAPTURES.get(config.CAPTURE_PATH)
+    if capture is None:
+        capture = CAPTURES[config.CAPTURE_PATH] = Capture(config.CAPTURE_PATH, config.CAPTURE_RECORDS)
+    return capture
+
+
+def read_capture(file_path):
+    """ Records of the capture, oldest first """
+
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    magic, records, written = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(file_path + " is not a capture")
+    first = written - min(written, records)
+    capture = list()
+    for position in range(first, written):
+        time_us, direction, length, frame = RECORD.unpack_from(data, HEADER.size + position % records * RECORD.size)
+        capture.append(Record(time_us / 1000000, direction, frame[:length]))
+    return capture
+
+
+##################
+#    ANALYSIS    #
+##################
+
+def decode_frame(config, frame):
+    """ (sequence number, payload, CRC correct) of a frame built by
+    Sender.build_frame, or None if it is too short """
+
+    header_size = config.CRC_SIZE + config.SEQ_NUM_SIZE
+    if len(frame) < header_size:
+        return None
+    seq = int.from_bytes(frame[config.CRC_SIZE:header_size], byteorder='big')
+    return seq, frame[header_size:], util.check_crc(frame[:config.CRC_SIZE], frame[config.CRC_SIZE:])
+
+
+def percentiles(values):
+    """ min / median / 95% / max, in ms """
+
+    if not values:
+        return "-"
+    values = sorted(values)
+    return " / ".join("{0:.2f}".format(values[int(q * (len(values) - 1))] * 1000) for q in (0, 0.5, 0.95, 1))
+
+
+def analyse(config, capture, gaps=5):
+    """ Prints where the time of the capture went. The same counters work
+    for both ends: the sender sees its retransmissions and the ACKs that
+    did not arrive (a frame followed by another frame), the receiver sees
+    the duplicated frames (its ACK was lost) and how long it takes to
+    answer a frame (host side latency). """
+
+    if not capture:
+        print("Empty capture")
+        return
+    counts = collections.Counter()
+    turnaround = {TX: list(), RX: list()}  # Direction of the first frame -> delays until the first answer
+    previous = {TX: None, RX: None}
+    last = None
+    for record in capture:
+        kind = "TX" if record.direction == TX else "RX"
+        counts[kind] = counts[kind] + 1
+        decoded = decode_frame(config, record.frame)
+        if decoded is None:
+            counts[kind + " malformed"] = counts[kind + " malformed"] + 1
+        elif not decoded[2] and decoded[1] != b'ENDOFTRANSMISSION':
+            counts[kind + " bad CRC"] = counts[kind + " bad CRC"] + 1
+        elif decoded[1] == b'ERROR':
+            counts[kind + " ERROR ACK"] = counts[kind + " ERROR ACK"] + 1
+        if record.frame == previous[record.direction]:
+            counts[kind + " repeated"] = counts[kind + " repeated"] + 1
+        if last is not None:
+            if last.direction != record.direction:
+                turnaround[last.direction].append(record.time - last.time)
+            elif record.direction == TX:
+                counts["TX unanswered"] = counts["TX unanswered"] + 1
+        previous[record.direction] = record.frame
+        last = record
+
+    duration = capture[-1].time - capture[0].time
+    print("Records: " + str(len(capture)) + " in " + "{0:.3f}".format(duration) + " s, from " +
+          time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(capture[0].time)))
+    for kind in ("TX", "RX"):
+        print(kind + ": " + str(counts[kind]) + " frames, " + str(counts[kind + " repeated"]) + " repeated, " +
+              str(counts[kind + " bad CRC"]) + " bad CRC, " + str(counts[kind + " ERROR ACK"]) + " ERROR, " +
+              str(counts[kind + " malformed"]) + " malformed")
+    print("TX without an answer before the next TX (ACK timeouts): " + str(counts["TX unanswered"]))
+    print("TX -> RX, ms (min / median / 95% / max): " + percentiles(turnaround[TX]))
+    print("RX -> TX, ms (min / median / 95% / max): " + percentiles(turnaround[RX]))
+
+    print("Longest silences:")
+    silences = sorted(range(1, len(capture)), key=lambda pos: capture[pos].time - capture[pos - 1].time)
+    for pos in sorted(silences[-gaps:]):
+        before = decode_frame(config, capture[pos - 1].frame)
+        print("    {0:9.3f} s: {1:8.2f} ms after {2} seq {3}".format(
+            capture[pos - 1].time - capture[0].time, (capture[pos].time - capture[pos - 1].time) * 1000,
+            "TX" if capture[pos - 1].direction == TX else "RX", before[0] if before is not None else "?"))
+
+
+################
+#    REPLAY    #
+################
+
+class EndOfCapture(Exception):
+    pass
+
+
+class ReplayRadio(object):
+    """ Both radios and the clock of the device during a replay. The time
+    is virtual and follows the capture: the frames the device writes are
+    compared with the ones written in the capture and the clock jumps to
+    their time (so the host side delays of the capture are reproduced),
+    and the received frames become available at their time of the capture.
+    A sleep of the device ends at the next frame of the capture: the next
+    received frame wherever it is (it was read before the next write, so
+    the device was still waiting for it), or the next written frame if it
+    comes first (the device gave up waiting in the capture). The capture
+    ends when nothing is left to receive and the device has written its
+    frames, or has waited END_WAIT seconds after the last one. The rest of
+    the radio is not emulated. """
+
+    def __init__(self, capture):
+        self.now = capture[0].time if capture else 0
+        self.rx = collections.deque(record for record in capture if record.direction == RX)
+        self.tx = collections.deque(record for record in capture if record.direction == TX)
+        self.written = 0
+        self.diverged = None  # (frame number, expected frame, written frame)
+        self.channel = None
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        wake_up = self.now + max(0, seconds)
+        if self.rx and self.rx[0].time > self.now and not (self.tx and self.tx[0].time < self.rx[0].time):
+            wake_up = self.rx[0].time
+        elif self.tx and self.now < self.tx[0].time < wake_up:
+            wake_up = self.tx[0].time
+        self.now = wake_up
+
+    def write(self, buf):
+        frame = bytes(buf)
+        self.written = self.written + 1
+        if self.tx:
+            expected = self.tx.popleft()
+            self.now = max(self.now, expected.time)
+            if expected.frame != frame and self.diverged is None:
+                self.diverged = (self.written, expected.frame, frame)
+        return True
+
+    def available(self, pipe_num=None):
+        if not self.rx:
+            # A device that drains its FIFO checks it once more after the last frame
+            if not self.tx or self.now > self.tx[-1].time + END_WAIT:
+                raise EndOfCapture()
+            return False
+        return self.rx[0].time <= self.now
+
+    def getDynamicPayloadSize(self):
+        return len(self.rx[0].frame) if self.rx else 0
+
+    def read(self, buf, buf_len=-1):
+        del buf[:]
+        buf.extend(self.rx.popleft().frame)
+        return not self.rx
+
+    def flush_rx(self):
+        while self.rx and self.rx[0].time <= self.now:
+            self.rx.popleft()
+
+    def __getattr__(self, name):
+        # Pipes, channels, listening...
+        return lambda *args, **kwargs: None
+
+
+def replay(config, capture, tx):
+    """ Runs the sender (tx) or the receiver of the configuration against
+    the capture, in virtual time. The same capture gives the same run every
+    time, so a timing problem of a capture can be debugged step by step.
+    The device works with its files as in a real execution. Returns the
+    ReplayRadio with the comparison. """
+
+    from src.sender import Sender
+    from src.receiver import Receiver
+    from src.multicast import MulticastSender, MulticastReceiver
+    from src.burst import BurstSender, BurstReceiver
+
+    radio = ReplayRadio(capture)
+    if tx:
+        device_class = MulticastSender if config.MULTICAST else BurstSender if config.BURST else Sender
+    else:
+        device_class = MulticastReceiver if config.MULTICAST else BurstReceiver if config.BURST else Receiver
+    device = device_class(config, radio, radio)
+    if isinstance(device, BurstReceiver):
+        # The virtual clock is not shared with a reader thread
+        device.reader_thread = False
+
+    real_time, real_sleep = time.time, time.sleep
+    time.time, time.sleep = radio.time, radio.sleep
+    try:
+        result = device.transmit() if tx else device.receive()
+        print("Replay ended, result: " + str(result))
+    except EndOfCapture:
+        print("Replay reached the end of the capture")
+    finally:
+        time.time, time.sleep = real_time, real_sleep
+
+    print("Frames written: " + str(radio.written) + ", " + str(len(radio.tx)) + " frames of the capture not written, " +
+          str(len(radio.rx)) + " received frames not read")
+    if radio.diverged is not None:
+        number, expected, written = radio.diverged
+        print("First difference in frame " + str(number) + ": capture " + expected.hex() + ", replay " + written.hex())
+    return radio
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("analyse", "replay") or \
+            sys.argv[1] == "replay" and (len(sys.argv) < 5 or sys.argv[4] not in ("tx", "rx")):
+        print("Usage: python3 -m src.capture analyse <capture> [conf module]")
+        print("       python3 -m src.capture replay <capture> <conf module> tx|rx")
+        return
+    config = importlib.import_module("conf." + (sys.argv[3] if len(sys.argv) > 3 else "conf_srm_sender"))
+    capture = read_capture(sys.argv[2])
+    if sys.argv[1] == "analyse":
+        analyse(config, capture)
+    else:
+        replay(config, capture, sys.argv[4] == "tx")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+#
+# Channel survey with the RPD (received power detector) of the nRF24L01+
+# and choice of the two cleanest channels shared by both ends
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import time
+from libraries.lib_nrf24 import NRF24
+from const import const
+
+
+def tune(radio, channel, listening=True):
+    """ Moves the radio to the channel. A listening radio goes to standby
+    while the channel changes and listens again after it. """
+
+    if listening:
+        radio.ce(NRF24.LOW)
+    radio.setChannel(channel)
+    if listening:
+        radio.ce(NRF24.HIGH)
+
+
+def set_channels(sender, receiver, tx_channel, rx_channel):
+    """ Channel of the transmitting radio and of the listening one """
+
+    tune(sender, tx_channel, listening=False)
+    tune(receiver, rx_channel)
+
+
+def survey(radio, sweeps, dwell=const.SURVEY_DWELL):
+    """ Sweeps all the channels with the listening radio and returns the
+    occupancy of each one: fraction of the sweeps with RPD set (more
+    than -64 dBm received). The radio is left on its previous channel. """
+
+    previous_channel = radio.channel
+    counts = [0] * const.SURVEY_CHANNELS
+    radio.startListening()
+    for sweep in range(sweeps):
+        for channel in range(const.SURVEY_CHANNELS):
+            tune(radio, channel)
+            # 130 us to settle in RX, the RPD needs 40 us more of signal
+            time.sleep(dwell)
+            if radio.testRPD():
+                counts[channel] = counts[channel] + 1
+    tune(radio, previous_channel)
+    return [count / sweeps for count in counts]
+
+
+def channel_score(occupancy, channel):
+    """ Occupancy of the channel and half of its neighbours, a 2 Mbps
+    transmission is 2 MHz wide """
+
+    score = occupancy[channel]
+    for neighbour in (channel - 1, channel + 1):
+        if 0 <= neighbour < len(occupancy):
+            score = score + occupancy[neighbour] / 2
+    return score
+
+
+def rank_channels(occupancy, allowed):
+    """ Allowed channels, cleanest first """
+
+    return sorted(allowed, key=lambda channel: (channel_score(occupancy, channel), channel))
+
+
+def candidates(occupancy, allowed):
+    """ Payload of the rendezvous request: the CHANNEL_CANDIDATES cleanest
+    channels for this end, each one followed by its score (0-255) """
+
+    data = bytearray()
+    for channel in rank_channels(occupancy, allowed)[:const.CHANNEL_CANDIDATES]:
+        data.append(channel)
+        data.append(min(255, int(channel_score(occupancy, channel) * 128)))
+    return bytes(data)
+
+
+def choose_channels(occupancy, data, allowed, default):
+    """ Joins the candidates of the other end (see candidates) with the
+    local occupancy (None if not surveyed) and returns the two cleanest
+    channels of allowed at least CHANNEL_SEPARATION apart: (data channel,
+    ack channel). Returns default if there are not two such channels. """
+
+    scores = dict()
+    for pos in range(0, len(data) - 1, 2):
+        channel = data[pos]
+        if channel < const.SURVEY_CHANNELS and channel in allowed:
+            local = channel_score(occupancy, channel) if occupancy else 0
+            scores[channel] = data[pos + 1] / 128 + local
+    ranking = sorted(scores, key=lambda channel: (scores[channel], channel))
+    for data_channel in ranking:
+        for ack_channel in ranking:
+            if abs(ack_channel - data_channel) >= const.CHANNEL_SEPARATION:
+                return data_channel, ack_channel
+    return default
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+#
+# Content defined chunking and chunk store, used to avoid sending again
+# the parts of a file that the receiver already got in a previous execution
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import hashlib
+from const import const
+
+
+# Chunk sizes of the content defined chunking
+MIN_CHUNK_SIZE = 1024
+AVG_CHUNK_MASK = ((1 << 12) - 1) << 52  # 4 KB chunks on average, high bits depend on the last 64 bytes
+MAX_CHUNK_SIZE = 16384
+
+# Random table of the gear rolling hash (fixed, both ends must use the same one)
+GEAR = [int.from_bytes(hashlib.md5(bytes([byte])).digest()[:8], byteorder='big') for byte in range(256)]
+GEAR_MASK = (1 << 64) - 1
+
+
+def chunk_hash(data):
+    return hashlib.sha1(data).digest()[:const.CHUNK_HASH_SIZE]
+
+
+def chunk_boundaries(data):
+    """ Splits the data with a gear rolling hash. A chunk ends where the
+    masked bits of the hash are zero, so the boundaries depend only on the
+    content just before them and an edit only changes the chunks it touches.
+    Returns the list of (start, end) of each chunk. """
+
+    # The loop runs once per byte in python: everything it uses is local, and the hash is only cut to 64 bits
+    # every 64 bytes (the bits above do not change the masked ones)
+    gear = GEAR
+    mask = AVG_CHUNK_MASK
+    boundaries = list()
+    start = 0
+    size = len(data)
+    while start < size:
+        end = min(start + MAX_CHUNK_SIZE, size)
+        pos = start + MIN_CHUNK_SIZE
+        rolling = 0
+        while pos < end:
+            block_end = min(pos + 64, end)
+            for byte in data[pos:block_end]:
+                rolling = (rolling << 1) + gear[byte]
+                pos = pos + 1
+                if not rolling & mask:
+                    end = pos
+                    break
+            rolling = rolling & GEAR_MASK
+        boundaries.append((start, end))
+        start = end
+    return boundaries
+
+
+def chunk_file(file_path):
+    """ Returns the content of the file and the list of (start, end, hash) of its chunks """
+
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    return data, [(start, end, chunk_hash(data[start:end])) for start, end in chunk_boundaries(data)]
+
+
+def build_container(data, chunks, known, out_file_path):
+    """ Writes the dedup container sent instead of the raw file:
+    number of chunks + the hash of each chunk (the recipe), then
+    number of literals + (hash, length, data) of every chunk that is
+    not in known, the set of hashes the receiver already has. """
+
+    literals = list()
+    sent = set()
+    for start, end, digest in chunks:
+        if digest not in known and digest not in sent:
+            literals.append((digest, data[start:end]))
+            sent.add(digest)
+
+    with open(out_file_path, 'wb') as f:
+        f.write(len(chunks).to_bytes(const.CHUNK_COUNT_SIZE, byteorder='big'))
+        for start, end, digest in chunks:
+            f.write(digest)
+        f.write(len(literals).to_bytes(const.CHUNK_COUNT_SIZE, byteorder='big'))
+        for digest, literal in literals:
+            f.write(digest + len(literal).to_bytes(const.CHUNK_COUNT_SIZE, byteorder='big') + literal)
+
+    print("Dedup: " + str(len(literals)) + "/" + str(len(chunks)) + " chunks sent")
+    return len(literals)
+
+
+class ChunkStore(object):
+    """ Persistent content addressed store: every chunk is a file
+    named after its hash. The directory is created with the first chunk.
+    The modification time of a chunk is the last time it was used: trim
+    removes the least recently used chunks above max_size bytes. """
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+
+    def chunk_path(self, digest):
+        return os.path.join(self.path, bytes(digest).hex())
+
+    def has(self, digest):
+        try:
+            os.utime(self.chunk_path(digest))
+        except OSError:
+            return False
+        return True
+
+    def get(self, digest):
+        with open(self.chunk_path(digest), 'rb') as f:
+            data = f.read()
+        os.utime(self.chunk_path(digest))
+        return data
+
+    def put(self, digest, data):
+        if chunk_hash(data) != bytes(digest):
+            raise ValueError("chunk does not match its hash")
+        if not self.has(digest):
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = self.chunk_path(digest) + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, self.chunk_path(digest))
+
+    def trim(self):
+        """ Removes the least recently used chunks until the store fits
+        in max_size bytes. Returns the number of chunks removed. """
+
+        if self.max_size is None or not os.path.isdir(self.path):
+            return 0
+        chunks = list()
+        total = 0
+        for entry in os.scandir(self.path):
+            if entry.is_file():
+                stat = entry.stat()
+                chunks.append((stat.st_mtime, entry.path, stat.st_size))
+                total = total + stat.st_size
+        removed = 0
+        for mtime, chunk_path, size in sorted(chunks):
+            if total <= self.max_size:
+                break
+            os.remove(chunk_path)
+            total = total - size
+            removed = removed + 1
+        return removed
+
+
+def rebuild_file(store, container_path, out_file_path):
+    """ Stores the literals of the container and rebuilds the original
+    file from the recipe, taking every chunk from the store. """
+
+    with open(container_path, 'rb') as f:
+        container = f.read()
+
+    pos = 0
+    count = int.from_bytes(container[pos:pos + const.CHUNK_COUNT_SIZE], byteorder='big')
+    pos = pos + const.CHUNK_COUNT_SIZE
+    recipe = [container[pos + i * const.CHUNK_HASH_SIZE:pos + (i + 1) * const.CHUNK_HASH_SIZE]
+              for i in range(count)]
+    pos = pos + count * const.CHUNK_HASH_SIZE
+
+    literals = int.from_bytes(container[pos:pos + const.CHUNK_COUNT_SIZE], byteorder='big')
+    pos = pos + const.CHUNK_COUNT_SIZE
+    for i in range(literals):
+        digest = container[pos:pos + const.CHUNK_HASH_SIZE]
+        pos = pos + const.CHUNK_HASH_SIZE
+        length = int.from_bytes(container[pos:pos + const.CHUNK_COUNT_SIZE], byteorder='big')
+        pos = pos + const.CHUNK_COUNT_SIZE
+        store.put(digest, container[pos:pos + length])
+        pos = pos + length
+
+    with open(out_file_path, 'wb') as f:
+        for digest in recipe:
+            f.write(store.get(digest))
+    # Only once the file is rebuilt, its chunks may be the oldest ones
+    store.trim()
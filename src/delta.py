@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+#
+# Delta transfer (rsync algorithm) against the file received in the previous execution
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import hashlib
+from itertools import accumulate
+from const import const
+
+
+def weak_checksum(block):
+    """ rsync rolling checksum of a block, returned as (a, b) """
+
+    a = sum(block) & 0xffff
+    b = sum(accumulate(block)) & 0xffff
+    return a, b
+
+
+def strong_checksum(block):
+    return hashlib.md5(block).digest()[:const.STRONG_CHECKSUM_SIZE]
+
+
+def signature(block):
+    """ Signature of one block of the basis: weak + strong checksum """
+
+    a, b = weak_checksum(block)
+    weak = a | (b << 16)
+    return weak.to_bytes(const.WEAK_CHECKSUM_SIZE, byteorder='big') + strong_checksum(block)
+
+
+def file_signatures(data, block_size):
+    """ Signatures of all the complete blocks of the basis """
+
+    return [signature(data[pos:pos + block_size]) for pos in range(0, len(data) - block_size + 1, block_size)]
+
+
+def signature_table(signatures):
+    """ Index of the signatures: weak checksum -> {strong checksum: block} """
+
+    table = dict()
+    for block, sig in enumerate(signatures):
+        weak = int.from_bytes(sig[:const.WEAK_CHECKSUM_SIZE], byteorder='big')
+        table.setdefault(weak, dict()).setdefault(bytes(sig[const.WEAK_CHECKSUM_SIZE:]), block)
+    return table
+
+
+def compute_delta(data, signatures, block_size):
+    """ Finds the blocks of the basis inside data, at any offset, rolling
+    the weak checksum byte by byte. Returns the list of operations:
+    ('C', first block, number of blocks) copies from the basis and
+    ('L', start, end) are literal bytes of data. """
+
+    table = signature_table(signatures)
+    operations = list()
+    size = len(data)
+    literal_start = 0
+    pos = 0
+    if size >= block_size:
+        a, b = weak_checksum(data[0:block_size])
+    while pos + block_size <= size:
+        candidates = table.get(a | (b << 16))
+        if candidates:
+            match = candidates.get(strong_checksum(data[pos:pos + block_size]))
+            if match is not None:
+                if literal_start < pos:
+                    operations.append(('L', literal_start, pos))
+                last = operations[-1] if operations else None
+                if last is not None and last[0] == 'C' and last[1] + last[2] == match:
+                    operations[-1] = ('C', last[1], last[2] + 1)
+                else:
+                    operations.append(('C', match, 1))
+                pos = pos + block_size
+                literal_start = pos
+                if pos + block_size <= size:
+                    a, b = weak_checksum(data[pos:pos + block_size])
+                continue
+        if pos + block_size < size:
+            byte_out = data[pos]
+            a = (a - byte_out + data[pos + block_size]) & 0xffff
+            b = (b - block_size * byte_out + a) & 0xffff
+        pos = pos + 1
+    if literal_start < size:
+        operations.append(('L', literal_start, size))
+    return operations
+
+
+def build_container(data, operations, out_file_path):
+    """ Writes the delta sent instead of the raw file: md5 of the new file,
+    then the operations. A copy is b'C' + first block + number of blocks,
+    a literal is b'L' + length + bytes. """
+
+    literal_bytes = 0
+    with open(out_file_path, 'wb') as f:
+        f.write(hashlib.md5(data).digest())
+        for operation in operations:
+            if operation[0] == 'C':
+                f.write(b'C' + operation[1].to_bytes(const.CHUNK_COUNT_SIZE, byteorder='big') +
+                        operation[2].to_bytes(const.CHUNK_COUNT_SIZE, byteorder='big'))
+            else:
+                literal = data[operation[1]:operation[2]]
+                f.write(b'L' + len(literal).to_bytes(const.CHUNK_COUNT_SIZE, byteorder='big') + literal)
+                literal_bytes = literal_bytes + len(literal)
+
+    print("Delta: " + str(literal_bytes) + "/" + str(len(data)) + " bytes sent as literals")
+    return literal_bytes
+
+
+def apply_delta(basis_path, container_path, out_file_path, block_size):
+    """ Rebuilds the new file from the basis and the delta.
+    Raises ValueError if the result does not match the md5 of the delta.
+    The file is written next to out_file_path and only replaces it once
+    its md5 matches. """
+
+    with open(basis_path, 'rb') as f:
+        basis = f.read()
+    with open(container_path, 'rb') as f:
+        container = f.read()
+
+    digest = container[:16]
+    file_hash = hashlib.md5()
+    pos = 16
+    tmp_path = out_file_path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            while pos < len(container):
+                operation = container[pos:pos + 1]
+                first = int.from_bytes(container[pos + 1:pos + 1 + const.CHUNK_COUNT_SIZE], byteorder='big')
+                pos = pos + 1 + const.CHUNK_COUNT_SIZE
+                if operation == b'C':
+                    count = int.from_bytes(container[pos:pos + const.CHUNK_COUNT_SIZE], byteorder='big')
+                    pos = pos + const.CHUNK_COUNT_SIZE
+                    block = basis[first * block_size:(first + count) * block_size]
+                elif operation == b'L':
+                    block = container[pos:pos + first]
+                    pos = pos + first
+                else:
+                    raise ValueError("unknown delta operation")
+                f.write(block)
+                file_hash.update(block)
+
+        if file_hash.digest() != digest:
+            raise ValueError("delta does not match the basis")
+        os.replace(tmp_path, out_file_path)
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+#
+# Trains the preset dictionary used by the "zlib-dict" codec
+# Usage: python3 -m src.dictionary <corpus directory> <dictionary file>
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import sys
+from collections import Counter
+
+
+# zlib only uses the last 32 KB of a preset dictionary
+DICTIONARY_SIZE = 32768
+SEGMENT_SIZE = 16
+
+
+def corpus_files(corpus_path):
+    """ Returns all the files inside the corpus directory """
+
+    file_paths = list()
+    for root, dirs, files in os.walk(corpus_path):
+        for file in sorted(files):
+            if not file.startswith("."):
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+
+def train_dictionary(file_paths, dictionary_size=DICTIONARY_SIZE, segment_size=SEGMENT_SIZE):
+    """ Builds a preset dictionary from the segments that appear the most
+    in the corpus. Only the segments found in two files or more are used,
+    a segment of a single file does not help to compress other files.
+    The most useful segments are placed at the end of the dictionary,
+    where zlib reaches them with the shortest distances. """
+
+    documents = Counter()
+    weights = Counter()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        segments = Counter(data[pos:pos + segment_size]
+                           for pos in range(0, len(data) - segment_size + 1, segment_size // 2))
+        for segment, count in segments.items():
+            documents[segment] += 1
+            # Diminishing returns for segments that repeat in one file
+            weights[segment] += 1 + count.bit_length()
+
+    selected = list()
+    total = 0
+    for segment, weight in weights.most_common():
+        if documents[segment] < 2:
+            continue
+        if total + len(segment) > dictionary_size:
+            break
+        selected.append(segment)
+        total = total + len(segment)
+
+    return b''.join(reversed(selected))
+
+
+def main():
+    corpus_path = sys.argv[1]
+    dictionary_path = sys.argv[2]
+
+    dictionary = train_dictionary(corpus_files(corpus_path))
+    with open(dictionary_path, 'wb') as f:
+        f.write(dictionary)
+    print("Dictionary of " + str(len(dictionary)) + " bytes saved in: " + dictionary_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+#
+# File dissemination for the Network Mode: the token goes to the node that
+# misses the most chunks, and the chunks it misses are streamed to it from
+# the best source through the nodes in between, each one forwarding chunk k
+# while it receives chunk k + 1 (pipelined store and forward)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import collections
+from src import multicast
+from src import neighbours
+from const import const
+
+
+class ChunkMap(object):
+    """ Chunks of the file that a node has (bit i = chunk i), with the
+    interface of util.ReceiveSession that multicast.nack_reply uses """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.bitmap = bytearray((chunks + 7) // 8)
+        self.received = 0
+
+    def has(self, index):
+        return self.bitmap[index // 8] & (1 << (index % 8)) != 0
+
+    def add(self, index):
+        if not self.has(index):
+            self.bitmap[index // 8] = self.bitmap[index // 8] | (1 << (index % 8))
+            self.received = self.received + 1
+
+    def is_complete(self):
+        return self.received == self.chunks
+
+
+def advertisement(address, chunk_map):
+    """ Frames that announce the chunks missing at the node, in the NACK
+    encoding of src/multicast.py (a list or a bitmap, whichever is shorter):
+    NM_ADVERT + address + first chunk of the frame + NACK """
+
+    frames = list()
+    start = 0
+    while start is not None:
+        nack = multicast.nack_reply(chunk_map, start, const.NM_FRAME_SIZE - 1)
+        frames.append(const.NM_ADVERT + bytes([address]) + start.to_bytes(const.PAGE_NUM_SIZE, byteorder='big') + nack)
+        start = multicast.parse_nack(nack, chunk_map.chunks)[1]
+    return frames
+
+
+class Node(object):
+    """ Dissemination state of one node. It does not use the radio: the
+    received frames are given to handle, and next_frame / frame_sent give
+    the frame to send to the next node of the path (see the "dissemination"
+    benchmark). The token and the advertisements are flooded to every node.
+
+    Token: NM_TOKEN + turn + path from the source to the holder.
+    Chunk: NM_CHUNK + index + data. """
+
+    def __init__(self, address, chunks, topology):
+        self.address = address
+        self.topology = topology  # address -> addresses in range, or {address: ETX of the link}
+        self.map = ChunkMap(chunks)
+        self.data = dict()
+        self.missing = {address: set(range(chunks)) for address in topology}
+        self.path = None
+        self.stream = list()
+        self.streamed = set()  # Chunks of the stream received in this turn
+        self.queue = collections.deque()
+
+    def load(self, payload_list):
+        """ The node has the file """
+
+        for index, payload in enumerate(payload_list):
+            self.data[index] = bytes(payload)
+            self.map.add(index)
+        self.missing[self.address] = set()
+
+    def next_holder(self):
+        """ Node that misses the most chunks, None when all of them have the
+        file. On ties, the one with the longest route: the chunks reach
+        all the nodes of the path. """
+
+        holders = [address for address in sorted(self.missing) if self.missing[address]]
+        if not holders:
+            return None
+        most = max(len(self.missing[address]) for address in holders)
+        return max((address for address in holders if len(self.missing[address]) == most),
+                   key=lambda address: (len(self.route(address) or ()), -address))
+
+    def route(self, holder):
+        """ Path from the node that has the most chunks missing at the holder
+        (the closest one on ties) to the holder, or None if no reachable
+        node has them. The paths follow the smallest ETX (or number of hops)
+        of the links of the topology to the holder. """
+
+        costs, parents = neighbours.shortest_paths(self.topology, holder)
+        wanted = self.missing[holder]
+        source = max(sorted(costs), key=lambda address: (len(wanted - self.missing[address]), -costs[address]))
+        if source == holder or not wanted - self.missing[source]:
+            return None
+        path = [source]
+        while path[-1] != holder:
+            path.append(parents[path[-1]])
+        return path
+
+    def token(self, turn, path):
+        return const.NM_TOKEN + turn.to_bytes(const.PAGE_NUM_SIZE, byteorder='big') + bytes(path)
+
+    def handle(self, frame):
+        frame = bytes(frame)
+        kind = frame[:1]
+        if kind == const.NM_ADVERT:
+            self.handle_advert(frame)
+        elif kind == const.NM_TOKEN:
+            self.handle_token(frame)
+        elif kind == const.NM_CHUNK:
+            self.handle_chunk(frame)
+
+    def handle_advert(self, frame):
+        address = frame[1]
+        start = int.from_bytes(frame[2:2 + const.PAGE_NUM_SIZE], byteorder='big')
+        lost, end = multicast.parse_nack(frame[2 + const.PAGE_NUM_SIZE:], self.map.chunks)
+        missing = self.missing[address]
+        missing.difference_update(range(start, self.map.chunks if end is None else end))
+        missing.update(lost)
+
+    def handle_token(self, frame):
+        """ New turn: the source of the path queues the chunks of the stream
+        (up to NM_TOKEN_BURST chunks missing at the holder) """
+
+        self.path = list(frame[1 + const.PAGE_NUM_SIZE:])
+        holder, source = self.path[-1], self.path[0]
+        self.stream = sorted(self.missing[holder] - self.missing[source])[:const.NM_TOKEN_BURST]
+        self.streamed = set()
+        self.queue.clear()
+        if self.address == source:
+            for index in self.stream:
+                self.queue.append(const.NM_CHUNK + index.to_bytes(const.PAGE_NUM_SIZE, byteorder='big') +
+                                  self.data[index])
+
+    def handle_chunk(self, frame):
+        """ Stores the chunk and, in the middle of the path, queues it for
+        the next node at once (it is forwarded while the next one arrives) """
+
+        index = int.from_bytes(frame[1:1 + const.PAGE_NUM_SIZE], byteorder='big')
+        self.streamed.add(index)
+        if not self.map.has(index):
+            self.data[index] = frame[1 + const.PAGE_NUM_SIZE:]
+            self.map.add(index)
+            self.missing[self.address].discard(index)
+        if self.path is not None and self.address in self.path[1:-1]:
+            self.queue.append(frame)
+
+    def downstream(self):
+        """ Next node of the path, None if this node does not forward """
+
+        if self.path is None or self.address not in self.path[:-1]:
+            return None
+        return self.path[self.path.index(self.address) + 1]
+
+    def next_frame(self, pipelined=True):
+        """ Frame to send to the downstream node, or None. Without
+        pipelining a relay waits until it receives the whole stream. """
+
+        if not self.queue:
+            return None
+        if not pipelined and self.address != self.path[0] and len(self.streamed) < len(self.stream):
+            return None
+        return self.queue[0]
+
+    def frame_sent(self):
+        """ The downstream node acknowledged the frame """
+
+        self.queue.popleft()
+
+    def has_stream(self):
+        """ The holder has all the chunks of the stream, the turn ends """
+
+        return all(self.map.has(index) for index in self.stream)
+
+    def advertisement(self):
+        return advertisement(self.address, self.map)
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+#
+# Frequency hopping: both ends derive the same pseudo random hop sequence
+# from a shared seed and change channel every time slot
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import time
+from const import const
+
+
+def hop_sequence(seed, allowed):
+    """ Pseudo random permutation of the allowed channels (xorshift32 and
+    Fisher-Yates), the same on both ends whatever their python version """
+
+    sequence = list(allowed)
+    state = seed or 1
+    for i in range(len(sequence) - 1, 0, -1):
+        state = state ^ ((state << 13) & 0xffffffff)
+        state = state ^ (state >> 17)
+        state = state ^ ((state << 5) & 0xffffffff)
+        j = state % (i + 1)
+        sequence[i], sequence[j] = sequence[j], sequence[i]
+    return sequence
+
+
+def channel_bitmap(channels):
+    bitmap = bytearray(const.CHANNEL_BITMAP_SIZE)
+    for channel in channels:
+        bitmap[channel // 8] = bitmap[channel // 8] | (1 << (channel % 8))
+    return bytes(bitmap)
+
+
+def bitmap_channels(bitmap):
+    return set(channel for channel in range(len(bitmap) * 8) if bitmap[channel // 8] & (1 << (channel % 8)))
+
+
+class Hopper(object):
+    """ Hop schedule of one end. Time is divided in slots of dwell seconds,
+    and every HOP_SYNC_PERIOD slots there is a sync slot on the base
+    channels (the ones used before hopping). The sender sends the HOP
+    request there, which anchors the schedules of both ends: when it is
+    received (and when its reply is received) the slot in its index starts.
+    Without anchor (start_time is None) the end waits on the base channels. """
+
+    def __init__(self, seed, allowed, base, dwell, clock=None):
+        self.seed = seed
+        self.sequence = hop_sequence(seed, allowed)
+        self.base = base  # (data channel, ack channel)
+        self.dwell = dwell
+        self.clock = clock or (lambda: time.time())  # Looked up on every call, so it follows a patched time.time
+        self.start_time = None
+        self.blacklist = set()  # Agreed by both ends
+        self.pending = set()  # Blacklist sent in the next HOP request
+        self.stats = dict()  # channel -> [attempts, failures]
+
+    @staticmethod
+    def from_sync_data(data, allowed, base, dwell):
+        hopper = Hopper(int.from_bytes(data[:const.SEED_SIZE], byteorder='big'), allowed, base, dwell)
+        hopper.apply_sync_data(data)
+        return hopper
+
+    def sync_data(self):
+        """ Data of the HOP request: seed + blacklist bitmap """
+
+        return self.seed.to_bytes(const.SEED_SIZE, byteorder='big') + channel_bitmap(self.pending)
+
+    def apply_sync_data(self, data):
+        self.blacklist = bitmap_channels(data[const.SEED_SIZE:])
+        self.pending = set(self.blacklist)
+
+    def anchor(self, slot):
+        """ The slot starts now """
+
+        self.start_time = self.clock() - slot * self.dwell
+
+    def lose_sync(self):
+        # The losses until now are not due to the channels
+        self.start_time = None
+        self.stats.clear()
+
+    def current_slot(self):
+        if self.start_time is None:
+            return None
+        return int((self.clock() - self.start_time) / self.dwell)
+
+    def is_sync_slot(self, slot):
+        return slot is None or slot % const.HOP_SYNC_PERIOD == 0
+
+    def next_sync_slot(self):
+        """ Number (as sent in the HOP request) of the next sync slot """
+
+        slot = self.current_slot() or 0
+        return (slot // const.HOP_SYNC_PERIOD + 1) * const.HOP_SYNC_PERIOD % (1 << (8 * const.PAGE_NUM_SIZE))
+
+    def hop_channel(self, position):
+        """ Channel of the sequence at the position, skipping the blacklist """
+
+        for step in range(len(self.sequence)):
+            channel = self.sequence[(position + step) % len(self.sequence)]
+            if channel not in self.blacklist:
+                return channel
+        return self.sequence[position % len(self.sequence)]
+
+    def channels(self, slot):
+        """ (data channel, ack channel) of the slot """
+
+        if self.is_sync_slot(slot):
+            return self.base
+        data_channel = self.hop_channel(slot)
+        ack_channel = self.hop_channel(slot + len(self.sequence) // 2)
+        if ack_channel == data_channel:
+            ack_channel = self.hop_channel(slot + len(self.sequence) // 2 + 1)
+        return data_channel, ack_channel
+
+    def record(self, channel, success):
+        """ Loss statistics of the data channels. A channel that loses more
+        than HOP_MAX_LOSS of the frames, and more than twice the average of
+        all the channels, is added to the pending blacklist (at most half of
+        the sequence is blacklisted). Returns True if so """
+
+        stats = self.stats.setdefault(channel, [0, 0])
+        stats[0] = stats[0] + 1
+        if not success:
+            stats[1] = stats[1] + 1
+        if channel in self.pending or channel in self.base or len(self.pending) >= len(self.sequence) // 2:
+            return False
+        if stats[0] < const.HOP_MIN_SAMPLES or stats[1] <= stats[0] * const.HOP_MAX_LOSS:
+            return False
+        attempts = sum(channel_stats[0] for channel_stats in self.stats.values())
+        failures = sum(channel_stats[1] for channel_stats in self.stats.values())
+        if stats[1] * attempts > 2 * failures * stats[0]:
+            self.pending.add(channel)
+            return True
+        return False
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+#
+# Point to multipoint transfer: the sender broadcasts the file once to
+# several receivers, polls each one for the chunks it lost (NACKs, answered
+# on its own pipe) and broadcasts the union of the losses in the next round
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import time
+from src import util
+from src import phases
+from src.sender import Sender
+from src.receiver import Receiver
+from const import const
+
+
+# Index of the header in the sets of lost chunks
+HEADER = -1
+
+
+def missing_chunks(session, start, count):
+    """ First count chunks from start that the session does not have """
+
+    missing = list()
+    index = start
+    while index < session.chunks and len(missing) < count:
+        if index % 8 == 0 and session.bitmap[index // 8] == 0xff:
+            index = index + 8
+            continue
+        if not session.has(index):
+            missing.append(index)
+        index = index + 1
+    return missing
+
+
+def nack_reply(session, start, data_size):
+    """ Losses of the session from the chunk start, in the encoding that
+    covers more chunks in one frame:
+    NACK_BITMAP + first lost chunk + bitmap of the lost chunks from it (dense losses)
+    NACK_LIST + lost chunks, the next poll starts after the last one
+    NACK_END + lost chunks, there are no more losses after them """
+
+    list_size = (data_size - const.PAGE_NUM_SIZE - 2) // const.PAGE_NUM_SIZE
+    bitmap_size = data_size - 2 * const.PAGE_NUM_SIZE - 2
+    missing = missing_chunks(session, start, list_size + 1)
+    if len(missing) <= list_size:
+        return const.NACK_END + b''.join(index.to_bytes(const.PAGE_NUM_SIZE, byteorder='big') for index in missing)
+    missing = missing[:list_size]
+    if missing[-1] - missing[0] < bitmap_size * 8:
+        bitmap = bytearray(bitmap_size)
+        for pos in range(min(bitmap_size * 8, session.chunks - missing[0])):
+            if not session.has(missing[0] + pos):
+                bitmap[pos // 8] = bitmap[pos // 8] | (1 << (pos % 8))
+        return const.NACK_BITMAP + missing[0].to_bytes(const.PAGE_NUM_SIZE, byteorder='big') + bytes(bitmap)
+    return const.NACK_LIST + b''.join(index.to_bytes(const.PAGE_NUM_SIZE, byteorder='big') for index in missing)
+
+
+def parse_nack(reply, chunks):
+    """ Returns (lost chunks, chunk where the next poll starts or None)
+    of a reply built by nack_reply """
+
+    kind, body = reply[:1], reply[1:]
+    if kind == const.NACK_BITMAP:
+        first = int.from_bytes(body[:const.PAGE_NUM_SIZE], byteorder='big')
+        bitmap = body[const.PAGE_NUM_SIZE:]
+        lost = [first + pos for pos in range(len(bitmap) * 8) if bitmap[pos // 8] & (1 << (pos % 8))]
+        start = first + len(bitmap) * 8
+        return lost, start if start < chunks else None
+    lost = [int.from_bytes(body[pos:pos + const.PAGE_NUM_SIZE], byteorder='big')
+            for pos in range(0, len(body) - 1, const.PAGE_NUM_SIZE)]
+    if kind == const.NACK_LIST and lost:
+        return lost, lost[-1] + 1
+    return lost, None
+
+
+class MulticastSender(Sender):
+    """ The data frames are broadcast without ACKs. After every round the
+    receivers are polled one by one (NAK requests, the reply starts with the
+    id of the receiver) and the next round broadcasts the chunks lost by
+    any of them, so each loss costs one frame whatever the number of
+    receivers. Channel scan, hopping, dedup and delta are point to point,
+    they are not used. """
+
+    def broadcast(self, payload, seq_num, repeats=1):
+        """ Sends the frame without waiting for ACKs """
+
+        frame = self.build_frame(payload, seq_num)
+        for repeat in range(repeats):
+            util.send_packet(self.sender, frame)
+
+    def poll(self, receiver_id, chunks, patient=False):
+        """ Asks the receiver which chunks it lost. Returns the set of lost
+        chunks (with HEADER if it did not get the header), or None if it
+        does not answer. """
+
+        lost = set()
+        start = 0
+        while start is not None:
+            reply = yield from self.request(const.NACK_TAG, start, bytes([receiver_id]), patient)
+            if reply is None:
+                return None
+            if reply[:1] != bytes([receiver_id]):
+                # Late reply of another receiver
+                continue
+            if len(reply) == 1:
+                return set(range(chunks)) | {HEADER}
+            chunks_lost, start = parse_nack(reply[1:], chunks)
+            lost.update(chunks_lost)
+        return lost
+
+    def transmission(self):
+        """ Protocol steps of the whole transmission. Returns True if all
+        the receivers got the file """
+
+        self.hopper = None
+        for receiver_id in range(self.config.MULTICAST_RECEIVERS):
+            self.receiver.openReadingPipe(receiver_id + 1, self.config.MULTICAST_PIPES[receiver_id])
+
+        # Compress and read file
+        if self.config.BATCH_MODE:
+            start = phases.start()
+            compressed = util.compress_batch(self.config)
+            phases.stop(phases.COMPRESS, start)
+            if not compressed:
+                return False
+            codec = "batch"
+        else:
+            # The receivers are not asked for their dictionary, zlib-dict is not used
+            compressed = self.compress(self.config.IN_FILEPATH_RAW)
+            if compressed is None:
+                return False
+            codec = compressed[0]
+        payload_list = util.read_file(self.config, self.config.IN_FILEPATH_COMPRESSED)
+        if not payload_list:
+            return False
+        file_size = os.path.getsize(self.config.IN_FILEPATH_COMPRESSED)
+        header = util.build_header(file_size, util.file_id(self.config.IN_FILEPATH_COMPRESSED), codec)
+
+        # Wait for all the receivers to be ready
+        receivers = list(range(self.config.MULTICAST_RECEIVERS))
+        for receiver_id in receivers:
+            yield from self.request(const.NACK_TAG, 0, bytes([receiver_id]), patient=True)
+        print("All the receivers are ready")
+
+        success = True
+        lost = set(range(len(payload_list))) | {HEADER}
+        for round_num in range(1, const.MULTICAST_MAX_ROUNDS + 1):
+            for index in sorted(lost):
+                if index == HEADER:
+                    self.broadcast(header, 1, const.MULTICAST_HEADER_REPEATS)
+                else:
+                    self.broadcast(payload_list[index], index + 2)
+            print("Round " + str(round_num) + ": " + str(len(lost)) + " packets broadcast")
+
+            # The next round repairs the union of the losses. Late replies of the
+            # previous polls are flushed, the losses of the receivers changed since them
+            self.receiver.flush_rx()
+            lost = set()
+            for receiver_id in list(receivers):
+                receiver_lost = yield from self.poll(receiver_id, len(payload_list))
+                if receiver_lost is None:
+                    print("Receiver " + str(receiver_id) + " does not answer")
+                    receivers.remove(receiver_id)
+                    success = False
+                elif not receiver_lost:
+                    print("Receiver " + str(receiver_id) + " has the whole file")
+                    receivers.remove(receiver_id)
+                lost.update(receiver_lost or ())
+            if not receivers:
+                break
+        else:
+            print("Transmission ended after " + str(const.MULTICAST_MAX_ROUNDS) + " rounds")
+            success = False
+        payload_list.close()
+
+        # Send EOT, the receivers do not acknowledge it
+        self.broadcast(b'ENDOFTRANSMISSION', len(payload_list) + 2, const.MULTICAST_EOT_REPEATS)
+        if success:
+            print("TRANSMISSION SUCCESSFUL")
+        return success
+
+
+class MulticastReceiver(Receiver):
+    """ Receives the broadcast of a MulticastSender: the frames are not
+    acknowledged, only the polls for RECEIVER_ID are answered. """
+
+    def start_reception(self):
+        super().start_reception()
+        # The replies go to the pipe of this receiver
+        self.sender.openWritingPipe(self.config.MULTICAST_PIPES[self.config.RECEIVER_ID])
+
+    def handle_frame(self, rx_buffer):
+        """ Processes one received frame. Returns True once the whole file
+        is received and the sender ended the transmission. """
+
+        self.last_frame_time = time.time()
+        payload = bytes(rx_buffer[self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE:])
+        seq = int.from_bytes(
+            rx_buffer[self.config.CRC_SIZE:self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE],
+            byteorder='big')
+        if payload == b'ENDOFTRANSMISSION':
+            if self.session is not None and self.session.is_complete() and not self.rx_success:
+                self.rx_success = True
+                print("RECEPTION SUCCESSFUL")
+        elif not util.check_crc(rx_buffer[:self.config.CRC_SIZE], rx_buffer[self.config.CRC_SIZE:]):
+            print("    Packet number " + str(seq) + " received incorrectly")
+        elif seq == 1:
+            self.open_session(payload)
+        elif seq == const.QUERY_SEQ_NUM:
+            request = util.parse_request(payload, const.NACK_TAG)
+            receiver_id = bytes([self.config.RECEIVER_ID])
+            if request is not None and request[1] == receiver_id:
+                reply = receiver_id
+                if self.session is not None:
+                    reply = reply + nack_reply(self.session, request[0], self.config.DATA_SIZE)
+                util.send_packet(self.sender, self.build_frame(util.build_reply(request[0], reply), seq))
+        elif self.session is not None:
+            self.session.add(seq - 2, payload)
+        return self.rx_success
+
+    def receive(self):
+        """ Receives the file. If the EOT is lost, the reception ends
+        MULTICAST_LINGER seconds after the last frame of the sender. """
+
+        self.start_reception()
+        self.receiver.startListening()
+
+        try:
+            while not self.rx_success:
+                rx_buffer = []
+                if self.wait_for_data(self.receiver):
+                    self.receiver.read(rx_buffer, self.receiver.getDynamicPayloadSize())
+                    self.handle_frame(rx_buffer)
+                elif self.session is not None and self.session.is_complete() and \
+                        time.time() - self.last_frame_time > const.MULTICAST_LINGER:
+                    self.rx_success = True
+                    print("RECEPTION SUCCESSFUL")
+        except IOError:
+            print("ERROR when saving the file")
+            return False
+        finally:
+            if self.session is not None:
+                self.session.close()
+
+        return self.finish_reception()
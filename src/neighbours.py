@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+#
+# Neighbour discovery and routing for the Network Mode: periodic hello
+# beacons measure the delivery ratio of every link, and the routes follow
+# the smallest expected transmission count (ETX)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import time
+import heapq
+from const import const
+
+
+# ETX of the unreachable nodes
+UNREACHABLE = float("inf")
+
+
+def link_cost(links, neighbour):
+    """ Cost of the link in a graph of address -> {address: cost}, or of
+    address -> addresses (cost 1) """
+
+    return links[neighbour] if isinstance(links, dict) else 1
+
+
+def shortest_paths(graph, origin):
+    """ Dijkstra over the graph (see link_cost). Returns (cost, parent)
+    dictionaries of the nodes reachable from origin """
+
+    costs = {origin: 0}
+    parents = {origin: None}
+    queue = [(0, origin)]
+    while queue:
+        cost, node = heapq.heappop(queue)
+        if cost > costs[node]:
+            continue
+        for neighbour in sorted(graph.get(node, ())):
+            new_cost = cost + link_cost(graph[node], neighbour)
+            if new_cost < costs.get(neighbour, UNREACHABLE):
+                costs[neighbour] = new_cost
+                parents[neighbour] = node
+                heapq.heappush(queue, (new_cost, neighbour))
+    return costs, parents
+
+
+def is_newer(seq, other):
+    """ Sequence numbers of one byte, that wrap around """
+
+    return 0 < (seq - other) % 256 < 128
+
+
+def quantize(value, scale):
+    """ value (0 to 255 / scale) in one byte, 255 if it is bigger """
+
+    return min(255, int(round(value * scale)))
+
+
+class Neighbour(object):
+    def __init__(self, address, now):
+        self.address = address
+        self.last_seq = None
+        self.last_heard = now
+        self.history = list()  # True/False for the last NEIGHBOUR_WINDOW hellos
+        self.pdr_out = 0.0  # Delivery ratio of our hellos, reported by the neighbour
+        self.rpd = 0.0  # Fraction of its frames received with RPD set (above -64 dBm), averaged
+        self.routes = dict()  # Destination -> (sequence number, ETX, time) advertised by the neighbour
+
+    def pdr_in(self):
+        """ Delivery ratio of its last NEIGHBOUR_WINDOW hellos. A new
+        neighbour counts as lost hellos until the window is full, so that
+        a few lucky hellos over a bad link do not make it look good. """
+
+        return sum(self.history) / const.NEIGHBOUR_WINDOW
+
+    def etx(self):
+        """ Expected transmissions of a frame and its ACK over the link """
+
+        forward = self.pdr_out * self.pdr_in()
+        return 1 / forward if forward > 0 else UNREACHABLE
+
+    def heard(self, seq, now, rpd):
+        """ Records a hello. A hello that is not newer than the last one (a
+        duplicate, or one that arrives late) is ignored: returns False """
+
+        if self.last_seq is not None:
+            if not is_newer(seq, self.last_seq):
+                return False
+            missed = (seq - self.last_seq - 1) % 256
+            self.history.extend([False] * min(missed, const.NEIGHBOUR_WINDOW))
+        self.history.append(True)
+        del self.history[:-const.NEIGHBOUR_WINDOW]
+        self.last_seq = seq
+        self.last_heard = now
+        self.rpd = self.rpd * 0.875 + (0.125 if rpd else 0.0)
+        return True
+
+
+class NeighbourTable(object):
+    """ Neighbours and routes of one node. Like src/tdma.py it does not use
+    the radio: hello() builds the beacon to broadcast every HELLO_PERIOD and
+    the hellos received are given to handle_hello (with testRPD of the
+    radio right after the reception, the only signal strength measure of
+    the nRF24L01+).
+
+    Hello: NM_HELLO + address + sequence number + number of neighbours +
+    (neighbour, delivery ratio of its hellos here * 255) for each one +
+    (destination, its sequence number, ETX of the route * 8) for each route.
+    The ratios give each neighbour the delivery ratio of its link in the
+    other direction. The routes are a distance vector with the sequence
+    numbers of the destinations (like DSDV): the route to a destination
+    goes through the neighbour with the smallest link ETX + advertised ETX
+    among the ones that advertise one of its ROUTE_SEQ_SLACK newest
+    sequence numbers, so old routes do not make loops. Neighbours that are
+    not heard for NEIGHBOUR_TIMEOUT hello periods are evicted with their
+    routes. """
+
+    def __init__(self, address, clock=time.time):
+        self.address = address
+        self.clock = clock
+        self.sequence = 0
+        self.neighbours = dict()
+        self.routes = dict()  # Destination -> (next hop, ETX, sequence number)
+
+    @staticmethod
+    def from_team_configuration(team_configuration):
+        return NeighbourTable(team_configuration.address)
+
+    def hello(self):
+        """ Next hello beacon. If the routes do not fit in the frame, each
+        hello advertises the next ones. """
+
+        self.expire()
+        self.sequence = (self.sequence + 1) % 256
+        frame = const.NM_HELLO + bytes([self.address, self.sequence, len(self.neighbours)])
+        for address, neighbour in sorted(self.neighbours.items()):
+            frame = frame + bytes([address, quantize(neighbour.pdr_in(), 255)])
+        routes = sorted(self.routes)
+        room = max(0, (const.NM_FRAME_SIZE - len(frame)) // 3)
+        if len(routes) > room:
+            first = self.sequence * room % len(routes)
+            routes = (routes[first:] + routes[:first])[:room]
+        for destination in routes:
+            next_hop, etx, seq = self.routes[destination]
+            frame = frame + bytes([destination, seq, quantize(etx, 8)])
+        return frame
+
+    def handle_hello(self, frame, rpd=False):
+        frame = bytes(frame)
+        if frame[:1] != const.NM_HELLO or frame[1] == self.address:
+            return
+        now = self.clock()
+        address = frame[1]
+        neighbour = self.neighbours.get(address)
+        if neighbour is None:
+            neighbour = self.neighbours[address] = Neighbour(address, now)
+            print("New neighbour: node " + str(address))
+        if not neighbour.heard(frame[2], now, rpd):
+            return
+        neighbour.pdr_out = 0.0
+        count = frame[3]
+        for pos in range(4, min(4 + 2 * count, len(frame) - 1), 2):
+            if frame[pos] == self.address:
+                neighbour.pdr_out = frame[pos + 1] / 255
+        for pos in range(4 + 2 * count, len(frame) - 2, 3):
+            destination, seq, etx = frame[pos], frame[pos + 1], frame[pos + 2]
+            if destination != self.address and etx < 255:
+                neighbour.routes[destination] = (seq, etx / 8, now)
+        self.update_routes()
+
+    def expire(self):
+        """ Evicts the neighbours that are not heard anymore """
+
+        now = self.clock()
+        for address in list(self.neighbours):
+            if now - self.neighbours[address].last_heard > const.NEIGHBOUR_TIMEOUT * const.HELLO_PERIOD:
+                print("Neighbour lost: node " + str(address))
+                del self.neighbours[address]
+                self.update_routes()
+
+    def update_routes(self):
+        """ Distance vector: best neighbour for every destination (recent
+        sequence number, smallest ETX, strongest signal). The routes that
+        a neighbour stopped advertising expire like the neighbours. """
+
+        now = self.clock()
+        candidates = dict()  # Destination -> [(sequence number, ETX, -RPD, next hop)]
+        for address, neighbour in sorted(self.neighbours.items()):
+            link = neighbour.etx()
+            if link == UNREACHABLE:
+                continue
+            advertised = {destination: (seq, etx) for destination, (seq, etx, heard) in neighbour.routes.items()
+                          if now - heard <= const.NEIGHBOUR_TIMEOUT * const.HELLO_PERIOD}
+            advertised[address] = (neighbour.last_seq, 0)
+            for destination, (seq, etx) in advertised.items():
+                if link + etx <= const.MAX_ROUTE_ETX:
+                    candidates.setdefault(destination, []).append((seq, link + etx, -neighbour.rpd, address))
+
+        routes = dict()
+        for destination, routes_to in candidates.items():
+            newest = routes_to[0][0]
+            for seq, etx, rpd, address in routes_to:
+                if is_newer(seq, newest):
+                    newest = seq
+            recent = [route for route in routes_to if (newest - route[0]) % 256 <= const.ROUTE_SEQ_SLACK]
+            seq, etx, rpd, address = min(recent, key=lambda route: route[1:])
+            routes[destination] = (address, etx, seq)
+        self.routes = routes
+
+    def next_hop(self, destination):
+        """ Neighbour to send the frames for destination, None if unreachable """
+
+        route = self.routes.get(destination)
+        return route[0] if route is not None else None
+
+    def links(self):
+        """ ETX of the links to the neighbours (see shortest_paths) """
+
+        return {address: neighbour.etx() for address, neighbour in self.neighbours.items()
+                if neighbour.etx() != UNREACHABLE}
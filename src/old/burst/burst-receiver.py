@@ -111,10 +111,12 @@ def check_crc(crc, payload):
         return False
 
 
-def check_hash(payload_list, hash_bytes, encoding):
-    hash_str = hashlib.md5(repr(payload_list).encode(encoding)).hexdigest()
-    hash_bytes_payload = bytes(hash_str.encode(encoding))
-    if hash_bytes == hash_bytes_payload:
+def check_hash(payload_hash, hash_bytes, encoding):
+    """ Compares the received hash with the rolling digest of the
+    payloads received so far. It does not depend on the file size. """
+
+    hash_bytes_payload = bytes(payload_hash.hexdigest().encode(encoding))
+    if bytes(hash_bytes) == hash_bytes_payload:
         return True
     return False
 
@@ -167,6 +169,7 @@ def main():
     rx_success = False
     seq_num = 0
     payload_list = list()
+    payload_hash = hashlib.md5()
     receiver.startListening()
 
     # Receive file
@@ -180,10 +183,12 @@ def main():
             payload = rx_buffer[CRC_SIZE:]
             if check_crc(crc, payload):
                 payload_list.append(bytes(payload))
+                payload_hash.update(bytes(payload))
                 seq_num = seq_num + 1
                 print("Packet number " + str(seq_num) + " received successfully")
             else:
                 payload_list = list()
+                payload_hash = hashlib.md5()
                 send_packet(sender, b'ERROR')
                 print("    Packet number " + str(seq_num) + " received incorrectly")
         else:
@@ -191,12 +196,13 @@ def main():
             if received_something(receiver):
                 receiver.read(rx_buffer, receiver.getDynamicPayloadSize())
                 hash_bytes = rx_buffer
-                if check_hash(payload_list, hash_bytes, encoding):
+                if check_hash(payload_hash, hash_bytes, encoding):
                     send_packet(sender, b'ACK')
                     rx_success = True
                     print("RECEPTION SUCCESSFUL")
                 else:
                     payload_list = list()
+                    payload_hash = hashlib.md5()
     write_file(OUT_FILEPATH, payload_list)
 
 
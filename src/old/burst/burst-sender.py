@@ -158,11 +158,20 @@ def error_available(receiver):
 
 
 def calculate_hash(payload_list, encoding):
-    """ This function is used for calculating the hash of the payload_list """
+    """ This function is used for calculating the hash of the payload_list.
+    The digest is updated chunk by chunk, so no copy of the whole file
+    is built in memory. """
 
-    hash_str = hashlib.md5(repr(payload_list).encode(encoding)).hexdigest()
-    hash_bytes = bytes(hash_str.encode(encoding))
-    return hash_bytes
+    payload_hash = hashlib.md5()
+    for payload in payload_list:
+        payload_hash.update(payload)
+    return hash_to_bytes(payload_hash, encoding)
+
+
+def hash_to_bytes(payload_hash, encoding):
+    """ Wire representation of the hash: the hex digest as bytes (32 bytes) """
+
+    return bytes(payload_hash.hexdigest().encode(encoding))
 
 
 def hello(sender, receiver):
@@ -204,6 +213,9 @@ def main():
     # Read file
     payload_list = read_file_and_encoding(IN_FILEPATH)
 
+    # The hash does not change between retransmissions, compute it only once
+    hash_bytes = calculate_hash(payload_list, ENCODING)
+
     # Initialize loop variables and functions
     receiver.startListening()
 
@@ -222,7 +234,7 @@ def main():
         if not error_available(receiver):
             eot_payload = "TeamB_EOT-" + ENCODING
             send_packet(sender, bytes(eot_payload.encode("utf-8")))
-            send_packet(sender, calculate_hash(payload_list, ENCODING))
+            send_packet(sender, hash_bytes)
             if wait_for_ack(receiver):
                 receiver.read(ack, receiver.getDynamicPayloadSize())
                 if bytes(ack) == b'ACK':
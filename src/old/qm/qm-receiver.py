@@ -65,6 +65,7 @@ def main():
     receiver.printDetails()
 
     payload_list = list()
+    payload_hash = hashlib.md5()
 
     # Receiving the file
     receiver.startListening()
@@ -83,9 +84,9 @@ def main():
                 wait_for_data(receiver)
                 receiver.read(hash_rcv, receiver.getDynamicPayloadSize())
                 print("Hash 1: " + str(bytes(hash_rcv).decode('utf-8')))
-                print("Hash 2: " + str(hashlib.md5(repr(payload_list).encode('utf-8')).hexdigest()))
+                print("Hash 2: " + str(payload_hash.hexdigest()))
 
-                if bytes(hash_rcv) == hashlib.md5(repr(payload_list).encode('utf-8')).hexdigest().encode('utf-8'):
+                if bytes(hash_rcv) == payload_hash.hexdigest().encode('utf-8'):
                     print("HASH correct, end of transmission...")
                     transmission_end = True
                     retransmit = False
@@ -93,9 +94,11 @@ def main():
                 else:
                     print("Hash incorrect, starting again...")
                     payload_list = list()
+                    payload_hash = hashlib.md5()
                     break
             else:
                 payload_list.append(bytes(data))
+                payload_hash.update(bytes(data))
                 x = x + 1
 
     write_file(sys.argv[1], payload_list)
@@ -90,6 +90,12 @@ def main():
     # Read file
     payload_list = read_file(sys.argv[1])
 
+    # Hash computed once, chunk by chunk
+    payload_hash = hashlib.md5()
+    for payload in payload_list:
+        payload_hash.update(payload)
+    hash_bytes = bytes(payload_hash.hexdigest().encode('utf-8'))
+
     i = 0
     while i < 10:
         # Sending the file
@@ -102,9 +108,8 @@ def main():
         print("Sent final packet")
         send_packet(sender, b"ENDOFTRANSMISSION")
         time.sleep(2)
-        print("Sent HASH: " + str(bytes(hashlib.md5(repr(payload_list).encode('utf-8')).hexdigest().encode('utf-8'))))
-        print("Hash without testing: " + str(hashlib.md5(repr(payload_list).encode('utf-8')).hexdigest()))
-        send_packet(sender, bytes(hashlib.md5(repr(payload_list).encode('utf-8')).hexdigest().encode('utf-8')))
+        print("Sent HASH: " + str(hash_bytes))
+        send_packet(sender, hash_bytes)
         print("End of transmission " + str(i))
         i = i + 1
         time.sleep(0.5)
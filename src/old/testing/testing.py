@@ -152,8 +152,10 @@ def receive_frame(frame):
 
 
 def calculate_hash(payload_list, encoding):
-    hash_str = hashlib.md5(repr(payload_list).encode(encoding)).hexdigest()
-    hash_bytes = bytes(hash_str.encode(encoding))
+    payload_hash = hashlib.md5()
+    for payload in payload_list:
+        payload_hash.update(payload)
+    hash_bytes = bytes(payload_hash.hexdigest().encode(encoding))
     return hash_bytes
 
 
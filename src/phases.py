@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+#
+# Per-phase timing of the transfers: the hot path marks the start and end of
+# each phase (compression, frame build, SPI write, ACK wait...), and at the
+# end of the execution the percentiles of every phase are appended to the log
+# Enabled with PROFILE_PHASES in the configuration
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import time
+import array
+from const import const
+
+
+# Phases, indexes of the arrays
+COMPRESS = 0
+READ_FILE = 1
+FRAME_BUILD = 2
+SPI_WRITE = 3
+ACK_WAIT = 4
+DATA_WAIT = 5
+CRC_CHECK = 6
+FILE_WRITE = 7
+UNCOMPRESS = 8
+NAMES = ("compress", "read_file", "frame build", "SPI write", "ACK wait", "data wait", "CRC check", "file write",
+         "uncompress")
+
+if hasattr(time, "perf_counter_ns"):
+    clock_ns = time.perf_counter_ns
+else:
+    def clock_ns():
+        return int(time.perf_counter() * 1000000000)
+
+ENABLED = False
+START_TIME = 0
+# Durations in ns of the last PHASE_SAMPLES times of each phase, allocated the first time it is enabled
+SAMPLES = list()
+COUNTS = [0] * len(NAMES)
+TOTALS = [0] * len(NAMES)
+# Events counted in the execution (retransmissions, RX FIFO full...), name -> count
+COUNTERS = dict()
+
+
+def start():
+    """ Start of a phase, None if disabled (stop does nothing then) """
+
+    return clock_ns() if ENABLED else None
+
+
+def stop(phase, start_time):
+    if start_time is None:
+        return
+    elapsed = clock_ns() - start_time
+    count = COUNTS[phase]
+    SAMPLES[phase][count % const.PHASE_SAMPLES] = elapsed
+    COUNTS[phase] = count + 1
+    TOTALS[phase] = TOTALS[phase] + elapsed
+
+
+def count(name, value=1):
+    if ENABLED:
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def begin(config):
+    """ Starts the profile of an execution, if the configuration enables it """
+
+    global ENABLED, START_TIME
+    ENABLED = config.PROFILE_PHASES
+    if not ENABLED:
+        return
+    if not SAMPLES:
+        SAMPLES.extend(array.array('q', [0]) * const.PHASE_SAMPLES for name in NAMES)
+    for phase in range(len(NAMES)):
+        COUNTS[phase] = 0
+        TOTALS[phase] = 0
+    COUNTERS.clear()
+    START_TIME = clock_ns()
+
+
+def histogram(samples):
+    """ Number of samples in each power of 2 of us, "<2us:10 <4us:3 ..." """
+
+    buckets = dict()
+    for sample in samples:
+        bucket = max(1, sample // 1000).bit_length()
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    return " ".join("<" + str(1 << bucket) + "us:" + str(buckets[bucket]) for bucket in sorted(buckets))
+
+
+def report(title):
+    """ Lines of the report of the phases since begin """
+
+    elapsed = clock_ns() - START_TIME
+    lines = ["=== " + time.strftime("%Y-%m-%d %H:%M:%S") + " " + title + ", " +
+             "{0:.3f}".format(elapsed / 1000000000) + " s",
+             "{0:<12} {1:>8} {2:>11} {3:>6} {4:>10} {5:>10} {6:>10}".format(
+                 "phase", "count", "total ms", "share", "p50 us", "p99 us", "max us")]
+    for phase, name in enumerate(NAMES):
+        if not COUNTS[phase]:
+            continue
+        samples = sorted(SAMPLES[phase][:min(COUNTS[phase], const.PHASE_SAMPLES)])
+        lines.append("{0:<12} {1:>8} {2:>11.1f} {3:>5.1f}% {4:>10.1f} {5:>10.1f} {6:>10.1f}".format(
+            name, COUNTS[phase], TOTALS[phase] / 1000000, 100 * TOTALS[phase] / max(1, elapsed),
+            samples[len(samples) // 2] / 1000, samples[(len(samples) - 1) * 99 // 100] / 1000, samples[-1] / 1000))
+        lines.append("    " + histogram(samples))
+    for name in sorted(COUNTERS):
+        lines.append("{0:<32} {1:>8}".format(name, COUNTERS[name]))
+    return lines
+
+
+def end(config, title):
+    """ Ends the profile of the execution and appends its report to
+    PROFILE_LOG_PATH. The percentiles and the histograms are of the last
+    PHASE_SAMPLES times of each phase. """
+
+    global ENABLED
+    if not ENABLED:
+        return
+    ENABLED = False
+    try:
+        os.makedirs(os.path.dirname(config.PROFILE_LOG_PATH), exist_ok=True)
+        with open(config.PROFILE_LOG_PATH, 'a') as f:
+            f.write("\n".join(report(title)) + "\n\n")
+        print("Phase profile appended to " + config.PROFILE_LOG_PATH)
+    except IOError:
+        print("ERROR when writing the phase profile")
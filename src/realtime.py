@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+#
+# Real-time options of the radio loop: the thread that runs it is pinned to
+# one core with SCHED_FIFO priority and locked memory, and the GC only runs
+# between executions, so that the polls and the CE pulses are not stretched
+# by the scheduler of a loaded Pi
+# Enabled with REALTIME in the configuration
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import gc
+import time
+from const import const
+
+
+# mlockall flags (sys/mman.h)
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+APPLIED = False
+# Cores of the children of the radio thread (compression), all but the one of the radio loop
+OTHER_CPUS = None
+
+
+def isolated_cpus():
+    """ Cores isolated from the scheduler (isolcpus= in /boot/cmdline.txt) """
+
+    try:
+        with open("/sys/devices/system/cpu/isolated") as f:
+            text = f.read().strip()
+    except IOError:
+        return []
+    cpus = list()
+    for part in filter(None, text.split(",")):
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def radio_cpu(requested):
+    """ Core of the radio loop: the one requested, the first isolated core
+    or the last core """
+
+    if requested is not None:
+        return requested
+    isolated = isolated_cpus()
+    return isolated[0] if isolated else max(os.sched_getaffinity(0))
+
+
+def measure_jitter(period, samples):
+    """ Lateness (s) of samples sleeps of period seconds """
+
+    lateness = list()
+    for sample in range(samples):
+        start = time.perf_counter()
+        time.sleep(period)
+        lateness.append(time.perf_counter() - start - period)
+    return lateness
+
+
+def jitter_report():
+    """ Prints the lateness of the sleeps of the radio loop: the 1 ms polls
+    of wait_for_ack / wait_for_data and the 10 us CE pulse of a write """
+
+    for name, period in (("1 ms poll", 0.001), ("10 us CE pulse", 0.00001)):
+        lateness = sorted(measure_jitter(period, const.JITTER_SAMPLES))
+        print("    {0:<14} late by p50 {1:8.1f} us, p99 {2:8.1f} us, max {3:8.1f} us".format(
+            name, lateness[len(lateness) // 2] * 1000000, lateness[(len(lateness) - 1) * 99 // 100] * 1000000,
+            lateness[-1] * 1000000))
+
+
+def setup(config):
+    """ Applies the real-time options to the calling thread (the one that
+    runs the radio loop), once per process. The threads created before
+    (GPIO callbacks, LEDs) keep the normal scheduling. Each option that is
+    not allowed (no root, no isolated core...) is reported and skipped. """
+
+    global APPLIED, OTHER_CPUS
+    if not config.REALTIME or APPLIED:
+        return
+    APPLIED = True
+    print("Timing jitter before the real-time options:")
+    jitter_report()
+
+    try:
+        cpu = radio_cpu(config.REALTIME_CPU)
+        cpus = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, {cpu})
+        OTHER_CPUS = (cpus - {cpu}) or cpus
+        print("Radio loop pinned to CPU " + str(cpu))
+    except (OSError, ValueError) as e:
+        print("Could not pin the radio loop to a CPU: " + str(e))
+
+    try:
+        # The children (compression processes) go back to the normal scheduling
+        policy = os.SCHED_FIFO | getattr(os, "SCHED_RESET_ON_FORK", 0)
+        os.sched_setscheduler(0, policy, os.sched_param(config.REALTIME_PRIORITY))
+        print("Radio loop with SCHED_FIFO priority " + str(config.REALTIME_PRIORITY))
+    except OSError as e:
+        print("SCHED_FIFO not allowed: " + str(e))
+
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) == 0:
+        print("Memory locked")
+    else:
+        print("Memory not locked: " + os.strerror(ctypes.get_errno()))
+
+    print("Timing jitter after the real-time options:")
+    jitter_report()
+
+
+def release():
+    """ Initializer of the children of the radio thread (compression pools
+    and commands): they run on the other cores """
+
+    if OTHER_CPUS is not None:
+        os.sched_setaffinity(0, OTHER_CPUS)
+
+
+def child_setup():
+    """ preexec_fn (and Pool initializer) of the children: release if setup
+    pinned the radio loop, None otherwise, so that subprocess keeps its fast
+    path (SCHED_FIFO is already reset on fork) """
+
+    return release if OTHER_CPUS is not None else None
+
+
+def begin_transfer(config):
+    """ The GC does not interrupt the transfer loop (reference counting
+    still frees almost everything) """
+
+    if config.REALTIME:
+        gc.disable()
+
+
+def end_transfer(config):
+    """ Collects the garbage of the transfer, before the next execution """
+
+    if config.REALTIME:
+        gc.enable()
+        gc.collect()
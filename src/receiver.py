@@ -7,8 +7,15 @@
 # Date: 05/01/2019
 # Version: 1.1
 
+import os
 import time
 from src import util
+from src import dedup
+from src import delta
+from src import channels
+from src import hopping
+from src import phases
+from const import const
 
 
 class Receiver(object):
@@ -16,86 +23,303 @@ class Receiver(object):
         self.config = config
         self.sender = sender
         self.receiver = receiver
+        util.load_dictionary(config)
 
     def wait_for_data(self, receiver):
         """ This is a blocking function that waits
         until the ACK is available in the receiver pipe
         or until the timeout expires. """
 
+        start = phases.start()
         start_time = time.time()
         while not receiver.available(self.config.RECEIVER_PIPE):
             if time.time() - start_time < self.config.DATA_TIMEOUT:
                 time.sleep(0.001)
             else:
+                phases.stop(phases.DATA_WAIT, start)
                 return False
+        phases.stop(phases.DATA_WAIT, start)
         return True
 
     def build_frame(self, payload, seq_num):
         """ Function that builds the frame in bytes """
 
+        start = phases.start()
         seq = seq_num.to_bytes(self.config.SEQ_NUM_SIZE, byteorder='big')
         crc = util.calculate_crc(self.config, seq + payload)
+        phases.stop(phases.FRAME_BUILD, start)
 
         return crc + seq + payload
 
+    def answer_request(self, payload, session, store):
+        """ Builds the reply to a request of the sender (see util.build_request),
+        or returns None if the request is unknown. """
+
+        request = util.parse_request(payload, const.QUERY_TAG)
+        if request is not None and session is not None:
+            # Page of the bitmap of the session
+            page_size = self.config.DATA_SIZE - const.PAGE_NUM_SIZE
+            return util.build_reply(request[0], session.page(request[0], page_size))
+
+        request = util.parse_request(payload, const.OFFER_TAG)
+        if request is not None:
+            # Chunk hashes offered by the sender, answer which ones are in the store
+            index, hashes = request
+            mask = 0
+            for position, start in enumerate(range(0, len(hashes), const.CHUNK_HASH_SIZE)):
+                if store.has(hashes[start:start + const.CHUNK_HASH_SIZE]):
+                    mask = mask | (1 << position)
+            return util.build_reply(index, bytes([mask]))
+
+        request = util.parse_request(payload, const.CHANNEL_TAG)
+        if request is not None:
+            # Rendezvous: channels chosen from the candidates of the sender and the local survey,
+            # the receiver moves to them after the reply (see handle_frame and check_rendezvous)
+            index, candidates = request
+            if index == 0:
+                if self.channels is None:
+                    self.channels = channels.choose_channels(
+                        self.occupancy, candidates, self.config.ALLOWED_CHANNELS,
+                        (self.config.RECEIVER_CHANNEL, self.config.SENDER_CHANNEL))
+                self.retune = True
+                return util.build_reply(index, bytes(self.channels))
+            self.tuned_time = None
+            return util.build_reply(index, b'')
+
+        request = util.parse_request(payload, const.HOP_TAG)
+        if request is not None:
+            # Frequency hopping: the slot of the index starts now (see src/hopping.py)
+            index, data = request
+            if self.hopper is None or self.hopper.seed != int.from_bytes(data[:const.SEED_SIZE], byteorder='big'):
+                self.hop_channels = (self.receiver.channel, self.sender.channel)
+                self.hopper = hopping.Hopper.from_sync_data(data, self.config.ALLOWED_CHANNELS, self.hop_channels,
+                                                           self.config.HOP_DWELL)
+            else:
+                self.hopper.apply_sync_data(data)
+            self.hopper.anchor(index)
+            return util.build_reply(index, b'')
+
+        request = util.parse_request(payload, const.DICTIONARY_TAG)
+        if request is not None:
+            # Id of the preset dictionary, empty if there is none
+            return util.build_reply(request[0], util.dictionary_id() or b'')
+
+        request = util.parse_request(payload, const.BASIS_TAG)
+        if request is not None:
+            # Size of the file of the previous execution, 0 if there is none (or DELTA is not enabled)
+            basis_path = self.config.OUT_FILEPATH_RAW + const.BASIS_EXTENSION
+            basis_size = os.path.getsize(basis_path) if self.config.DELTA and os.path.isfile(basis_path) else 0
+            return util.build_reply(request[0], basis_size.to_bytes(const.CHUNK_COUNT_SIZE, byteorder='big'))
+
+        request = util.parse_request(payload, const.SIGNATURE_TAG)
+        if request is not None:
+            # Signatures of the blocks of the basis
+            if self.signatures is None:
+                try:
+                    with open(self.config.OUT_FILEPATH_RAW + const.BASIS_EXTENSION, 'rb') as f:
+                        self.signatures = delta.file_signatures(f.read(), self.config.DELTA_BLOCK_SIZE)
+                except IOError:
+                    # The basis is gone since its size was sent, no block can be copied from it
+                    print("ERROR when reading the previous file for the delta")
+                    self.signatures = list()
+            per_frame = (self.config.DATA_SIZE - const.PAGE_NUM_SIZE) // const.SIGNATURE_SIZE
+            index = request[0]
+            return util.build_reply(index, b''.join(self.signatures[index:index + per_frame]))
+
+        return None
+
+    def start_reception(self):
+        """ Resets the state of the reception """
+
+        self.rx_success = False
+        self.last_seq = 0
+        self.session = None
+        self.codec = None
+        self.flags = 0
+        self.dictionary_id = None
+        self.store = dedup.ChunkStore(self.config.OUT_PATH_STORE, self.config.DEDUP_STORE_SIZE)
+        self.header_ack = b'ACK'
+        self.signatures = None
+        self.occupancy = None
+        self.channels = None
+        self.retune = False
+        self.tuned_time = None
+        self.hopper = None
+        self.hop_channels = None
+        self.last_frame_time = time.time()
+        if self.config.CHANNEL_SCAN:
+            self.occupancy = channels.survey(self.receiver, self.config.SCAN_SWEEPS)
+
+    def check_rendezvous(self):
+        """ Goes back to the channels of the configuration if the sender
+        did not confirm the new ones in RENDEZVOUS_TIMEOUT (it did not
+        get the reply, so it is still on them) """
+
+        if self.tuned_time is not None and time.time() - self.tuned_time > const.RENDEZVOUS_TIMEOUT:
+            print("Rendezvous not confirmed, back to the default channels")
+            channels.set_channels(self.sender, self.receiver, self.config.SENDER_CHANNEL,
+                                  self.config.RECEIVER_CHANNEL)
+            self.tuned_time = None
+
+    def follow_hops(self):
+        """ Moves to the channels of the current slot of the hop schedule.
+        Without frames for HOP_SYNC_TIMEOUT the schedule is lost, and the
+        receiver waits on the base channels for the HOP request of the sender. """
+
+        if self.hopper is None:
+            return
+        if time.time() - self.last_frame_time > const.HOP_SYNC_TIMEOUT:
+            self.hopper.lose_sync()
+        hop_channels = self.hopper.channels(self.hopper.current_slot())
+        if hop_channels != self.hop_channels:
+            channels.set_channels(self.sender, self.receiver, hop_channels[1], hop_channels[0])
+            self.hop_channels = hop_channels
+
+    def open_session(self, payload):
+        """ Opens (or resumes) the session of the file announced in the
+        header frame. Returns False if the payload is not a header. """
+
+        header = util.parse_header(payload)
+        if header is None:
+            return False
+        file_size, session_id, self.codec, self.flags, self.dictionary_id = header
+        if self.session is None or self.session.session_id != session_id:
+            if self.session is not None:
+                self.session.close()
+            self.session = util.ReceiveSession(self.config.OUT_FILEPATH_COMPRESSED, session_id,
+                                               file_size, self.config.DATA_SIZE)
+            print("Header received, file size: " + str(file_size) + " bytes, codec: " + self.codec)
+        # Resumed from the state file of a previous execution, or the sender restarted during this one
+        self.header_ack = b'ACK'
+        if self.session.received > 0:
+            self.header_ack = b'RESUME'
+            print("Resuming session, " + str(self.session.received) + "/" +
+                  str(self.session.chunks) + " packets already received")
+        return True
+
+    def handle_frame(self, rx_buffer):
+        """ Processes one received frame and sends its ACK. It does not
+        wait for anything, so it is shared by receive and the asyncio
+        core (src/aio.py). Returns True once the whole file is received. """
+
+        self.last_frame_time = time.time()
+        payload = rx_buffer[self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE:]
+        seq = int.from_bytes(
+            rx_buffer[self.config.CRC_SIZE:self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE],
+            byteorder='big')
+        if bytes(payload) != b'ENDOFTRANSMISSION':
+            crc = rx_buffer[:self.config.CRC_SIZE]
+            seq_payload = rx_buffer[self.config.CRC_SIZE:]
+            if not util.check_crc(crc, seq_payload):
+                util.send_packet(self.sender, self.build_frame(b'ERROR', self.last_seq))
+                print("    Packet number " + str(self.last_seq + 1) + " received incorrectly")
+            elif seq == 1:
+                # Header frame, open (or resume) the session of the file
+                if not self.open_session(payload):
+                    print("        Expected header frame, received data")
+                    return False
+                self.last_seq = seq
+                util.send_packet(self.sender, self.build_frame(self.header_ack, seq))
+            elif seq == const.QUERY_SEQ_NUM:
+                # Request of the sender, the reply goes in the ACK
+                reply = self.answer_request(payload, self.session, self.store)
+                if reply is not None:
+                    util.send_packet(self.sender, self.build_frame(reply, seq))
+                if self.retune:
+                    self.retune = False
+                    channels.set_channels(self.sender, self.receiver, self.channels[1], self.channels[0])
+                    self.tuned_time = time.time()
+            elif self.session is None:
+                print("        Received packet number " + str(seq) + " before the header")
+            else:
+                self.session.add(seq - 2, bytes(payload))
+                self.last_seq = seq
+                util.send_packet(self.sender, self.build_frame(self.data_ack(), seq))
+                print("Packet number " + str(seq) + " received successfully")
+        elif self.session is not None and self.session.is_complete():
+            util.send_packet(self.sender, self.build_frame(b'ACK', seq))
+            self.rx_success = True
+            print("RECEPTION SUCCESSFUL")
+        return self.rx_success
+
+    def data_ack(self):
+        """ Payload of the ACKs of the data frames """
+
+        return b'ACK'
+
+    def finish_reception(self):
+        """ Uncompresses (and rebuilds) the received file.
+        Returns True if success """
+
+        # The file is already on disk, it is not needed to resume anymore
+        self.session.remove()
+        if self.flags & const.FLAG_DICTIONARY and self.dictionary_id != util.dictionary_id():
+            print("ERROR: the file was compressed with another dictionary")
+            return False
+        start = phases.start()
+        codec = self.codec
+        if codec == "batch":
+            uncompress_success = util.uncompress_batch(self.config)
+        elif self.flags & const.FLAG_DELTA:
+            # Rebuild the file from the file of the previous execution and the differences
+            container_path = self.config.OUT_FILEPATH_RAW + const.DELTA_EXTENSION
+            uncompress_success = util.uncompress_file(self.config, codec, container_path)
+            if uncompress_success:
+                try:
+                    delta.apply_delta(self.config.OUT_FILEPATH_RAW + const.BASIS_EXTENSION, container_path,
+                                      self.config.OUT_FILEPATH_RAW, self.config.DELTA_BLOCK_SIZE)
+                    os.remove(container_path)
+                except (IOError, ValueError):
+                    print("ERROR when applying the delta to the previous file")
+                    uncompress_success = False
+        elif self.flags & const.FLAG_DEDUP:
+            # Rebuild the file from the chunk store and the received chunks
+            container_path = self.config.OUT_FILEPATH_RAW + const.DEDUP_EXTENSION
+            uncompress_success = util.uncompress_file(self.config, codec, container_path)
+            if uncompress_success:
+                try:
+                    dedup.rebuild_file(self.store, container_path, self.config.OUT_FILEPATH_RAW)
+                    os.remove(container_path)
+                except (IOError, ValueError):
+                    print("ERROR when rebuilding the file from the chunk store")
+                    uncompress_success = False
+        else:
+            uncompress_success = util.uncompress_file(self.config, codec)
+        phases.stop(phases.UNCOMPRESS, start)
+
+        if uncompress_success:
+            # Return true if successful
+            return True
+        else:
+            return False
+
     def receive(self):
         """ This main function initializes the radios,
         receives the file and stores it in memory. """
 
         # Initialize loop variables and functions
-        rx_success = False
-        seq_num = 1
-        payload_list = list()
+        self.start_reception()
         self.receiver.startListening()
 
         # Receive file
-        while not rx_success:
-            rx_buffer = []
-            received_something = False
-            while not received_something:
-                if self.wait_for_data(self.receiver):
-                    self.receiver.read(rx_buffer, self.receiver.getDynamicPayloadSize())
-                    received_something = True
-
-            payload = rx_buffer[self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE:]
-            if bytes(payload) != b'ENDOFTRANSMISSION':
-                crc = rx_buffer[:self.config.CRC_SIZE]
-                seq = int.from_bytes(
-                    rx_buffer[self.config.CRC_SIZE:self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE],
-                    byteorder='big')
-                seq_payload = rx_buffer[self.config.CRC_SIZE:]
-                if util.check_crc(crc, seq_payload):
-                    if seq == seq_num:
-                        util.send_packet(self.sender, self.build_frame(b'ACK', seq_num))
-                        if seq_num == 1 and len(payload_list) == 0:
-                            payload_list.append(bytes(payload))
-                            print("Packet number " + str(seq_num) + " received successfully")
-                    elif seq == seq_num + 1:
-                        seq_num = seq_num + 1
-                        payload_list.append(bytes(payload))
-                        util.send_packet(self.sender, self.build_frame(b'ACK', seq_num))
-                        print("Packet number " + str(seq_num) + " received successfully")
-                    else:
-                        print("        Receiver out of order packet. Rcv: " + str(seq) + " Exp: " + str(seq_num + 1))
-                else:
-                    util.send_packet(self.sender, self.build_frame(b'ERROR', seq_num))
-                    print("    Packet number " + str(seq_num) + " received incorrectly")
-            else:
-                seq_num = seq_num + 1
-                util.send_packet(self.sender, self.build_frame(b'ACK', seq_num))
-                rx_success = True
-                print("RECEPTION SUCCESSFUL")
-
-        # Save and uncompress file
         try:
-            util.write_file(self.config.OUT_FILEPATH_COMPRESSED, payload_list)
-            uncompress_success = util.uncompress_file(self.config)
+            while not self.rx_success:
+                rx_buffer = []
+                received_something = False
+                while not received_something:
+                    if self.wait_for_data(self.receiver):
+                        self.receiver.read(rx_buffer, self.receiver.getDynamicPayloadSize())
+                        received_something = True
+                    else:
+                        self.check_rendezvous()
+                        self.follow_hops()
+                self.handle_frame(rx_buffer)
+                self.follow_hops()
         except IOError:
             print("ERROR when saving the file")
             return False
+        finally:
+            if self.session is not None:
+                self.session.close()
 
-        if uncompress_success:
-            # Return true if successful
-            return True
-        else:
-            return False
\ No newline at end of file
+        return self.finish_reception()
@@ -7,8 +7,15 @@
 # Date: 05/01/2019
 # Version: 1.1
 
+import os
 import time
 from src import util
+from src import dedup
+from src import delta
+from src import channels
+from src import hopping
+from src import phases
+from const import const
 
 
 class Sender(object):
@@ -16,105 +23,440 @@ class Sender(object):
         self.config = config
         self.sender = sender
         self.receiver = receiver
+        self.hopper = None
+        self.syncing = False
+        util.load_dictionary(config)
 
     def wait_for_ack(self, receiver):
         """ This is a blocking function that waits
         until the ACK is available in the receiver pipe
         or until the timeout expires. """
 
+        start = phases.start()
         start_time = time.time()
         while not receiver.available(self.config.RECEIVER_PIPE):
             if time.time() - start_time < self.config.ACK_TIMEOUT:
                 time.sleep(0.001)
             else:
+                phases.stop(phases.ACK_WAIT, start)
                 return False
+        phases.stop(phases.ACK_WAIT, start)
         return True
 
     def build_frame(self, payload, seq_num):
         """ Function that builds the frame in bytes """
 
+        start = phases.start()
         seq = seq_num.to_bytes(self.config.SEQ_NUM_SIZE, byteorder='big')
         crc = util.calculate_crc(self.config, seq + payload)
+        phases.stop(phases.FRAME_BUILD, start)
 
         return crc + seq + payload
 
-    def transmit(self):
-        """ This main function initializes the radios and sends
-        all the data gathered from the file. """
+    def check_ack(self, rx_buffer, seq_num):
+        """ Returns the payload of the ACK in rx_buffer if it is correct
+        and for seq_num, otherwise None. """
+
+        crc = rx_buffer[:self.config.CRC_SIZE]
+        seq = int.from_bytes(
+            rx_buffer[self.config.CRC_SIZE:self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE],
+            byteorder='big')
+        ack = bytes(rx_buffer[self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE:])
+        seq_ack = rx_buffer[self.config.CRC_SIZE:]
+        if util.check_crc(crc, seq_ack):
+            if seq == seq_num:
+                if ack == b'ERROR':
+                    print("        Packet number " + str(seq_num) + " transmitted incorrectly")
+                else:
+                    return ack
+            else:
+                print("        Received Out of Order ACK. Received: " + str(seq) + " Expecting: " + str(seq_num))
+        else:
+            print("        Received incorrect ACK number " + str(seq_num))
+        return None
+
+    def frame_steps(self, payload, seq_num, patient=False, max_attempts=1000):
+        """ Steps of the transmission of one frame (STOP&WAIT): the frame is
+        sent until its ACK is received. Every time it has to wait for the
+        ACK it yields, and it is sent back whether the ACK is available, so
+        the same retries run with the blocking transmit_frame and on the
+        event loop (see src/aio.py). It returns the payload of the ACK, or
+        None if it fails more than max_attempts times. A patient
+        transmission never gives up, it is used while waiting for the
+        receiver to start. """
+
+        attempt = 0
+        while True:
+            yield from self.follow_hops()
+            util.send_packet(self.sender, self.build_frame(payload, seq_num))
+            attempt = attempt + 1
+            rx_buffer = []
+            ack = None
+            available = yield
+            if available:
+                self.receiver.read(rx_buffer, self.receiver.getDynamicPayloadSize())
+                ack = self.check_ack(rx_buffer, seq_num)
+            elif not patient:
+                print("    Attempt " + str(attempt) + " to retransmit packet number " + str(seq_num))
+            self.record_hop(ack is not None)
+            if ack is not None:
+                return ack
+
+            if attempt > max_attempts and not patient:
+                print("Transmission ended after trying to retransmit for more than " + str(max_attempts) + " times")
+                return None
+
+    def transmit_frame(self, payload, seq_num, patient=False, max_attempts=1000):
+        """ Sends the frame until its ACK is received (see frame_steps),
+        blocking in wait_for_ack. It returns the payload of the ACK, or None
+        if it fails. """
+
+        steps = self.frame_steps(payload, seq_num, patient, max_attempts)
+        try:
+            next(steps)
+            while True:
+                steps.send(self.wait_for_ack(self.receiver))
+        except StopIteration as end:
+            return end.value
+
+    ###########################
+    #    FREQUENCY HOPPING    #
+    ###########################
+
+    def start_hopping(self):
+        """ Hops from the current channels, which become the base channels
+        of the sync slots (see src/hopping.py) """
+
+        self.hopper = hopping.Hopper(int.from_bytes(os.urandom(const.SEED_SIZE), byteorder='big'),
+                                     self.config.ALLOWED_CHANNELS, (self.sender.channel, self.receiver.channel),
+                                     self.config.HOP_DWELL)
+        self.hop_channels = self.hopper.base
+        self.synced_slot = None
+        self.last_ack_time = time.time()
+
+    def hop_sync(self, slot, patient):
+        """ Steps that send the HOP request on the base channels (see
+        frame_steps): the receiver starts the slot when it receives it, the
+        sender when it gets the reply """
+
+        self.syncing = True
+        self.tune_hop(self.hopper.base)
+        payload = util.build_request(const.HOP_TAG, slot, self.hopper.sync_data())
+        max_attempts = max(1, int(self.config.HOP_DWELL / self.config.ACK_TIMEOUT))
+        while True:
+            ack = yield from self.frame_steps(payload, const.QUERY_SEQ_NUM, patient, max_attempts)
+            if ack is None or int.from_bytes(ack[:const.PAGE_NUM_SIZE], byteorder='big') == slot:
+                break
+        if ack is not None:
+            self.hopper.anchor(slot)
+            self.hopper.blacklist = set(self.hopper.pending)
+            self.last_ack_time = time.time()
+        self.synced_slot = slot
+        self.syncing = False
+
+    def tune_hop(self, hop_channels):
+        if hop_channels != self.hop_channels:
+            channels.set_channels(self.sender, self.receiver, hop_channels[0], hop_channels[1])
+            self.hop_channels = hop_channels
+
+    def follow_hops(self):
+        """ Steps run before every attempt (see frame_steps): moves to the
+        channels of the current slot, anchoring the schedule again in every
+        sync slot. Without ACKs for 2 HOP_SYNC_TIMEOUT the receiver is lost (it waits
+        on the base channels after HOP_SYNC_TIMEOUT), so the sender goes
+        to the base channels and waits there until it answers. """
+
+        if self.hopper is None or self.syncing:
+            return
+        if time.time() - self.last_ack_time > 2 * const.HOP_SYNC_TIMEOUT:
+            print("Hopping out of sync")
+            self.hopper.lose_sync()
+            yield from self.hop_sync(self.hopper.next_sync_slot(), True)
+        slot = self.hopper.current_slot()
+        if slot is None:
+            yield from self.hop_sync(0, True)
+        elif self.hopper.is_sync_slot(slot) and slot % (1 << (8 * const.PAGE_NUM_SIZE)) != self.synced_slot:
+            yield from self.hop_sync(slot % (1 << (8 * const.PAGE_NUM_SIZE)), False)
+        self.tune_hop(self.hopper.channels(self.hopper.current_slot()))
+
+    def record_hop(self, success):
+        if self.hopper is None or self.syncing:
+            return
+        if success:
+            self.last_ack_time = time.time()
+        if self.hopper.record(self.hop_channels[0], success):
+            print("Channel " + str(self.hop_channels[0]) + " blacklisted")
+
+    # The protocol is written as generators that yield (payload, seq_num, patient)
+    # for every frame that has to be transmitted, and receive the payload of its ACK
+    # (or None). This way the same protocol runs with the blocking transmit_frame
+    # (see run) or on an asyncio event loop (see src/aio.py).
+
+    def run(self, steps):
+        """ Runs the protocol steps with the blocking transmit_frame """
+
+        try:
+            frame = next(steps)
+            while True:
+                frame = steps.send(self.transmit_frame(*frame))
+        except StopIteration as end:
+            return end.value
+
+    def request(self, tag, index, data=b'', patient=False):
+        """ Sends a request to the receiver and returns the data of its
+        reply, or None if it fails. Replies to previous requests
+        (with another index) are discarded. """
+
+        while True:
+            ack = yield util.build_request(tag, index, data), const.QUERY_SEQ_NUM, patient
+            if ack is None:
+                return None
+            if int.from_bytes(ack[:const.PAGE_NUM_SIZE], byteorder='big') == index:
+                return ack[const.PAGE_NUM_SIZE:]
+
+    def query_bitmap(self, chunks):
+        """ Asks the receiver which chunks it already has from a previous
+        execution. Returns the bitmap, or None if the query fails. """
+
+        page_size = self.config.DATA_SIZE - const.PAGE_NUM_SIZE
+        pages = (chunks + page_size * 8 - 1) // (page_size * 8)
+        bitmap = bytearray()
+        for page_num in range(pages):
+            page = yield from self.request(const.QUERY_TAG, page_num)
+            if page is None:
+                return None
+            bitmap.extend(page)
+        return bitmap
+
+    def offer_chunks(self, hashes):
+        """ Offers the chunk hashes to the receiver, a few per frame.
+        Returns the set of hashes that the receiver already has,
+        or None if the offer fails. """
+
+        per_frame = (self.config.DATA_SIZE - len(const.OFFER_TAG) - const.PAGE_NUM_SIZE) // const.CHUNK_HASH_SIZE
+        known = set()
+        for index in range(0, len(hashes), per_frame):
+            offered = hashes[index:index + per_frame]
+            reply = yield from self.request(const.OFFER_TAG, index, b''.join(offered), patient=(index == 0))
+            if not reply:
+                return None
+            for position, digest in enumerate(offered):
+                if reply[0] & (1 << position):
+                    known.add(digest)
+        return known
+
+    def query_signatures(self):
+        """ Asks the receiver for the signatures of the blocks of the file
+        it received in the previous execution (the basis).
+        Returns the list of signatures, or None if the query fails. """
+
+        reply = yield from self.request(const.BASIS_TAG, 0, patient=True)
+        if reply is None:
+            return None
+        blocks = int.from_bytes(reply[:const.CHUNK_COUNT_SIZE], byteorder='big') // self.config.DELTA_BLOCK_SIZE
+        per_frame = (self.config.DATA_SIZE - const.PAGE_NUM_SIZE) // const.SIGNATURE_SIZE
+        signatures = list()
+        for index in range(0, blocks, per_frame):
+            reply = yield from self.request(const.SIGNATURE_TAG, index)
+            if reply is None:
+                return None
+            signatures.extend(reply[pos:pos + const.SIGNATURE_SIZE]
+                              for pos in range(0, len(reply), const.SIGNATURE_SIZE))
+        return signatures[:blocks]
 
-        # Read file
-        util.compress_file(self.config)
+    def rendezvous(self):
+        """ Surveys the channels and agrees with the receiver on the two
+        cleanest ones (see src/channels.py). After moving, a confirmation is
+        sent on the new channels; if it fails both ends go back to the
+        channels of the configuration and the rendezvous starts again. """
+
+        occupancy = channels.survey(self.receiver, self.config.SCAN_SWEEPS)
+        candidates = channels.candidates(occupancy, self.config.ALLOWED_CHANNELS)
+        while True:
+            reply = yield from self.request(const.CHANNEL_TAG, 0, candidates, patient=True)
+            if reply is None or len(reply) < 2:
+                print("Wrong rendezvous reply, using the default channels")
+                return
+            data_channel, ack_channel = reply[0], reply[1]
+            channels.set_channels(self.sender, self.receiver, data_channel, ack_channel)
+            confirmation = yield from self.request(const.CHANNEL_TAG, 1)
+            if confirmation is not None:
+                print("Using channels " + str(data_channel) + " (data) and " + str(ack_channel) + " (ACK)")
+                return
+            print("Rendezvous failed, back to the default channels")
+            channels.set_channels(self.sender, self.receiver, self.config.SENDER_CHANNEL,
+                                  self.config.RECEIVER_CHANNEL)
+
+    def prepare_file(self):
+        """ Builds IN_FILEPATH_COMPRESSED, the file that is transmitted.
+        Returns (codec, flags), or None if it fails. """
+
+        flags = 0
+        if self.config.BATCH_MODE:
+            start = phases.start()
+            compressed = util.compress_batch(self.config)
+            phases.stop(phases.COMPRESS, start)
+            if not compressed:
+                return None
+            return "batch", flags
+
+        # The preset dictionary is only used if the receiver has the same one
+        dictionary = False
+        if util.dictionary_id() is not None and self.config.CODEC in ("auto", "zlib-dict"):
+            reply = yield from self.request(const.DICTIONARY_TAG, 0, patient=True)
+            if reply is None:
+                return None
+            dictionary = reply == util.dictionary_id()
+            if not dictionary:
+                print("The receiver does not have the compression dictionary, zlib-dict is not used")
+
+        raw_file_path = self.config.IN_FILEPATH_RAW
+        signatures = None
+        if self.config.DELTA:
+            signatures = yield from self.query_signatures()
+            if signatures is None:
+                return None
+        if signatures:
+            # Only the differences with the file of the previous execution are sent
+            with open(raw_file_path, 'rb') as f:
+                data = f.read()
+            operations = delta.compute_delta(data, signatures, self.config.DELTA_BLOCK_SIZE)
+            raw_file_path = self.container_path(const.DELTA_EXTENSION)
+            delta.build_container(data, operations, raw_file_path)
+            flags = flags | const.FLAG_DELTA
+        elif self.config.DEDUP and os.path.getsize(raw_file_path) > self.config.DEDUP_MAX_SIZE:
+            print("File too big for dedup, the whole file is sent")
+        elif self.config.DEDUP:
+            # Only the chunks that the receiver does not have are sent
+            data, chunks = dedup.chunk_file(raw_file_path)
+            hashes = list(dict.fromkeys(digest for start, end, digest in chunks))
+            known = yield from self.offer_chunks(hashes)
+            if known is None:
+                return None
+            raw_file_path = self.container_path(const.DEDUP_EXTENSION)
+            dedup.build_container(data, chunks, known, raw_file_path)
+            flags = flags | const.FLAG_DEDUP
+
+        try:
+            compressed = self.compress(raw_file_path, dictionary)
+            if compressed is None:
+                return None
+            codec, codec_flags = compressed
+            return codec, flags | codec_flags
+        finally:
+            if raw_file_path != self.config.IN_FILEPATH_RAW:
+                os.remove(raw_file_path)
+
+    def container_path(self, extension):
+        """ Path of the delta or dedup container of the input file. It is
+        kept out of IN_PATH_RAW, where the batch mode would pick it up """
+
+        return os.path.join(self.config.IN_PATH_COMPRESSED,
+                            os.path.basename(self.config.IN_FILEPATH_RAW) + extension)
+
+    def compress(self, raw_file_path, dictionary=False):
+        """ Compresses raw_file_path into IN_FILEPATH_COMPRESSED with the
+        codec of the configuration. zlib-dict is replaced by zlib unless
+        dictionary (the receiver has the same preset dictionary).
+        Returns (codec, flags), or None if it fails. """
+
+        start = phases.start()
+        codec = self.config.CODEC
+        level = self.config.COMPRESSION_LEVEL
+        if codec == "auto":
+            codec, level = util.select_codec(self.config, raw_file_path)
+        flags = 0
+        if codec == "zlib-dict":
+            if dictionary:
+                flags = const.FLAG_DICTIONARY
+            else:
+                codec = "zlib"
+        if util.use_blocks(self.config, codec, raw_file_path):
+            compressed = util.compress_blocks(self.config, codec, level, raw_file_path)
+            codec = "blocks"
+        else:
+            compressed = util.compress_file(self.config, codec, level, raw_file_path)
+        phases.stop(phases.COMPRESS, start)
+        if not compressed:
+            print("ERROR when compressing the file with " + codec)
+            return None
+        return codec, flags
+
+    def send_chunks(self, payload_list, bitmap):
+        """ Protocol steps that send the chunks the receiver does not have
+        (bitmap, or None), one frame at a time. Returns True if success """
+
+        for index, payload in enumerate(payload_list):
+            seq_num = index + 2
+            if bitmap is not None and util.bitmap_has(bitmap, index):
+                continue
+            ack = yield payload, seq_num, False
+            while ack is not None and ack != b'ACK':
+                print("        Unknown error when transmitting packet number " + str(seq_num))
+                ack = yield payload, seq_num, False
+            if ack is None:
+                return False
+            print("Packet number " + str(seq_num) + " transmitted successfully")
+        return True
+
+    def transmission(self):
+        """ Protocol steps of the whole transmission. Returns True if success """
+
+        # Move to the cleanest channels, and hop from them
+        self.hopper = None
+        if self.config.CHANNEL_SCAN:
+            yield from self.rendezvous()
+        if self.config.HOPPING:
+            self.start_hopping()
+
+        # Compress and read file
+        prepared = yield from self.prepare_file()
+        if prepared is None:
+            return False
+        codec, flags = prepared
         payload_list = util.read_file(self.config, self.config.IN_FILEPATH_COMPRESSED)
+        if not payload_list:
+            return False
 
-        # Initialize loop variables and functions
-        self.receiver.startListening()
-        tx_success = False
-        seq_num = 1
+        # The first frame announces the file size, so that the receiver can preallocate the output,
+        # the session id, so that it can resume a reception that was interrupted, and the codec
+        file_size = os.path.getsize(self.config.IN_FILEPATH_COMPRESSED)
+        header = util.build_header(file_size, util.file_id(self.config.IN_FILEPATH_COMPRESSED), codec, flags)
+
+        # Send header, waiting for the receiver to be ready
+        ack = yield header, 1, True
+        print("Header transmitted successfully")
+
+        # Ask which chunks are already there
+        bitmap = None
+        if ack == b'RESUME':
+            bitmap = yield from self.query_bitmap(len(payload_list))
+            if bitmap is None:
+                return False
+            print("Resuming session")
 
         # Send file
-        while not tx_success:
-            # Sending payload
-            for payload in payload_list:
-                retransmit = True
-                attempt = 0
-                while retransmit:
-                    util.send_packet(self.sender, self.build_frame(payload, seq_num))
-                    attempt = attempt + 1
-                    rx_buffer = []
-                    if self.wait_for_ack(self.receiver):
-                        self.receiver.read(rx_buffer, self.receiver.getDynamicPayloadSize())
-                        crc = rx_buffer[:self.config.CRC_SIZE]
-                        seq = int.from_bytes(
-                            rx_buffer[self.config.CRC_SIZE:self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE],
-                            byteorder='big')
-                        ack = rx_buffer[self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE:]
-                        seq_ack = rx_buffer[self.config.CRC_SIZE:]
-                        if util.check_crc(crc, seq_ack):
-                            if seq == seq_num:
-                                if bytes(ack) == b'ACK':
-                                    retransmit = False
-                                    print("Packet number " + str(seq_num) + " transmitted successfully")
-                                    seq_num = seq_num + 1
-                                elif bytes(ack) == b'ERROR':
-                                    print("        Packet number " + str(seq_num) + " transmitted incorrectly")
-                                else:
-                                    print("        Unknown error when transmitting packet number " + str(seq_num))
-                            else:
-                                print("        Received Out of Order ACK. Received: " + str(seq) + " Expecting: " + str(seq_num))
-                        else:
-                            print("        Received incorrect ACK number " + str(seq_num))
-                    else:
-                        if not (seq_num == 1 and attempt != 1):
-                            print("    Attempt " + str(attempt) + " to retransmit packet number " + str(seq_num))
-
-                    if attempt > 1000 and seq_num > 1:
-                        print("Transmission ended after trying to retransmit for more than 1000 times")
-                        return False
-
-            retransmit_final = True
-            attempt_final = 0
-            while retransmit_final:
-                util.send_packet(self.sender, self.build_frame(b'ENDOFTRANSMISSION', seq_num))
-                attempt_final = attempt_final + 1
-                rx_buffer = []
-                if self.wait_for_ack(self.receiver):
-                    self.receiver.read(rx_buffer, self.receiver.getDynamicPayloadSize())
-                    crc = rx_buffer[:self.config.CRC_SIZE]
-                    seq = int.from_bytes(
-                        rx_buffer[self.config.CRC_SIZE:self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE],
-                        byteorder='big')
-                    ack = rx_buffer[self.config.CRC_SIZE + self.config.SEQ_NUM_SIZE:]
-                    seq_ack = rx_buffer[self.config.CRC_SIZE:]
-                    if util.check_crc(crc, seq_ack) and seq == seq_num:
-                        if bytes(ack) == b'ACK':
-                            retransmit_final = False
-                            tx_success = True
-                            print("TRANSMISSION SUCCESSFUL")
-                else:
-                    print("    Attempt " + str(attempt_final) + " to retransmit FINAL packet")
-                    if attempt_final > 1000:
-                        print("Program ended after failing to transmit the EOT message")
-                        return False
+        try:
+            sent = yield from self.send_chunks(payload_list, bitmap)
+        finally:
+            payload_list.close()
+        if not sent:
+            return False
+
+        # Send EOT
+        final_seq_num = len(payload_list) + 2
+        ack = yield b'ENDOFTRANSMISSION', final_seq_num, False
+        if ack != b'ACK':
+            print("Program ended after failing to transmit the EOT message")
+            return False
+        print("TRANSMISSION SUCCESSFUL")
 
         # Return true if success
         return True
+
+    def transmit(self):
+        """ This main function initializes the radios and sends
+        all the data gathered from the file. """
+
+        self.receiver.startListening()
+        return self.run(self.transmission())
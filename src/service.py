@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+#
+# Long running service: the radios, the senders/receivers and the codec
+# dictionary are initialized once and kept warm, and transfers are jobs
+# started from the front panel (GO) or from a local Unix socket
+# Usage: python3 -m src.service serve
+#        python3 -m src.service <tx|rx> [srm|burst] [file]
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import threading
+import types
+import RPi.GPIO as GPIO
+
+from src import util
+from src import channels
+from src import phases
+from src import realtime
+from src.sender import Sender
+from src.receiver import Receiver
+from src.multicast import MulticastSender, MulticastReceiver
+from src.burst import BurstSender, BurstReceiver
+from GPIO_Manager import GPIOManager
+from conf import conf_srm_receiver, conf_srm_sender
+from conf import conf_burst_receiver, conf_burst_sender
+from conf import pins
+from const import mode, role, const
+
+
+# Configuration of each (role, mode) of the service
+CONFIGS = {
+    (role.TX, mode.SRM): conf_srm_sender,
+    (role.RX, mode.SRM): conf_srm_receiver,
+    (role.TX, mode.BURST): conf_burst_sender,
+    (role.RX, mode.BURST): conf_burst_receiver,
+}
+
+
+class Service(object):
+    def __init__(self):
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        GPIO.setup(pins.SW_ROLE, GPIO.IN)
+        GPIO.setup(pins.SW_MODE, GPIO.IN)
+        GPIO.setup(pins.BTN_GO, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.setup(pins.LED_WAIT, GPIO.OUT, initial=GPIO.LOW)
+        GPIO.setup(pins.LED_PROCESS, GPIO.OUT, initial=GPIO.LOW)
+        GPIO.setup(pins.LED_SUCCESS, GPIO.OUT, initial=GPIO.LOW)
+
+        self.leds = GPIOManager()
+        self.jobs = queue.Queue()
+        self.devices = dict()
+        self.radio_key = None
+        self.busy = False
+
+    ################
+    #    DEVICES   #
+    ################
+
+    def panel_job(self):
+        """ Job selected by the switches of the front panel, or None for the NM """
+
+        job_role = role.RX if GPIO.input(pins.SW_ROLE) == 0 else role.TX
+        if GPIO.input(pins.SW_MODE) != 0:
+            print("NM is not run by the service")
+            return None
+        return {"role": job_role, "mode": mode.SRM}
+
+    def get_device(self, job_role, job_mode):
+        """ Sender or receiver of the (role, mode). The device is created once,
+        the radios are shared by all of them and only get the registers of
+        this configuration written again if the previous job used another
+        one (see util.fast_initialize_radio). """
+
+        key = (job_role, job_mode)
+        config = CONFIGS[key]
+        device = self.devices.get(key)
+        if device is not None and self.radio_key == key:
+            # The radios keep the registers of the previous job, the transfer may have moved their channels
+            channels.set_channels(device.sender, device.receiver, config.SENDER_CHANNEL, config.RECEIVER_CHANNEL)
+            device.config = config
+            return device
+
+        sender = util.initialize_radios(config.SENDER_CE, config.SENDER_CSN, config.SENDER_CHANNEL, config)
+        sender.openWritingPipe(config.SENDER_PIPE)
+        receiver = util.initialize_radios(config.RECEIVER_CE, config.RECEIVER_CSN, config.RECEIVER_CHANNEL, config)
+        receiver.openReadingPipe(0, config.RECEIVER_PIPE)
+        self.radio_key = key
+
+        if device is None:
+            if job_role == role.TX:
+                device_class = MulticastSender if config.MULTICAST else BurstSender if config.BURST else Sender
+            else:
+                device_class = MulticastReceiver if config.MULTICAST else BurstReceiver if config.BURST else Receiver
+            device = device_class(config, sender, receiver)
+            self.devices[key] = device
+        device.config = config
+        device.sender = sender
+        device.receiver = receiver
+        return device
+
+    def job_config(self, config, job):
+        """ Copy of the configuration with the file of the job, if there is one.
+        The file has to be inside IN_PATH_RAW (TX) or OUT_PATH_RAW (RX):
+        returns None if it is not. """
+
+        if not job.get("file"):
+            return config
+        root = os.path.realpath(config.IN_PATH_RAW if job["role"] == role.TX else config.OUT_PATH_RAW)
+        if not isinstance(job["file"], str):
+            return None
+        file_path = os.path.realpath(job["file"])
+        if not file_path.startswith(root + os.sep):
+            return None
+        job_config = types.SimpleNamespace(**{name: getattr(config, name) for name in dir(config) if name.isupper()})
+        if job["role"] == role.TX:
+            job_config.IN_FILEPATH_RAW = file_path
+        else:
+            job_config.OUT_FILEPATH_RAW = file_path
+        return job_config
+
+    ##############
+    #    JOBS    #
+    ##############
+
+    def go_pushed(self):
+        """ GO listener (thread of RPi.GPIO): starts a job if the service is idle """
+
+        if not self.busy:
+            job = self.panel_job()
+            if job is not None:
+                self.jobs.put((job, None))
+
+    def run_job(self, job):
+        """ Runs one transfer with the warm device. Returns the result sent to the client """
+
+        if (job.get("role"), job.get("mode")) not in CONFIGS:
+            return {"success": False, "error": "unknown role or mode"}
+        config = CONFIGS[(job["role"], job["mode"])]
+        if config.BURST and config.ASYNC_CORE:
+            return {"success": False, "error": "BURST does not run on the asyncio core"}
+
+        job_config = self.job_config(config, job)
+        if job_config is None:
+            return {"success": False, "error": "file out of the input or output directory"}
+
+        start_time = time.time()
+        self.leds.leds_off()
+        device = self.get_device(job["role"], job["mode"])
+        device.config = job_config
+        util.clear_outputs(device.config)
+
+        self.leds.blink(pins.LED_PROCESS, const.PROCESS_BLINK_PERIOD)
+        phases.begin(device.config)
+        realtime.begin_transfer(device.config)
+        try:
+            if job["role"] == role.TX:
+                success = device.transmit()
+            else:
+                success = device.receive()
+        except Exception as e:
+            print("ERROR in the job: " + str(e))
+            success = False
+        finally:
+            realtime.end_transfer(device.config)
+            phases.end(device.config, job["role"].upper() + " " + (job.get("file") or job["mode"]))
+        self.leds.set_leds(const.CODE_SUCCESS if success else const.CODE_ERROR)
+        return {"success": bool(success), "time": time.time() - start_time}
+
+    def serve_socket(self, server):
+        """ Accepts the jobs of the clients of the Unix socket, one JSON line each """
+
+        while True:
+            connection, address = server.accept()
+            threading.Thread(target=self.serve_client, args=(connection,), daemon=True).start()
+
+    def serve_client(self, connection):
+        with connection:
+            try:
+                job = json.loads(connection.makefile('r').readline())
+            except ValueError:
+                job = None
+            if not isinstance(job, dict):
+                connection.sendall(b'{"success": false, "error": "bad request"}\n')
+                return
+            done = queue.Queue()
+            self.jobs.put((job, done))
+            connection.sendall((json.dumps(done.get()) + "\n").encode())
+
+    def serve(self):
+        # Warm the device of the current position of the switches
+        job = self.panel_job()
+        config = conf_srm_receiver
+        if job is not None:
+            config = self.get_device(job["role"], job["mode"]).config
+        # The jobs run on this thread, the radio loop. The real-time options
+        # are applied once, with the configuration of the switches at start-up
+        realtime.setup(config)
+
+        if os.path.exists(const.SERVICE_SOCKET):
+            os.remove(const.SERVICE_SOCKET)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(const.SERVICE_SOCKET)
+        # Only the user of the service can send jobs, before any client can connect
+        os.chmod(const.SERVICE_SOCKET, 0o600)
+        server.listen(1)
+        threading.Thread(target=self.serve_socket, args=(server,), daemon=True).start()
+
+        self.leds.add_go_listener(self.go_pushed)
+        self.leds.blink(pins.LED_WAIT, const.WAIT_BLINK_PERIOD)
+        print("Service ready, waiting for jobs...")
+        while True:
+            job, done = self.jobs.get()
+            self.busy = True
+            print("Job started: " + json.dumps(job))
+            result = self.run_job(job)
+            print("Job ended: " + json.dumps(result))
+            self.busy = False
+            if done is not None:
+                done.put(result)
+
+
+def request_job(job):
+    """ Sends a job to the service and waits for its result """
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(const.SERVICE_SOCKET)
+    with client:
+        client.sendall((json.dumps(job) + "\n").encode())
+        return json.loads(client.makefile('r').readline())
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python3 -m src.service serve | <tx|rx> [srm|burst] [file]")
+        return
+    if sys.argv[1] == "serve":
+        Service().serve()
+    else:
+        job = {"role": sys.argv[1], "mode": sys.argv[2] if len(sys.argv) > 2 else mode.SRM}
+        if len(sys.argv) > 3:
+            job["file"] = os.path.abspath(sys.argv[3])
+        print(request_job(job))
+
+
+if __name__ == '__main__':
+    main()
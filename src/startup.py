@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+#
+# Start-up profile of main.py: time spent in each phase (imports, GPIO,
+# radios, devices) until the program is ready for the GO
+# Enabled with: python3 main.py --profile-startup
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import sys
+import time
+
+
+ENABLED = "--profile-startup" in sys.argv
+
+# main.py imports this module first, so the profile starts with it
+START_TIME = time.perf_counter()
+LAST_TIME = START_TIME
+PHASES = list()
+
+
+def mark(name):
+    """ Ends the current phase of the start-up, named name """
+
+    global LAST_TIME
+    now = time.perf_counter()
+    PHASES.append((name, now - LAST_TIME))
+    LAST_TIME = now
+
+
+def restart():
+    """ Starts profiling again, for the next execution """
+
+    global LAST_TIME
+    del PHASES[:]
+    LAST_TIME = time.perf_counter()
+
+
+def report():
+    """ Prints the phases marked so far (if enabled) """
+
+    if ENABLED and PHASES:
+        print("Start-up profile:")
+        total = 0
+        for name, elapsed in PHASES:
+            total = total + elapsed
+            print("    {0:<24} {1:8.1f} ms {2:8.1f} ms".format(name, elapsed * 1000, total * 1000))
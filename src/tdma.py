@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+#
+# Slotted TDMA for the Network Mode: time is divided in superframes of a
+# beacon slot and one slot per node address, and every node only transmits
+# in its own slot, following the beacons of the node with the lowest address
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import time
+import collections
+from const import const
+
+
+class TDMA(object):
+    """ TDMA schedule of one node. It does not use the radio directly:
+    frames are sent with transmit(frame) and the frames received by the
+    node are given to receive, so that it works with both radio libraries
+    (lib_nrf24 and RF24 of the NM) and with simulated nodes (see the
+    "tdma" benchmark).
+
+    Superframe: slot 0 for the beacon and slot address + 1 for each node.
+    Frames: TDMA_BEACON + master address + superframe number + delay of the
+    beacon in the slot (us), or TDMA_DATA + source address + payload.
+
+    The beacons of the master anchor the superframes of the other nodes.
+    A node that hears no beacons for TDMA_SYNC_TIMEOUT superframes (plus
+    one slot per address, so that the lowest address goes first) becomes
+    the master, and a master that hears the beacon of a lower address
+    follows it. """
+
+    def __init__(self, address, transmit, nodes=const.TDMA_NODES, slot_time=const.TDMA_SLOT_TIME,
+                 clock=time.time):
+        self.address = address
+        self.transmit = transmit
+        self.nodes = nodes
+        self.slot_time = slot_time
+        self.superframe_time = (nodes + 1) * slot_time
+        self.clock = clock
+        self.start_time = None  # Start of superframe 0
+        self.master = None
+        self.last_beacon = clock()
+        self.beacon_sent = None
+        self.queue = collections.deque()
+
+    @staticmethod
+    def from_team_configuration(team_configuration, transmit):
+        return TDMA(team_configuration.address, transmit)
+
+    def send(self, payload):
+        """ Queues the payload (up to 30 bytes) for the next slot of the node """
+
+        self.queue.append(bytes(payload))
+
+    def position(self, now):
+        """ (superframe, slot, time since the start of the slot) """
+
+        elapsed = now - self.start_time
+        superframe = int(elapsed // self.superframe_time)
+        offset = elapsed - superframe * self.superframe_time
+        slot = int(offset // self.slot_time)
+        return superframe, slot, offset - slot * self.slot_time
+
+    def own_slot(self):
+        return self.address % self.nodes + 1
+
+    def check_master(self, now):
+        timeout = const.TDMA_SYNC_TIMEOUT * self.superframe_time + self.address * self.slot_time
+        if self.master != self.address and now - self.last_beacon > timeout:
+            print("No TDMA beacons, node " + str(self.address) + " is the master")
+            self.master = self.address
+            self.start_time = now
+            self.beacon_sent = None
+
+    def step(self):
+        """ Called in the loop of the node, as often as possible: sends the
+        beacon at the start of the superframe (master) or the next queued
+        frame if there is time for it in the own slot (so the queue is sent
+        in a burst). Returns True if a frame was sent. """
+
+        now = self.clock()
+        self.check_master(now)
+        if self.start_time is None:
+            return False
+        superframe, slot, offset = self.position(now)
+        if slot == 0 and self.master == self.address and superframe != self.beacon_sent:
+            self.beacon_sent = superframe
+            self.transmit(const.TDMA_BEACON + bytes([self.address]) +
+                          (superframe % 65536).to_bytes(2, byteorder='big') +
+                          int(offset * 1000000).to_bytes(2, byteorder='big'))
+            return True
+        if slot == self.own_slot() and self.queue and \
+                offset + const.TDMA_FRAME_TIME <= self.slot_time - const.TDMA_GUARD_TIME:
+            self.transmit(const.TDMA_DATA + bytes([self.address]) + self.queue.popleft())
+            return True
+        return False
+
+    def next_event(self):
+        """ Seconds until the node has to transmit again (its slot or the
+        beacon), the loop can listen (or sleep) until then """
+
+        now = self.clock()
+        if self.start_time is None:
+            return max(0.0, self.last_beacon + const.TDMA_SYNC_TIMEOUT * self.superframe_time - now)
+        superframe, slot, offset = self.position(now)
+        slot_start = now - offset
+        if slot == self.own_slot() and self.queue or \
+                slot == 0 and self.master == self.address and superframe != self.beacon_sent:
+            return 0.0
+        slots = [self.own_slot()] if self.queue else []
+        if self.master == self.address:
+            slots.append(0)
+        if not slots:
+            return self.superframe_time
+        return min(((target - slot - 1) % (self.nodes + 1) + 1) * self.slot_time for target in slots) - \
+            (now - slot_start)
+
+    def receive(self, frame, rx_time=None):
+        """ Processes a received frame. Returns (source address, payload)
+        of a data frame, or None """
+
+        frame = bytes(frame)
+        rx_time = self.clock() if rx_time is None else rx_time
+        if frame[:1] == const.TDMA_BEACON and len(frame) >= 6:
+            master = frame[1]
+            if self.master is None or master <= self.master:
+                superframe = int.from_bytes(frame[2:4], byteorder='big')
+                delay = int.from_bytes(frame[4:6], byteorder='big') / 1000000
+                if self.master != master:
+                    print("Following the TDMA beacons of node " + str(master))
+                self.master = master
+                self.last_beacon = rx_time
+                self.start_time = rx_time - const.TDMA_BEACON_DELAY - delay - superframe * self.superframe_time
+            return None
+        if frame[:1] == const.TDMA_DATA and len(frame) >= 2:
+            return frame[1], frame[2:]
+        return None
@@ -4,6 +4,17 @@ import spidev
 import time
 import os
 import crc16
+import mmap
+import json
+import shlex
+import shutil
+import tempfile
+import hashlib
+import zlib
+import importlib
+import math
+from collections import Counter
+from const import const
 from subprocess import check_output, STDOUT, CalledProcessError
 
 
@@ -18,6 +29,12 @@ def initialize_radios(csn, ce, channel, config):
     It gets 3 arguments, csn = Chip Select, ce = Chip Enable
     and the channel that will be used to transmit or receive the data."""
 
+    if config.FAST_RADIO_INIT:
+        radio = fast_initialize_radio(csn, ce, channel, config)
+        if radio is not None:
+            return attach_capture(radio, config)
+        print("Fast initialization of the radio failed, using the full one")
+
     radio = NRF24(GPIO, spidev.SpiDev())
     radio.begin(csn, ce)
     time.sleep(1)
@@ -31,13 +48,87 @@ def initialize_radios(csn, ce, channel, config):
     radio.enableDynamicPayloads()
     radio.enableAckPayload()
 
+    return attach_capture(radio, config)
+
+
+def attach_capture(radio, config):
+    """ Both radios record their frames in the capture of the configuration
+    (src/capture.py). The radios reused from a previous execution stop
+    recording if it is disabled. """
+
+    radio.capture = None
+    if config.CAPTURE:
+        from src import capture
+        radio.capture = capture.open_capture(config)
+    return radio
+
+
+# Radios configured by fast_initialize_radio, by (csn, ce), reused between executions
+RADIOS = dict()
+
+
+def radio_profile(channel, config):
+    """ Register values that begin and initialize_radios leave in the radio:
+    16 bit CRC, 15 retries of 4 ms, no auto ACK, dynamic and ACK payloads. """
+
+    rf_setup = 1  # LNA gain (reset value)
+    if config.BITRATE == NRF24.BR_2MBPS:
+        rf_setup = rf_setup | (1 << NRF24.RF_DR_HIGH)
+    elif config.BITRATE == NRF24.BR_250KBPS:
+        rf_setup = rf_setup | (1 << NRF24.RF_DR_LOW)
+    rf_setup = rf_setup | ({NRF24.PA_MIN: 0, NRF24.PA_LOW: 2, NRF24.PA_HIGH: 4}.get(config.POWER, 6))
+
+    return [
+        (NRF24.CONFIG, (1 << NRF24.EN_CRC) | (1 << NRF24.CRCO)),
+        (NRF24.EN_AA, 0),
+        (NRF24.SETUP_RETR, 0xff),
+        (NRF24.RF_CH, min(max(0, channel), NRF24.MAX_CHANNEL)),
+        (NRF24.RF_SETUP, rf_setup),
+        (NRF24.FEATURE, (1 << NRF24.EN_DPL) | (1 << NRF24.EN_ACK_PAY)),
+        (NRF24.DYNPD, 0x3f),
+    ]
+
+
+def fast_initialize_radio(csn, ce, channel, config):
+    """ Initializes the radio polling for the chip instead of sleeping and
+    writing the whole register profile at once, then verifies it with one
+    readback. A radio that still has the profile from a previous execution
+    is reused as it is. Returns None if the radio does not get the profile. """
+
+    profile = radio_profile(channel, config)
+    radio = RADIOS.get((csn, ce))
+    if radio is not None and radio.check_profile(profile):
+        radio.stopListening()
+        return radio
+
+    if radio is None:
+        radio = NRF24(GPIO, spidev.SpiDev())
+        radio.open(csn, ce)
+        if not radio.wait_ready(const.RADIO_READY_TIMEOUT):
+            radio.end()
+            return None
+    radio.write_profile(profile)
+    if not radio.check_profile(profile):
+        radio.end()
+        RADIOS.pop((csn, ce), None)
+        return None
+
+    radio.channel = channel
+    radio.wide_band = config.BITRATE == NRF24.BR_2MBPS
+    radio.setPayloadSize(32)
+    radio.dynamic_payloads_enabled = True
+    RADIOS[(csn, ce)] = radio
     return radio
 
 
 def send_packet(sender, payload):
     """ Send the packet through the sender radio. """
 
+    from src import phases
+
+    start = phases.start()
     sender.write(payload)
+    phases.stop(phases.SPI_WRITE, start)
 
 
 #######################
@@ -57,9 +148,13 @@ def calculate_crc(config, payload):
 def check_crc(crc, seq_payload):
     """ Function that checks the CRC and returns the result """
 
+    from src import phases
+
+    start = phases.start()
     crc_int = int.from_bytes(bytes(crc), 'big')
 
     crc_payload = crc16.crc16xmodem(bytes(seq_payload))
+    phases.stop(phases.CRC_CHECK, start)
 
     if crc_int == crc_payload:
         return True
@@ -71,24 +166,73 @@ def check_crc(crc, seq_payload):
 #    FILE I/O UTILS    #
 ########################
 
+class ChunkView(object):
+    """ Read-only view of a file split in chunks of chunk_size bytes.
+
+    The file is memory mapped, so no copy of the data is made: indexing
+    returns a memoryview slice of the mapping and len() is the number of
+    chunks. It can be used anywhere a payload_list was used before. """
+
+    def __init__(self, file_path, chunk_size):
+        self.chunk_size = chunk_size
+        self.file_size = os.path.getsize(file_path)
+        if self.file_size > 0:
+            with open(file_path, 'rb') as f:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # Empty files can not be mapped
+            self.buffer = b''
+        self.view = memoryview(self.buffer)
+
+    def __len__(self):
+        return (self.file_size + self.chunk_size - 1) // self.chunk_size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index = index + len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("chunk index out of range")
+        start = index * self.chunk_size
+        return self.view[start:start + self.chunk_size]
+
+    def __iter__(self):
+        for start in range(0, self.file_size, self.chunk_size):
+            yield self.view[start:start + self.chunk_size]
+
+    def close(self):
+        """ Unmaps the file. If a chunk is still referenced somewhere, the
+        mapping is closed when that chunk is freed. """
+
+        self.view.release()
+        if isinstance(self.buffer, mmap.mmap):
+            try:
+                self.buffer.close()
+            except BufferError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def read_file(config, file_path):
-    """ Gets the provided file and reads its content as bytes,
-    after that, it stores everything in the variable payload_list,
-    which it returns. """
+    """ Gets the provided file and maps it in memory,
+    returning a ChunkView that can be used as the payload_list
+    (indexed and iterated by chunks of DATA_SIZE bytes). """
 
+    from src import phases
+
+    start = phases.start()
     payload_list = list()
 
     if os.path.isfile(file_path):
         print("Loading File in: " + file_path)
-        with open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(config.DATA_SIZE)
-                if chunk:
-                    payload_list.append(chunk)
-                else:
-                    break
+        payload_list = ChunkView(file_path, config.DATA_SIZE)
     else:
         print("ERROR: file does not exist in PATH: " + file_path)
+    phases.stop(phases.READ_FILE, start)
 
     print("Length of the file in chunks: " + str(len(payload_list)))
 
@@ -103,28 +247,763 @@ def write_file(file_path, payload_list):
             f.write(chunk)
 
 
-def compress_file(config):
-    command = "7z a -mx=" + str(config.COMPRESSION_LEVEL) + " " + \
-              config.IN_FILEPATH_COMPRESSED + " " + config.IN_FILEPATH_RAW
-    result = check_output(command, stderr=STDOUT, shell=True)
-    ok_string = b'Everything is Ok'
-    if ok_string in result:
+class FileWriter(object):
+    """ Writes every received chunk directly at its offset in the output
+    file. The file is preallocated with the size announced in the header
+    frame, so it is complete as soon as the last chunk is written and
+    no chunks are kept in memory. """
+
+    def __init__(self, file_path, file_size, chunk_size, resume=False):
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        flags = os.O_RDWR | os.O_CREAT
+        if not resume:
+            flags = flags | os.O_TRUNC
+        self.fd = os.open(file_path, flags, 0o644)
+        os.ftruncate(self.fd, file_size)
+
+    def write(self, index, chunk):
+        """ Write the chunk number index (starting at 0) """
+
+        os.pwrite(self.fd, chunk, index * self.chunk_size)
+
+    def sync(self):
+        os.fsync(self.fd)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class ReceiveSession(object):
+    """ Keeps a bitmap of the chunks received for a file, identified by
+    its session id, in a state file next to the partial output. If the
+    receiver restarts in the middle of a transfer, the session is loaded
+    again and only the missing chunks have to be sent.
+
+    State file: session id + file size + bitmap (bit i = chunk i). """
+
+    def __init__(self, file_path, session_id, file_size, chunk_size):
+        self.state_path = file_path + const.SESSION_EXTENSION
+        self.session_id = session_id
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.chunks = (file_size + chunk_size - 1) // chunk_size
+        self.bitmap = bytearray((self.chunks + 7) // 8)
+        self.received = 0
+        self.pending = 0
+        self.resumed = self.load() and os.path.isfile(file_path)
+        if not self.resumed:
+            self.bitmap = bytearray(len(self.bitmap))
+            self.received = 0
+        self.writer = FileWriter(file_path, file_size, chunk_size, resume=self.resumed)
+        self.save()
+
+    def header(self):
+        return self.session_id.to_bytes(const.SESSION_ID_SIZE, byteorder='big') + \
+            self.file_size.to_bytes(const.FILE_SIZE_SIZE, byteorder='big')
+
+    def load(self):
+        """ Loads the bitmap of a previous execution, if it is for the same file """
+
+        try:
+            with open(self.state_path, 'rb') as f:
+                state = f.read()
+        except IOError:
+            return False
+        header = self.header()
+        if not state.startswith(header) or len(state) != len(header) + len(self.bitmap):
+            return False
+        self.bitmap = bytearray(state[len(header):])
+        self.received = sum(bin(byte).count("1") for byte in self.bitmap)
         return True
+
+    def save(self):
+        """ Persists the bitmap. The data is synced first, so that a chunk
+        is never marked as received before it is on disk. """
+
+        self.writer.sync()
+        with open(self.state_path, 'wb') as f:
+            f.write(self.header() + self.bitmap)
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending = 0
+
+    def has(self, index):
+        return bitmap_has(self.bitmap, index)
+
+    def add(self, index, chunk):
+        """ Stores the chunk and marks it as received """
+
+        from src import phases
+
+        if index >= self.chunks or self.has(index):
+            return
+        start = phases.start()
+        self.writer.write(index, chunk)
+        self.bitmap[index // 8] |= 1 << (index % 8)
+        self.received = self.received + 1
+        self.pending = self.pending + 1
+        if self.pending >= const.SESSION_SYNC_INTERVAL:
+            self.save()
+        phases.stop(phases.FILE_WRITE, start)
+
+    def is_complete(self):
+        return self.received == self.chunks
+
+    def page(self, page_num, page_size):
+        """ Returns page_size bytes of the bitmap, starting at page page_num """
+
+        return bytes(self.bitmap[page_num * page_size:(page_num + 1) * page_size])
+
+    def close(self):
+        self.save()
+        self.writer.close()
+
+    def remove(self):
+        """ Deletes the state file once the file has been received """
+
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+
+
+def file_md5(file_path):
+    """ Returns the md5 object of the content of a file, read by blocks """
+
+    file_hash = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(65536)
+            if block:
+                file_hash.update(block)
+            else:
+                break
+    return file_hash
+
+
+def file_id(file_path):
+    """ Returns the session id of a file: the first bytes of its md5 """
+
+    return int.from_bytes(file_md5(file_path).digest()[:const.SESSION_ID_SIZE], byteorder='big')
+
+
+def build_header(file_size, session_id, codec, flags=0):
+    """ Builds the payload of the header frame, that announces the size
+    of the file, its session id, the codec used to compress it and the
+    flags (const.FLAG_*) before the data frames are sent. With
+    FLAG_DICTIONARY it ends with the id of the preset dictionary. """
+
+    header = const.HEADER_TAG + file_size.to_bytes(const.FILE_SIZE_SIZE, byteorder='big') + \
+        session_id.to_bytes(const.SESSION_ID_SIZE, byteorder='big') + bytes([const.CODEC_IDS[codec], flags])
+    if flags & const.FLAG_DICTIONARY:
+        header = header + dictionary_id()
+    return header
+
+
+def parse_header(payload):
+    """ Returns (file size, session id, codec, flags, dictionary id)
+    announced in a header payload, or None if the payload is not a header.
+    The dictionary id is None without FLAG_DICTIONARY. """
+
+    payload = bytes(payload)
+    if not payload.startswith(const.HEADER_TAG):
+        return None
+    pos = len(const.HEADER_TAG)
+    file_size = int.from_bytes(payload[pos:pos + const.FILE_SIZE_SIZE], byteorder='big')
+    pos = pos + const.FILE_SIZE_SIZE
+    session_id = int.from_bytes(payload[pos:pos + const.SESSION_ID_SIZE], byteorder='big')
+    pos = pos + const.SESSION_ID_SIZE
+    codec_id = payload[pos] if pos < len(payload) else const.CODEC_IDS["7z"]
+    flags = payload[pos + 1] if pos + 1 < len(payload) else 0
+    pos = pos + 2
+    header_dictionary_id = payload[pos:pos + const.DICTIONARY_ID_SIZE] if flags & const.FLAG_DICTIONARY else None
+    for codec, value in const.CODEC_IDS.items():
+        if value == codec_id:
+            return file_size, session_id, codec, flags, header_dictionary_id
+    return None
+
+
+def build_request(tag, index, data=b''):
+    """ Payload of a request to the receiver (sent with QUERY_SEQ_NUM):
+    tag + index + data. The reply starts with the same index. """
+
+    return tag + index.to_bytes(const.PAGE_NUM_SIZE, byteorder='big') + bytes(data)
+
+
+def parse_request(payload, tag):
+    """ Returns (index, data) of a request payload with the tag, or None """
+
+    payload = bytes(payload)
+    if not payload.startswith(tag):
+        return None
+    pos = len(tag)
+    return int.from_bytes(payload[pos:pos + const.PAGE_NUM_SIZE], byteorder='big'), \
+        payload[pos + const.PAGE_NUM_SIZE:]
+
+
+def build_reply(index, data):
+    return index.to_bytes(const.PAGE_NUM_SIZE, byteorder='big') + bytes(data)
+
+
+def bitmap_has(bitmap, index):
+    return bitmap[index // 8] & (1 << (index % 8)) != 0
+
+
+################
+#    CODECS    #
+################
+
+# Preset dictionary of the "zlib-dict" codec, see load_dictionary
+DICTIONARY = None
+
+# Codecs that run inside python: (compressor factory, decompressor factory).
+# bz2 and lzma are only imported when they are used, not at start-up
+STREAM_CODECS = {
+    "zlib": (lambda level: zlib.compressobj(level), zlib.decompressobj),
+    "zlib-dict": (lambda level: zlib.compressobj(level, zdict=DICTIONARY),
+                  lambda: zlib.decompressobj(zdict=DICTIONARY)),
+    "bz2": (lambda level: importlib.import_module("bz2").BZ2Compressor(max(level, 1)),
+            lambda: importlib.import_module("bz2").BZ2Decompressor()),
+    "lzma": (lambda level: importlib.import_module("lzma").LZMACompressor(preset=level),
+             lambda: importlib.import_module("lzma").LZMADecompressor()),
+}
+
+# Candidates tried by trial_codecs: (codec, level)
+CODEC_CANDIDATES = [("zlib", 1), ("zlib", 6), ("zlib", 9), ("zlib-dict", 9), ("bz2", 9), ("lzma", 0), ("lzma", 6)]
+
+BITRATES = {
+    NRF24.BR_250KBPS: 250000,
+    NRF24.BR_1MBPS: 1000000,
+    NRF24.BR_2MBPS: 2000000,
+}
+
+
+def load_dictionary(config):
+    """ Loads the preset dictionary in DICTIONARY_PATH (trained with
+    src/dictionary.py). Without it, the "zlib-dict" codec is not used. """
+
+    global DICTIONARY
+    if DICTIONARY is None and os.path.isfile(config.DICTIONARY_PATH):
+        with open(config.DICTIONARY_PATH, 'rb') as f:
+            DICTIONARY = f.read() or None
+        if DICTIONARY is not None:
+            print("Loaded compression dictionary of " + str(len(DICTIONARY)) + " bytes")
+    return DICTIONARY is not None
+
+
+def dictionary_id():
+    """ Id of the loaded preset dictionary (the first bytes of its md5),
+    or None without a dictionary """
+
+    if DICTIONARY is None:
+        return None
+    return hashlib.md5(DICTIONARY).digest()[:const.DICTIONARY_ID_SIZE]
+
+
+def compress_stream(codec, level, in_file_path, out_file_path):
+    compressor = STREAM_CODECS[codec][0](level)
+    with open(in_file_path, 'rb') as f_in, open(out_file_path, 'wb') as f_out:
+        while True:
+            block = f_in.read(65536)
+            if not block:
+                break
+            f_out.write(compressor.compress(block))
+        f_out.write(compressor.flush())
+
+
+def uncompress_stream(codec, in_file_path, out_file_path):
+    """ Raises ValueError if the stream is truncated (it ends before the
+    end of stream mark of the codec) """
+
+    decompressor = STREAM_CODECS[codec][1]()
+    with open(in_file_path, 'rb') as f_in, open(out_file_path, 'wb') as f_out:
+        while True:
+            block = f_in.read(65536)
+            if not block:
+                break
+            f_out.write(decompressor.decompress(block))
+        if hasattr(decompressor, "flush"):
+            f_out.write(decompressor.flush())
+    if not decompressor.eof:
+        raise ValueError("truncated " + codec + " stream")
+
+
+def compress_file(config, codec="7z", level=None, in_file_path=None):
+    """ Compresses IN_FILEPATH_RAW (or in_file_path) into IN_FILEPATH_COMPRESSED with the codec """
+
+    from src import realtime
+
+    if level is None:
+        level = config.COMPRESSION_LEVEL
+    if in_file_path is None:
+        in_file_path = config.IN_FILEPATH_RAW
+    if codec == "7z":
+        command = "7z a -mx=" + str(level) + " " + \
+                  config.IN_FILEPATH_COMPRESSED + " " + in_file_path
+        try:
+            result = check_output(command, stderr=STDOUT, shell=True, preexec_fn=realtime.child_setup())
+        except CalledProcessError:
+            return False
+        ok_string = b'Everything is Ok'
+        if ok_string in result:
+            return True
+        else:
+            return False
+    elif codec == "none":
+        shutil.copyfile(in_file_path, config.IN_FILEPATH_COMPRESSED)
     else:
+        compress_stream(codec, level, in_file_path, config.IN_FILEPATH_COMPRESSED)
+    return True
+
+
+def uncompress_file(config, codec="7z", out_file_path=None):
+    """ Uncompresses OUT_FILEPATH_COMPRESSED into OUT_FILEPATH_RAW
+    (or out_file_path). 7z keeps the name of the file that was compressed,
+    so the archive is extracted in a directory of its own and its file
+    is moved to out_file_path. """
+
+    import lzma
+    from src import realtime
+
+    if out_file_path is None:
+        out_file_path = config.OUT_FILEPATH_RAW
+
+    if codec == "7z":
+        extract_path = tempfile.mkdtemp(dir=config.OUT_PATH_COMPRESSED)
+        try:
+            command = "7z x -o" + shlex.quote(extract_path) + " " + shlex.quote(config.OUT_FILEPATH_COMPRESSED)
+            try:
+                result = check_output(command, stderr=STDOUT, shell=True, preexec_fn=realtime.child_setup())
+            except CalledProcessError:
+                return False
+            ok_string = b'Everything is Ok'
+            extracted = os.listdir(extract_path)
+            if ok_string not in result or len(extracted) != 1 or \
+                    not os.path.isfile(os.path.join(extract_path, extracted[0])):
+                return False
+            shutil.move(os.path.join(extract_path, extracted[0]), out_file_path)
+            return True
+        finally:
+            shutil.rmtree(extract_path, ignore_errors=True)
+    try:
+        if codec == "none":
+            shutil.copyfile(config.OUT_FILEPATH_COMPRESSED, out_file_path)
+        elif codec == "blocks":
+            uncompress_blocks(config, out_file_path)
+        else:
+            uncompress_stream(codec, config.OUT_FILEPATH_COMPRESSED, out_file_path)
+    except (IOError, zlib.error, lzma.LZMAError, ValueError, TypeError):
+        # TypeError: zlib-dict without a dictionary
         return False
+    return True
+
+
+def compress_block(job):
+    """ Compresses one block in a worker process. job = (codec, level, data) """
+
+    codec, level, data = job
+    compressor = STREAM_CODECS[codec][0](level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def uncompress_block(job):
+    """ Uncompresses one block in a worker process. job = (codec, data) """
+
+    codec, data = job
+    decompressor = STREAM_CODECS[codec][1]()
+    block = decompressor.decompress(data)
+    if not decompressor.eof:
+        raise ValueError("truncated " + codec + " block")
+    return block
+
+
+def use_blocks(config, codec, file_path):
+    """ Big files are compressed in blocks, in parallel """
+
+    return codec in STREAM_CODECS and os.path.getsize(file_path) >= config.PARALLEL_MIN_SIZE
+
+
+def read_blocks(file_path, block_size):
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield block
+
+
+def compress_blocks(config, codec, level, in_file_path=None):
+    """ Compresses IN_FILEPATH_RAW (or in_file_path) in independent blocks of
+    PARALLEL_BLOCK_SIZE bytes, using a pool of COMPRESSION_PROCESSES.
+
+    Format: inner codec id + number of blocks + block index (compressed
+    size of each block) + the compressed blocks, in order. """
+
+    from multiprocessing import Pool
+    from src import realtime
+
+    if in_file_path is None:
+        in_file_path = config.IN_FILEPATH_RAW
+    file_size = os.path.getsize(in_file_path)
+    blocks = (file_size + config.PARALLEL_BLOCK_SIZE - 1) // config.PARALLEL_BLOCK_SIZE
+    jobs = ((codec, level, block) for block in read_blocks(in_file_path, config.PARALLEL_BLOCK_SIZE))
+    index = list()
+    with open(config.IN_FILEPATH_COMPRESSED, 'wb') as f, \
+            Pool(config.COMPRESSION_PROCESSES, realtime.child_setup()) as pool:
+        f.write(bytes([const.CODEC_IDS[codec]]) + blocks.to_bytes(const.BLOCK_SIZE_SIZE, byteorder='big'))
+        # The index is filled once all the blocks are compressed
+        index_pos = f.tell()
+        f.write(bytes(blocks * const.BLOCK_SIZE_SIZE))
+        for compressed in pool.imap(compress_block, jobs):
+            f.write(compressed)
+            index.append(len(compressed))
+        f.seek(index_pos)
+        f.write(b''.join(size.to_bytes(const.BLOCK_SIZE_SIZE, byteorder='big') for size in index))
+    print("Compressed in " + str(blocks) + " blocks")
+    return True
+
+
+def uncompress_blocks(config, out_file_path):
+    """ Uncompresses a file created by compress_blocks, decompressing
+    the blocks in parallel """
+
+    from multiprocessing import Pool
+    from src import realtime
+
+    with open(config.OUT_FILEPATH_COMPRESSED, 'rb') as f:
+        codec_id = f.read(1)
+        codec = next((name for name, value in const.CODEC_IDS.items() if bytes([value]) == codec_id), None)
+        if codec not in STREAM_CODECS:
+            raise ValueError("unknown codec of the blocks")
+        blocks = int.from_bytes(f.read(const.BLOCK_SIZE_SIZE), byteorder='big')
+        index = f.read(blocks * const.BLOCK_SIZE_SIZE)
+        if len(index) != blocks * const.BLOCK_SIZE_SIZE:
+            raise ValueError("truncated index of the blocks")
+        sizes = [int.from_bytes(index[pos:pos + const.BLOCK_SIZE_SIZE], byteorder='big')
+                 for pos in range(0, len(index), const.BLOCK_SIZE_SIZE)]
+        jobs = ((codec, f.read(size)) for size in sizes)
+        with open(out_file_path, 'wb') as f_out, Pool(config.COMPRESSION_PROCESSES, realtime.child_setup()) as pool:
+            for block in pool.imap(uncompress_block, jobs):
+                f_out.write(block)
+
+
+def sample_file(file_path, sample_size, blocks=4):
+    """ Reads sample_size bytes of the file, taken in blocks
+    spread along the whole file. """
+
+    file_size = os.path.getsize(file_path)
+    if file_size <= sample_size:
+        with open(file_path, 'rb') as f:
+            return f.read()
+    block_size = sample_size // blocks
+    step = (file_size - block_size) // (blocks - 1)
+    sample = bytearray()
+    with open(file_path, 'rb') as f:
+        for block in range(blocks):
+            f.seek(block * step)
+            sample.extend(f.read(block_size))
+    return bytes(sample)
+
+
+def entropy(data):
+    """ Shannon entropy of the data in bits per byte """
+
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def estimate_air_time(config, size):
+    """ Estimated time to transmit size bytes: every frame and its ACK
+    on air at BITRATE, plus the time the host spends on each frame. """
+
+    frames = (size + config.DATA_SIZE - 1) // config.DATA_SIZE + 2
+    frame_bits = const.FRAME_BITS_OVERHEAD + (config.CRC_SIZE + config.SEQ_NUM_SIZE + config.DATA_SIZE) * 8
+    ack_bits = const.FRAME_BITS_OVERHEAD + (config.CRC_SIZE + config.SEQ_NUM_SIZE + 3) * 8
+    return frames * ((frame_bits + ack_bits) / BITRATES[config.BITRATE] + config.FRAME_OVERHEAD)
+
+
+def select_codec(config, file_path):
+    """ Chooses the codec and level of the file (see trial_codecs). The
+    choice is cached by the md5 of the file in CODEC_CACHE_PATH: the
+    timings of the trials change between runs, and a sender restarted
+    after a crash has to compress the file with the same codec, so that
+    it gets the same session id and the receiver resumes the reception.
+    Returns (codec, level). """
+
+    digest = file_md5(file_path).hexdigest()
+    try:
+        with open(config.CODEC_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        cache = list()
+    if not isinstance(cache, list):
+        cache = list()
+    cache = [entry for entry in cache if isinstance(entry, list) and len(entry) == 3]
+    for cached_digest, codec, level in cache:
+        if cached_digest == digest and (codec != "zlib-dict" or DICTIONARY is not None):
+            print("Codec selected: " + codec + " (level " + str(level) + "), chosen before for this file")
+            return codec, level
+
+    codec, level = trial_codecs(config, file_path)
+    cache = [entry for entry in cache if entry[0] != digest][-(const.CODEC_CACHE_SIZE - 1):]
+    cache.append([digest, codec, level])
+    try:
+        with open(config.CODEC_CACHE_PATH, 'w') as f:
+            json.dump(cache, f)
+    except IOError:
+        print("ERROR when saving the codec cache")
+    return codec, level
+
+
+def trial_codecs(config, file_path):
+    """ Chooses the codec and level that minimise the total time of the
+    transfer (compression + air time + decompression). Compression ratio
+    and speed are measured with trial compressions of a sample of the
+    file and extrapolated to the whole file. Returns (codec, level). """
+
+    file_size = os.path.getsize(file_path)
+    sample = sample_file(file_path, const.CODEC_SAMPLE_SIZE)
+    best = ("none", 0)
+    best_time = estimate_air_time(config, file_size)
+    if not sample or entropy(sample) > const.CODEC_MAX_ENTROPY:
+        print("Codec selected: none (incompressible input)")
+        return best
+
+    scale = file_size / len(sample)
+    if file_size >= config.PARALLEL_MIN_SIZE:
+        scale = scale / config.COMPRESSION_PROCESSES
+    for codec, level in CODEC_CANDIDATES:
+        if codec == "zlib-dict" and DICTIONARY is None:
+            continue
+        start_time = time.perf_counter()
+        compressor = STREAM_CODECS[codec][0](level)
+        compressed = compressor.compress(sample) + compressor.flush()
+        compress_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        STREAM_CODECS[codec][1]().decompress(compressed)
+        uncompress_time = time.perf_counter() - start_time
+
+        total_time = (compress_time + uncompress_time) * scale + \
+            estimate_air_time(config, int(len(compressed) * file_size / len(sample)))
+        if total_time < best_time:
+            best = (codec, level)
+            best_time = total_time
+
+    print("Codec selected: " + best[0] + " (level " + str(best[1]) + "), estimated time " +
+          "{0:.2f}".format(best_time) + " s")
+    return best
+
+
+#########################
+#    BATCH TRANSFERS    #
+#########################
+
+def get_raw_filepaths(config):
+    """ Returns the paths (relative to IN_PATH_RAW) of all the files
+    in the input directory and its subdirectories. """
+
+    paths = list()
+    for root, dirs, files in os.walk(config.IN_PATH_RAW):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file in sorted(files):
+            if not file.startswith("."):
+                paths.append(os.path.relpath(os.path.join(root, file), config.IN_PATH_RAW))
+    return paths
+
 
+def compress_paths(config, rel_paths, archive_path):
+    """ Compresses the files (relative to IN_PATH_RAW) in one 7z archive,
+    keeping their relative paths. """
 
-def uncompress_file(config):
-    command = "7z x -o" + config.OUT_PATH_RAW + " " + config.OUT_FILEPATH_COMPRESSED
+    from src import realtime
+
+    if os.path.isfile(archive_path):
+        os.remove(archive_path)
+    command = "7z a -mx=" + str(config.COMPRESSION_LEVEL) + " " + shlex.quote(archive_path) + " " + \
+              " ".join(shlex.quote(path) for path in rel_paths)
     try:
-        result = check_output(command, stderr=STDOUT, shell=True)
+        result = check_output(command, stderr=STDOUT, shell=True, cwd=config.IN_PATH_RAW,
+                              preexec_fn=realtime.child_setup())
     except CalledProcessError:
         return False
-    ok_string = b'Everything is Ok'
-    if ok_string in result:
-        return True
+    return b'Everything is Ok' in result
+
+
+def group_batch(config, rel_paths):
+    """ Splits the files in streams. With solid compression all the small
+    files share one stream; big files always get their own stream. """
+
+    groups = list()
+    solid = list()
+    for path in rel_paths:
+        size = os.path.getsize(os.path.join(config.IN_PATH_RAW, path))
+        if config.SOLID_COMPRESSION and size <= config.SOLID_MAX_FILE_SIZE:
+            solid.append(path)
+        else:
+            groups.append([path])
+    if solid:
+        groups.insert(0, solid)
+    return groups
+
+
+def compress_batch(config):
+    """ Builds the file to transmit in batch mode: a manifest followed by
+    all the compressed streams, back to back. The manifest gives the
+    codec and size of each stream, and the name, size and md5 digest of
+    each file it contains. """
+
+    rel_paths = get_raw_filepaths(config)
+    if not rel_paths:
+        print("ERROR: no files in PATH: " + config.IN_PATH_RAW)
+        return False
+
+    streams = list()
+    stream_paths = list()
+    for index, group in enumerate(group_batch(config, rel_paths)):
+        stream_path = config.IN_PATH_COMPRESSED + "stream_" + str(index) + ".7z"
+        codec = "7z"
+        if len(group) == 1:
+            # A file of its own can use the codec of the configuration
+            file_path = os.path.join(config.IN_PATH_RAW, group[0])
+            codec, level = batch_stream_codec(config, file_path)
+            if codec != "7z":
+                stream_path = config.IN_PATH_COMPRESSED + "stream_" + str(index)
+            if codec == "none":
+                shutil.copyfile(file_path, stream_path)
+            elif codec != "7z":
+                compress_stream(codec, level, file_path, stream_path)
+        if codec == "7z" and not compress_paths(config, group, stream_path):
+            return False
+        files = list()
+        for path in group:
+            file_path = os.path.join(config.IN_PATH_RAW, path)
+            files.append({"name": path, "size": os.path.getsize(file_path),
+                          "md5": file_md5(file_path).hexdigest()})
+        streams.append({"codec": codec, "size": os.path.getsize(stream_path), "files": files})
+        stream_paths.append(stream_path)
+
+    manifest = json.dumps({"streams": streams}, separators=(",", ":")).encode("utf-8")
+    with open(config.IN_FILEPATH_COMPRESSED, 'wb') as f:
+        f.write(len(manifest).to_bytes(const.MANIFEST_LEN_SIZE, byteorder='big'))
+        f.write(manifest)
+        for stream_path in stream_paths:
+            with open(stream_path, 'rb') as stream:
+                shutil.copyfileobj(stream, f)
+            os.remove(stream_path)
+
+    print("Batch of " + str(len(rel_paths)) + " files in " + str(len(streams)) + " streams")
+    return True
+
+
+def batch_stream_codec(config, file_path):
+    """ Codec and level of a stream with one file in batch mode: the one of
+    the configuration (chosen by select_codec with "auto") if it runs in
+    python, else 7z. zlib-dict is not used, the manifest does not say which
+    dictionary the receiver needs. """
+
+    codec, level = config.CODEC, config.COMPRESSION_LEVEL
+    if codec == "auto":
+        codec, level = select_codec(config, file_path)
+    if codec == "none" or codec in STREAM_CODECS and codec != "zlib-dict":
+        return codec, level
+    return "7z", config.COMPRESSION_LEVEL
+
+
+def extract_stream(config, stream, stream_path, extract_path):
+    """ Uncompresses a stream of a batch in extract_path. Returns False if it fails """
+
+    from src import realtime
+
+    codec = stream["codec"]
+    if codec == "7z":
+        command = "7z x -aoa -o" + shlex.quote(extract_path) + " " + shlex.quote(stream_path)
+        try:
+            result = check_output(command, stderr=STDOUT, shell=True, preexec_fn=realtime.child_setup())
+        except CalledProcessError:
+            return False
+        return b'Everything is Ok' in result
+    if len(stream["files"]) != 1 or not (codec == "none" or codec in STREAM_CODECS and codec != "zlib-dict"):
+        return False
+    file_path = path_in(extract_path, stream["files"][0]["name"])
+    if file_path is None:
+        return False
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if codec == "none":
+        shutil.copyfile(stream_path, file_path)
     else:
+        uncompress_stream(codec, stream_path, file_path)
+    return True
+
+
+def uncompress_batch(config):
+    """ Splits the received batch in streams and uncompresses each one in
+    a directory of its own. Only the files of the manifest are moved from
+    there to OUT_PATH_RAW (rebuilding the directory tree), once their
+    digest matches: an entry of a stream that is not in the manifest is
+    never written in the output. """
+
+    import lzma
+
+    try:
+        with open(config.OUT_FILEPATH_COMPRESSED, 'rb') as f:
+            manifest_len = int.from_bytes(f.read(const.MANIFEST_LEN_SIZE), byteorder='big')
+            manifest = json.loads(f.read(manifest_len).decode("utf-8"))
+            # The names come from the other peer, none of them can be out of OUT_PATH_RAW
+            for stream in manifest["streams"]:
+                for file in stream["files"]:
+                    if output_path(config, file["name"]) is None:
+                        print("ERROR: file out of the output directory in the manifest: " + str(file["name"]))
+                        return False
+            for stream in manifest["streams"]:
+                stream_dir = tempfile.mkdtemp(dir=config.OUT_PATH_COMPRESSED)
+                try:
+                    stream_path = os.path.join(stream_dir, "stream")
+                    extract_path = os.path.join(stream_dir, "files")
+                    os.mkdir(extract_path)
+                    with open(stream_path, 'wb') as out:
+                        out.write(f.read(stream["size"]))
+                    if not extract_stream(config, stream, stream_path, extract_path):
+                        print("ERROR when uncompressing a stream of the batch")
+                        return False
+                    for file in stream["files"]:
+                        file_path = path_in(extract_path, file["name"])
+                        if file_path is None or not os.path.isfile(file_path) or \
+                                file_md5(file_path).hexdigest() != file["md5"]:
+                            print("ERROR: wrong digest for file " + file["name"])
+                            return False
+                        out_file_path = output_path(config, file["name"])
+                        os.makedirs(os.path.dirname(out_file_path), exist_ok=True)
+                        shutil.move(file_path, out_file_path)
+                finally:
+                    shutil.rmtree(stream_dir, ignore_errors=True)
+    except (IOError, ValueError, KeyError, TypeError, zlib.error, lzma.LZMAError):
         return False
+    return True
+
+
+def path_in(root, name):
+    """ Path of the relative file name in the directory root, or None if
+    it is absolute or resolves out of root """
+
+    if not isinstance(name, str) or not name or os.path.isabs(name):
+        return None
+    root = os.path.realpath(root)
+    file_path = os.path.realpath(os.path.join(root, name))
+    if not file_path.startswith(root + os.sep):
+        return None
+    return file_path
+
+
+def output_path(config, name):
+    """ Path of the file name (relative) of a batch in OUT_PATH_RAW,
+    or None if it is absolute or resolves out of OUT_PATH_RAW """
+
+    return path_in(config.OUT_PATH_RAW, name)
 
 
 def get_raw_filepath(config):
@@ -144,12 +1023,14 @@ def get_compressed_filepath(config):
 
 
 def clear_outputs(config):
+    # The compressed output and its session state are kept,
+    # they are used to resume an interrupted reception
+    # With DELTA the previous output is kept as the basis of delta transfers
     try:
-        os.remove(config.OUT_FILEPATH_COMPRESSED)
-    except IOError:
-        print()
-    try:
-        os.remove(config.OUT_FILEPATH_RAW)
+        if config.DELTA:
+            os.replace(config.OUT_FILEPATH_RAW, config.OUT_FILEPATH_RAW + const.BASIS_EXTENSION)
+        else:
+            os.remove(config.OUT_FILEPATH_RAW)
     except IOError:
         print()
     try:
@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+#
+# Tests of the transfer protocols, run with python3 -m pytest tests/
+# The radios are replaced by the fakes of tests/fakes.py, the rest of the
+# code needs the libraries of the Raspberry Pi (RPi.GPIO, spidev, crc16)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def missing_libraries():
+    """ Error of the import of the libraries of the Pi, None if they are installed """
+
+    try:
+        import RPi.GPIO
+        import spidev
+        import crc16
+    except (ImportError, RuntimeError) as e:
+        return str(e)
+    return None
+
+
+MISSING_LIBRARIES = missing_libraries()
+if MISSING_LIBRARIES is not None:
+    collect_ignore_glob = ["test_*.py"]
+
+
+def pytest_report_header(config):
+    if MISSING_LIBRARIES is not None:
+        return "Tests not collected, missing libraries: " + MISSING_LIBRARIES
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+#
+# Fake hardware for the tests: the registers of an nRF24L01+ behind spidev,
+# radios that exchange frames through a shared (lossy) air, and
+# configurations with their paths in a temporary directory
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import types
+import random
+import threading
+import importlib
+import collections
+from libraries.lib_nrf24 import NRF24
+
+
+# Root of the paths of the configurations
+PI_ROOT = "/home/pi/MTP-TeamB-2019/"
+
+
+class FakeSpi(object):
+    """ spidev.SpiDev of an nRF24L01+: the registers can be read and
+    written (reset values of the datasheet), the rest of the commands only
+    return the status. register_writes counts the register writes. """
+
+    def __init__(self):
+        self.registers = [0] * (NRF24.REGISTER_MASK + 1)
+        self.registers[NRF24.CONFIG] = 0x08
+        self.registers[NRF24.SETUP_AW] = 0x03
+        self.registers[NRF24.SETUP_RETR] = 0x03
+        self.registers[NRF24.RF_CH] = 0x02
+        self.registers[NRF24.RF_SETUP] = 0x0f
+        self.registers[NRF24.STATUS] = 0x0e
+        self.registers[NRF24.FIFO_STATUS] = 0x11
+        self.register_writes = 0
+        self.max_speed_hz = 0
+
+    def open(self, bus, device):
+        pass
+
+    def close(self):
+        pass
+
+    def xfer2(self, buf):
+        command = buf[0]
+        status = self.registers[NRF24.STATUS]
+        if command & ~NRF24.REGISTER_MASK == NRF24.R_REGISTER:
+            return [status] + [self.registers[command & NRF24.REGISTER_MASK]] * (len(buf) - 1)
+        if command & ~NRF24.REGISTER_MASK == NRF24.W_REGISTER:
+            reg = command & NRF24.REGISTER_MASK
+            # STATUS flags are cleared writing 1, they are never set here
+            if reg != NRF24.STATUS and len(buf) == 2:
+                self.registers[reg] = buf[1]
+            self.register_writes = self.register_writes + 1
+        return [status] + [0] * (len(buf) - 1)
+
+
+def make_config(name, root, **options):
+    """ Copy of the configuration conf.<name> with the paths moved from the
+    Pi to the directory root (created), and the options changed """
+
+    module = importlib.import_module("conf." + name)
+    config = types.SimpleNamespace(**{key: getattr(module, key) for key in dir(module) if key.isupper()})
+    for key, value in vars(config).items():
+        if isinstance(value, str) and value.startswith(PI_ROOT):
+            value = os.path.join(root, value[len(PI_ROOT):])
+            setattr(config, key, value)
+            os.makedirs(value if value.endswith("/") else os.path.dirname(value), exist_ok=True)
+    for key, value in options.items():
+        setattr(config, key, value)
+    return config
+
+
+class AirOff(Exception):
+    pass
+
+
+class Air(object):
+    """ Medium shared by the FakeRadios: a written frame reaches every radio
+    on the same channel that reads the address it is written to, and each
+    copy is lost with probability loss (seeded). After cut_after frames
+    nothing is delivered, and once switched off (switch_off) the radios
+    raise AirOff, which ends the devices still waiting for frames. """
+
+    def __init__(self, loss=0.0, seed=1, cut_after=None):
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.loss = loss
+        self.cut_after = cut_after
+        self.radios = list()
+        self.frames = 0
+        self.on = True
+
+    def switch_off(self):
+        self.on = False
+
+    def transmit(self, radio, frame):
+        with self.lock:
+            if self.cut_after is not None and self.frames >= self.cut_after:
+                return
+            self.frames = self.frames + 1
+            for other in self.radios:
+                if other is not radio and other.channel == radio.channel and \
+                        radio.write_address in other.read_addresses.values() and self.rng.random() >= self.loss:
+                    other.fifo.append(frame)
+
+
+class FakeRadio(object):
+    """ NRF24 on an Air: the pipes and the channel select the frames it
+    receives, the FIFO has no limit. It records its frames in capture like
+    the driver. written counts the frames written. """
+
+    def __init__(self, air, channel):
+        self.air = air
+        self.channel = channel
+        self.write_address = None
+        self.read_addresses = dict()
+        self.fifo = collections.deque()
+        self.capture = None
+        self.written = 0
+        air.radios.append(self)
+
+    def check_air(self):
+        if not self.air.on:
+            raise AirOff()
+
+    def openWritingPipe(self, address):
+        self.write_address = tuple(address)
+
+    def openReadingPipe(self, pipe, address):
+        self.read_addresses[pipe] = tuple(address)
+
+    def setChannel(self, channel):
+        self.channel = channel
+
+    def ce(self, level):
+        pass
+
+    def startListening(self):
+        pass
+
+    def stopListening(self):
+        pass
+
+    def rxFifoFull(self):
+        return False
+
+    def testRPD(self):
+        return False
+
+    def flush_rx(self):
+        self.fifo.clear()
+
+    def write(self, buf):
+        self.check_air()
+        frame = bytes(buf)
+        assert len(frame) <= 32
+        if self.capture is not None:
+            self.capture.sent(frame)
+        self.written = self.written + 1
+        self.air.transmit(self, frame)
+        return True
+
+    def available(self, pipe_num=None):
+        self.check_air()
+        return bool(self.fifo)
+
+    def getDynamicPayloadSize(self):
+        return len(self.fifo[0]) if self.fifo else 0
+
+    def read(self, buf, buf_len=-1):
+        self.check_air()
+        buf[:] = self.fifo.popleft()
+        if self.capture is not None:
+            self.capture.received(buf)
+        return not self.fifo
+
+
+def fake_radios(air, config):
+    """ (sender, receiver) radios of the configuration on the air, with
+    the pipes of main.init_radios """
+
+    sender = FakeRadio(air, config.SENDER_CHANNEL)
+    sender.openWritingPipe(config.SENDER_PIPE)
+    receiver = FakeRadio(air, config.RECEIVER_CHANNEL)
+    receiver.openReadingPipe(0, config.RECEIVER_PIPE)
+    return sender, receiver
+
+
+def run_transfer(air, sender, receivers, timeout=60, linger=5):
+    """ Runs the transmit of the sender and the receive of the receivers,
+    each one on its thread. The receivers get linger seconds after the
+    sender ends, then the air is switched off. Returns (transmit result,
+    receive results), an exception raised by a device is its result. """
+
+    results = dict()
+
+    def run(device, function):
+        try:
+            results[device] = function()
+        except Exception as e:
+            results[device] = e
+
+    threads = [threading.Thread(target=run, args=(receiver, receiver.receive), daemon=True) for receiver in receivers]
+    threads.append(threading.Thread(target=run, args=(sender, sender.transmit), daemon=True))
+    for thread in threads:
+        thread.start()
+    threads[-1].join(timeout)
+    for thread in threads[:-1]:
+        thread.join(linger)
+    air.switch_off()
+    for thread in threads:
+        thread.join(linger)
+    return results.get(sender), [results.get(receiver) for receiver in receivers]
@@ -0,0 +1,21 @@
+#!/usr/bin/python3
+#
+# Content defined chunking and chunk store (src/dedup.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+from src import dedup
+
+
+def test_store_removes_the_least_recently_used_chunks(tmp_path):
+    store = dedup.ChunkStore(str(tmp_path / "store"), 3000)
+    chunks = [os.urandom(1000) for i in range(4)]
+    for age, data in enumerate(chunks):
+        store.put(dedup.chunk_hash(data), data)
+        os.utime(store.chunk_path(dedup.chunk_hash(data)), (age, age))
+    # The oldest one was used again
+    assert store.get(dedup.chunk_hash(chunks[0])) == chunks[0]
+    assert store.trim() == 1
+    assert [store.has(dedup.chunk_hash(data)) for data in chunks] == [True, False, True, True]
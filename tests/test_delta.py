@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+#
+# Delta transfer against the previous file (src/delta.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import pytest
+from src import delta
+
+
+def test_wrong_delta_keeps_the_output(tmp_path):
+    block_size = 64
+    basis = os.urandom(block_size * 10)
+    new = basis[:200] + b'changed' + basis[207:]
+    basis_path, container_path, out_file_path = (str(tmp_path / name) for name in ("basis", "delta", "out"))
+    with open(basis_path, 'wb') as f:
+        f.write(basis)
+    operations = delta.compute_delta(new, delta.file_signatures(basis, block_size), block_size)
+    delta.build_container(new, operations, container_path)
+    delta.apply_delta(basis_path, container_path, out_file_path, block_size)
+    assert open(out_file_path, 'rb').read() == new
+
+    # Another basis: the md5 does not match and the previous output stays
+    with open(basis_path, 'wb') as f:
+        f.write(os.urandom(len(basis)))
+    with pytest.raises(ValueError):
+        delta.apply_delta(basis_path, container_path, out_file_path, block_size)
+    assert open(out_file_path, 'rb').read() == new
+    assert sorted(os.listdir(str(tmp_path))) == ["basis", "delta", "out"]
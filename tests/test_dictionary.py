@@ -0,0 +1,21 @@
+#!/usr/bin/python3
+#
+# Preset dictionary of the "zlib-dict" codec (src/dictionary.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+from src import dictionary
+
+
+def test_only_segments_of_several_files(tmp_path):
+    common = b'shared by both files of the corpus'
+    file_paths = list()
+    for name, own in (("a.txt", b'only in the first file, repeated ' * 20), ("b.txt", b'0123456789abcdef' * 3)):
+        file_paths.append(str(tmp_path / name))
+        with open(file_paths[-1], 'wb') as f:
+            f.write(common + own)
+    trained = dictionary.train_dictionary(file_paths, segment_size=8)
+    assert trained
+    segments = [trained[pos:pos + 8] for pos in range(0, len(trained), 8)]
+    assert all(segment in common for segment in segments)
@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+#
+# Whole transfers between the devices over fake radios (tests/fakes.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import time
+import asyncio
+import random
+import threading
+import pytest
+from src import util
+from src import capture
+from src import aio
+from src.sender import Sender
+from src.receiver import Receiver
+from src.burst import BurstSender, BurstReceiver
+from src.multicast import MulticastSender, MulticastReceiver
+from fakes import Air, make_config, fake_radios, run_transfer
+
+
+def make_configs(tmp_path, mode="srm", **options):
+    """ Configurations of the sender and the receiver of the mode, each one
+    with its own files. 7z is not needed: the sender uses zlib unless CODEC is given """
+
+    codec = options.pop("CODEC", "zlib")
+    sender_config = make_config("conf_" + mode + "_sender", str(tmp_path / "tx"), CODEC=codec, **options)
+    receiver_config = make_config("conf_" + mode + "_receiver", str(tmp_path / "rx"), **options)
+    return sender_config, receiver_config
+
+
+def write_input(config, data):
+    with open(config.IN_FILEPATH_RAW, 'wb') as f:
+        f.write(data)
+
+
+def read_output(config):
+    with open(config.OUT_FILEPATH_RAW, 'rb') as f:
+        return f.read()
+
+
+def transfer_versions(sender_config, receiver_config, versions):
+    """ Transfers the versions of the input one after another, clearing the
+    outputs before each execution like main.py. Returns the frames written
+    by the sender in each one """
+
+    frames = list()
+    for data in versions:
+        util.clear_outputs(receiver_config)
+        write_input(sender_config, data)
+        air = Air()
+        sender = Sender(sender_config, *fake_radios(air, sender_config))
+        receiver = Receiver(receiver_config, *fake_radios(air, receiver_config))
+        assert run_transfer(air, sender, [receiver]) == (True, [True])
+        assert read_output(receiver_config) == data
+        frames.append(sender.sender.written)
+    return frames
+
+
+def sample_data(size):
+    """ Half random, half text: zlib leaves it at about the half """
+
+    return os.urandom(size // 2) + (b'the quick brown fox jumps over the lazy dog ' * size)[:size - size // 2]
+
+
+@pytest.mark.parametrize("loss", [0.0, 0.1])
+def test_srm_transfer(tmp_path, loss):
+    sender_config, receiver_config = make_configs(tmp_path)
+    data = sample_data(6000)
+    write_input(sender_config, data)
+
+    air = Air(loss)
+    sender = Sender(sender_config, *fake_radios(air, sender_config))
+    receiver = Receiver(receiver_config, *fake_radios(air, receiver_config))
+    assert run_transfer(air, sender, [receiver]) == (True, [True])
+    assert read_output(receiver_config) == data
+
+
+def test_transfer_aborts_when_compression_fails(tmp_path, monkeypatch):
+    sender_config, receiver_config = make_configs(tmp_path, CODEC="7z")
+    write_input(sender_config, sample_data(3000))
+    monkeypatch.setattr(util, "check_output", lambda command, **kwargs: b'ERROR: no space left on device')
+
+    # Nothing is sent, not even the header
+    sender = Sender(sender_config, *fake_radios(Air(), sender_config))
+    assert sender.transmit() is False
+    assert sender.sender.written == 0
+
+
+def test_capture_replay_is_deterministic(tmp_path):
+    sender_config, receiver_config = make_configs(tmp_path)
+    data = sample_data(3000)
+    write_input(sender_config, data)
+
+    air = Air(0.1)
+    sender = Sender(sender_config, *fake_radios(air, sender_config))
+    receiver = Receiver(receiver_config, *fake_radios(air, receiver_config))
+    recording = capture.Capture(str(tmp_path / "rx.cap"), 4096)
+    receiver.sender.capture = receiver.receiver.capture = recording
+    assert run_transfer(air, sender, [receiver]) == (True, [True])
+    recording.close()
+
+    records = capture.read_capture(str(tmp_path / "rx.cap"))
+    acks = sum(1 for record in records if record.direction == capture.TX)
+    for run in range(2):
+        replay_config = make_config("conf_srm_receiver", str(tmp_path / ("replay" + str(run))))
+        radio = capture.replay(replay_config, records, False)
+        # The receiver writes the ACKs of the capture, in the same order
+        assert (radio.written, radio.diverged) == (acks, None)
+        assert read_output(replay_config) == data
+
+
+def test_resume_interrupted_reception(tmp_path):
+    sender_config, receiver_config = make_configs(tmp_path, ACK_TIMEOUT=0.001)
+    data = os.urandom(4000)
+    write_input(sender_config, data)
+    chunks = (len(data) + sender_config.DATA_SIZE - 1) // sender_config.DATA_SIZE
+
+    # The link breaks in the middle of the file (frames and ACKs): the sender gives up soon, the receiver is stopped
+    air = Air(cut_after=chunks)
+    sender = Sender(sender_config, *fake_radios(air, sender_config))
+    receiver = Receiver(receiver_config, *fake_radios(air, receiver_config))
+    assert run_transfer(air, sender, [receiver], linger=0.1)[0] is False
+    assert not os.path.isfile(receiver_config.OUT_FILEPATH_RAW)
+
+    # Long enough that a busy test host does not cause retransmissions
+    sender_config.ACK_TIMEOUT = 0.05
+    air = Air()
+    sender = Sender(sender_config, *fake_radios(air, sender_config))
+    receiver = Receiver(receiver_config, *fake_radios(air, receiver_config))
+    assert run_transfer(air, sender, [receiver]) == (True, [True])
+    assert read_output(receiver_config) == data
+    assert receiver.header_ack == b'RESUME'
+    assert sender.sender.written < chunks
+
+
+def test_resume_after_sender_restart(tmp_path):
+    sender_config, receiver_config = make_configs(tmp_path, ACK_TIMEOUT=0.001)
+    data = os.urandom(4000)
+    write_input(sender_config, data)
+    chunks = (len(data) + sender_config.DATA_SIZE - 1) // sender_config.DATA_SIZE
+
+    # The receiver keeps running while the first sender gives up in the middle of the file
+    air = Air(cut_after=chunks)
+    receiver = Receiver(receiver_config, *fake_radios(air, receiver_config))
+    results = list()
+    reception = threading.Thread(target=lambda: results.append(receiver.receive()), daemon=True)
+    reception.start()
+    assert Sender(sender_config, *fake_radios(air, sender_config)).transmit() is False
+    # The ACKs of the frames still queued in the receiver would reach the next sender
+    while receiver.receiver.fifo:
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+    air.cut_after = None
+    # Long enough that a busy test host does not cause retransmissions
+    sender_config.ACK_TIMEOUT = 0.05
+    sender = Sender(sender_config, *fake_radios(air, sender_config))
+    assert sender.transmit() is True
+    reception.join(10)
+    assert results == [True]
+    assert read_output(receiver_config) == data
+    assert receiver.header_ack == b'RESUME'
+    assert sender.sender.written < chunks
+
+
+class LoopSender(object):
+    """ Runs the AsyncSender of the device on an event loop of its own, like aio.run_execution """
+
+    def __init__(self, device):
+        self.device = device
+
+    def transmit(self):
+        return asyncio.run(aio.AsyncSender(self.device).transmit())
+
+
+def test_async_hopping_transfer(tmp_path):
+    sender_config, receiver_config = make_configs(tmp_path, HOPPING=True)
+    data = sample_data(6000)
+    write_input(sender_config, data)
+
+    # The syncs of the hopping also wait for their ACKs on the loop
+    air = Air(0.1)
+    sender = Sender(sender_config, *fake_radios(air, sender_config))
+    receiver = Receiver(receiver_config, *fake_radios(air, receiver_config))
+    assert run_transfer(air, LoopSender(sender), [receiver]) == (True, [True])
+    assert read_output(receiver_config) == data
+    assert sender.synced_slot is not None
+
+
+def test_burst_transfer(tmp_path):
+    sender_config, receiver_config = make_configs(tmp_path, "burst")
+    data = sample_data(6000)
+    write_input(sender_config, data)
+
+    air = Air(0.1)
+    sender = BurstSender(sender_config, *fake_radios(air, sender_config))
+    receiver = BurstReceiver(receiver_config, *fake_radios(air, receiver_config))
+    assert run_transfer(air, sender, [receiver]) == (True, [True])
+    assert read_output(receiver_config) == data
+
+
+def test_burst_capture_replay(tmp_path):
+    sender_config, receiver_config = make_configs(tmp_path, "burst")
+    data = sample_data(3000)
+    write_input(sender_config, data)
+
+    air = Air(0.1)
+    sender = BurstSender(sender_config, *fake_radios(air, sender_config))
+    receiver = BurstReceiver(receiver_config, *fake_radios(air, receiver_config))
+    recording = capture.Capture(str(tmp_path / "rx.cap"), 4096)
+    receiver.sender.capture = receiver.receiver.capture = recording
+    assert run_transfer(air, sender, [receiver]) == (True, [True])
+    recording.close()
+
+    # Without the reader thread of the reception the ACK windows may differ, but every replay is the same
+    records = capture.read_capture(str(tmp_path / "rx.cap"))
+    replays = list()
+    for run in range(2):
+        replay_config = make_config("conf_burst_receiver", str(tmp_path / ("replay" + str(run))))
+        radio = capture.replay(replay_config, records, False)
+        assert read_output(replay_config) == data
+        replays.append((radio.written, radio.diverged, len(radio.rx)))
+    assert replays[0] == replays[1]
+
+
+def test_multicast_transfer(tmp_path):
+    sender_config = make_config("conf_srm_sender", str(tmp_path / "tx"), CODEC="zlib", MULTICAST=True,
+                                MULTICAST_RECEIVERS=3)
+    data = sample_data(6000)
+    write_input(sender_config, data)
+
+    # Each receiver loses its own frames, the rounds repair the union of the losses
+    air = Air(0.1)
+    sender = MulticastSender(sender_config, *fake_radios(air, sender_config))
+    receivers = list()
+    for receiver_id in range(sender_config.MULTICAST_RECEIVERS):
+        receiver_config = make_config("conf_srm_receiver", str(tmp_path / ("rx" + str(receiver_id))), MULTICAST=True,
+                                      RECEIVER_ID=receiver_id)
+        receivers.append(MulticastReceiver(receiver_config, *fake_radios(air, receiver_config)))
+    assert run_transfer(air, sender, receivers) == (True, [True] * len(receivers))
+    for receiver in receivers:
+        assert read_output(receiver.config) == data
+
+
+def test_delta_transfer(tmp_path):
+    sender_config, receiver_config = make_configs(tmp_path, DELTA=True)
+    data = os.urandom(24000)
+    frames = transfer_versions(sender_config, receiver_config, [data, data[:12000] + b'changed' + data[12007:]])
+    # The second execution asks for the signatures of the basis and only sends the changed block
+    assert frames[1] < frames[0] // 3
+
+
+def test_dedup_transfer(tmp_path):
+    sender_config, receiver_config = make_configs(tmp_path, DEDUP=True)
+    # The chunk boundaries depend on the content, the same one in every run
+    rng = random.Random(1)
+    data = bytes(rng.getrandbits(8) for i in range(48000))
+    frames = transfer_versions(sender_config, receiver_config, [data, data[:24000] + b'inserted' + data[24000:]])
+    # The chunks of the first execution are in the store, only the one of the insertion is sent
+    assert frames[1] < frames[0] // 3
@@ -0,0 +1,18 @@
+#!/usr/bin/python3
+#
+# Neighbour discovery and ETX routing of the Network Mode (src/neighbours.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+from src import neighbours
+from const import const
+
+
+def test_repeated_hellos_are_ignored():
+    table = neighbours.NeighbourTable(1, clock=lambda: 0)
+    for seq in (5, 5, 4, 6, 8):
+        table.handle_hello(const.NM_HELLO + bytes([2, seq, 0]))
+    # Only the hello 7 was lost
+    assert table.neighbours[2].history == [True, True, False, True]
+    assert table.neighbours[2].last_seq == 8
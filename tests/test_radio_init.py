@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+#
+# Fast initialization of the radios from a register profile (src/util.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import pytest
+from src import util
+from conf import conf_srm_sender
+from fakes import FakeSpi
+
+
+@pytest.fixture
+def spi(monkeypatch):
+    monkeypatch.setattr(util.spidev, "SpiDev", FakeSpi)
+    monkeypatch.setattr(util, "RADIOS", dict())
+
+
+def test_profile_is_written(spi):
+    radio = util.fast_initialize_radio(0, 0, 30, conf_srm_sender)
+    assert radio is not None
+    assert radio.check_profile(util.radio_profile(30, conf_srm_sender))
+    assert radio.spidev.registers[radio.RF_CH] == 30
+
+
+def test_radio_is_reused_after_listening(spi):
+    radio = util.fast_initialize_radio(0, 0, 30, conf_srm_sender)
+    radio.startListening()
+    radio.stopListening()
+    writes = radio.spidev.register_writes
+    assert util.fast_initialize_radio(0, 0, 30, conf_srm_sender) is radio
+    assert radio.spidev.register_writes == writes
+
+
+def test_radio_is_reused_after_writing(spi):
+    radio = util.fast_initialize_radio(0, 0, 30, conf_srm_sender)
+    radio.startWrite([0] * 32)
+    writes = radio.spidev.register_writes
+    assert util.fast_initialize_radio(0, 0, 30, conf_srm_sender) is radio
+    assert radio.spidev.register_writes == writes
+
+
+def test_changed_profile_is_written_again(spi):
+    radio = util.fast_initialize_radio(0, 0, 30, conf_srm_sender)
+    radio.startListening()
+    writes = radio.spidev.register_writes
+    assert util.fast_initialize_radio(0, 0, 40, conf_srm_sender) is radio
+    assert radio.spidev.register_writes > writes
+    assert radio.spidev.registers[radio.RF_CH] == 40
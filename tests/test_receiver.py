@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+#
+# Requests answered by the receiver (src/receiver.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+from src import util
+from src.receiver import Receiver
+from const import const
+from fakes import make_config
+
+
+def test_signatures_without_basis(tmp_path):
+    config = make_config("conf_srm_receiver", str(tmp_path), DELTA=True)
+    receiver = Receiver(config, None, None)
+    receiver.start_reception()
+    reply = receiver.answer_request(util.build_request(const.SIGNATURE_TAG, 0), None, receiver.store)
+    assert reply == util.build_reply(0, b'')
+
+
+def test_basis_only_with_delta(tmp_path):
+    config = make_config("conf_srm_receiver", str(tmp_path), DELTA=False)
+    with open(config.OUT_FILEPATH_RAW + const.BASIS_EXTENSION, 'wb') as f:
+        f.write(b'previous file')
+    receiver = Receiver(config, None, None)
+    receiver.start_reception()
+    reply = receiver.answer_request(util.build_request(const.BASIS_TAG, 0), None, receiver.store)
+    assert reply == util.build_reply(0, bytes(const.CHUNK_COUNT_SIZE))
+
+    config.DELTA = True
+    reply = receiver.answer_request(util.build_request(const.BASIS_TAG, 0), None, receiver.store)
+    assert reply == util.build_reply(0, len(b'previous file').to_bytes(const.CHUNK_COUNT_SIZE, byteorder='big'))
+
+
+def test_dictionary_mismatch(tmp_path, monkeypatch):
+    config = make_config("conf_srm_receiver", str(tmp_path))
+    data = b'text compressed with the preset dictionary ' * 50
+    raw_file_path = str(tmp_path / "raw.txt")
+    compressed_path = str(tmp_path / "compressed")
+    with open(raw_file_path, 'wb') as f:
+        f.write(data)
+    monkeypatch.setattr(util, "DICTIONARY", b'text compressed with the preset dictionary')
+    util.compress_stream("zlib-dict", 9, raw_file_path, compressed_path)
+    header = util.build_header(os.path.getsize(compressed_path), 1, "zlib-dict", const.FLAG_DICTIONARY)
+    with open(compressed_path, 'rb') as f:
+        compressed = f.read()
+
+    # The same dictionary, another one and none
+    receiver = Receiver(config, None, None)
+    for dictionary, success in ((util.DICTIONARY, True), (b'another dictionary', False), (None, False)):
+        monkeypatch.setattr(util, "DICTIONARY", dictionary)
+        receiver.start_reception()
+        assert receiver.answer_request(util.build_request(const.DICTIONARY_TAG, 0), None, receiver.store) == \
+            util.build_reply(0, util.dictionary_id() or b'')
+        assert receiver.open_session(header)
+        for index in range(0, len(compressed), config.DATA_SIZE):
+            receiver.session.add(index // config.DATA_SIZE, compressed[index:index + config.DATA_SIZE])
+        receiver.session.close()
+        assert receiver.finish_reception() is success
+
+
+def test_rendezvous_only_on_allowed_channels(tmp_path):
+    config = make_config("conf_srm_receiver", str(tmp_path), ALLOWED_CHANNELS=range(40, 84))
+    receiver = Receiver(config, None, None)
+    receiver.start_reception()
+    # The cleanest candidates of the sender are out of the allowed channels
+    candidates = bytes([10, 0, 20, 0, 50, 10, 60, 20, 70, 30])
+    reply = receiver.answer_request(util.build_request(const.CHANNEL_TAG, 0, candidates), None, receiver.store)
+    assert reply == util.build_reply(0, bytes([50, 60]))
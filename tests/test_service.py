@@ -0,0 +1,24 @@
+#!/usr/bin/python3
+#
+# Jobs of the long running service (src/service.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+from src.service import Service
+from const import role
+from fakes import make_config
+
+
+def test_job_files_stay_in_the_raw_directories(tmp_path):
+    config = make_config("conf_srm_sender", str(tmp_path))
+    os.symlink("/etc", os.path.join(config.IN_PATH_RAW, "link"))
+    job_file = os.path.join(config.IN_PATH_RAW, "dir", "file.txt")
+    job_config = Service.job_config(None, config, {"role": role.TX, "file": job_file})
+    assert job_config.IN_FILEPATH_RAW == os.path.realpath(job_file)
+    assert config.IN_FILEPATH_RAW != job_config.IN_FILEPATH_RAW
+    for name in ("/etc/passwd", os.path.join(config.IN_PATH_RAW, "..", "file.txt"),
+                 os.path.join(config.IN_PATH_RAW, "link", "passwd"), config.OUT_PATH_RAW + "file.txt", 3):
+        assert Service.job_config(None, config, {"role": role.TX, "file": name}) is None
+    assert Service.job_config(None, config, {"role": role.RX, "file": config.OUT_PATH_RAW + "file.txt"}) is not None
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+#
+# File and codec utilities (src/util.py)
+# Author: Ibai Ros
+# Date: 20/05/2019
+# Version: 1.0
+
+import os
+import types
+import json
+import shlex
+import shutil
+import hashlib
+from src import util
+from src import realtime
+from const import const
+from fakes import make_config
+
+
+def test_chunk_view_close(tmp_path):
+    file_path = str(tmp_path / "file.bin")
+    with open(file_path, 'wb') as f:
+        f.write(os.urandom(100))
+    with util.ChunkView(file_path, 28) as payload_list:
+        assert len(payload_list) == 4
+        assert bytes(payload_list[3]) == open(file_path, 'rb').read()[84:]
+    assert payload_list.buffer.closed
+
+
+def test_chunk_view_close_with_chunk_referenced(tmp_path):
+    file_path = str(tmp_path / "file.bin")
+    data = os.urandom(100)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    payload_list = util.ChunkView(file_path, 28)
+    chunk = payload_list[0]
+    payload_list.close()
+    assert bytes(chunk) == data[:28]
+
+
+def test_output_path_stays_in_the_output_directory(tmp_path):
+    config = types.SimpleNamespace(OUT_PATH_RAW=str(tmp_path) + "/raw/")
+    os.makedirs(config.OUT_PATH_RAW)
+    assert util.output_path(config, "dir/file.txt") == os.path.realpath(config.OUT_PATH_RAW + "dir/file.txt")
+    for name in ("/etc/passwd", "../file.txt", "dir/../../file.txt", "", ".", None, 3):
+        assert util.output_path(config, name) is None
+
+
+def test_select_codec_is_stable(tmp_path, monkeypatch):
+    config = types.SimpleNamespace(CODEC_CACHE_PATH=str(tmp_path / "codecs.json"))
+    file_path = str(tmp_path / "file.txt")
+    with open(file_path, 'wb') as f:
+        f.write(b'compressible text ' * 1000)
+    trials = iter([("zlib", 6), ("lzma", 6), ("bz2", 9)])
+    monkeypatch.setattr(util, "trial_codecs", lambda config, file_path: next(trials))
+    assert util.select_codec(config, file_path) == ("zlib", 6)
+    assert util.select_codec(config, file_path) == ("zlib", 6)
+
+    with open(file_path, 'ab') as f:
+        f.write(b'more text')
+    assert util.select_codec(config, file_path) == ("lzma", 6)
+
+
+def test_uncompress_blocks(tmp_path):
+    config = types.SimpleNamespace(IN_FILEPATH_RAW=str(tmp_path / "in.txt"),
+                                   IN_FILEPATH_COMPRESSED=str(tmp_path / "blocks"),
+                                   OUT_FILEPATH_COMPRESSED=str(tmp_path / "blocks"),
+                                   OUT_FILEPATH_RAW=str(tmp_path / "out.txt"),
+                                   PARALLEL_BLOCK_SIZE=1000, COMPRESSION_PROCESSES=2)
+    data = os.urandom(500) * 7
+    with open(config.IN_FILEPATH_RAW, 'wb') as f:
+        f.write(data)
+    assert util.compress_blocks(config, "zlib", 6)
+    assert util.uncompress_file(config, "blocks")
+    assert open(config.OUT_FILEPATH_RAW, 'rb').read() == data
+
+
+def test_uncompress_blocks_malformed(tmp_path):
+    config = types.SimpleNamespace(OUT_FILEPATH_COMPRESSED=str(tmp_path / "blocks"),
+                                   OUT_FILEPATH_RAW=str(tmp_path / "out.txt"), COMPRESSION_PROCESSES=2)
+    for content in (b'', bytes([200]) + bytes(4), bytes([const.CODEC_IDS["7z"]]) + bytes(4),
+                    bytes([const.CODEC_IDS["zlib"], 0, 0, 0, 9, 0])):
+        with open(config.OUT_FILEPATH_COMPRESSED, 'wb') as f:
+            f.write(content)
+        assert not util.uncompress_file(config, "blocks")
+
+
+def test_uncompress_truncated_stream(tmp_path):
+    config = types.SimpleNamespace(OUT_FILEPATH_COMPRESSED=str(tmp_path / "compressed"),
+                                   OUT_FILEPATH_RAW=str(tmp_path / "out.txt"), COMPRESSION_LEVEL=6)
+    raw_file_path = str(tmp_path / "in.txt")
+    with open(raw_file_path, 'wb') as f:
+        f.write(os.urandom(3000))
+    for codec in ("zlib", "bz2", "lzma"):
+        util.compress_stream(codec, 6, raw_file_path, config.OUT_FILEPATH_COMPRESSED)
+        assert util.uncompress_file(config, codec)
+        with open(config.OUT_FILEPATH_COMPRESSED, 'r+b') as f:
+            f.truncate(os.path.getsize(config.OUT_FILEPATH_COMPRESSED) - 10)
+        assert not util.uncompress_file(config, codec)
+
+
+def test_uncompress_zlib_dict_without_dictionary(tmp_path, monkeypatch):
+    config = types.SimpleNamespace(OUT_FILEPATH_COMPRESSED=str(tmp_path / "compressed"),
+                                   OUT_FILEPATH_RAW=str(tmp_path / "out.txt"))
+    raw_file_path = str(tmp_path / "in.txt")
+    with open(raw_file_path, 'wb') as f:
+        f.write(b'some text ' * 100)
+    monkeypatch.setattr(util, "DICTIONARY", b'some text')
+    util.compress_stream("zlib-dict", 9, raw_file_path, config.OUT_FILEPATH_COMPRESSED)
+    monkeypatch.setattr(util, "DICTIONARY", None)
+    assert not util.uncompress_file(config, "zlib-dict")
+
+
+def test_uncompress_7z_to_the_output_path(tmp_path, monkeypatch):
+    config = make_config("conf_srm_receiver", str(tmp_path))
+    out_file_path = str(tmp_path / "job" / "received.txt")
+    os.makedirs(os.path.dirname(out_file_path))
+
+    def extract(command, **kwargs):
+        # 7z x -o<directory> <archive>: the file keeps the name it was compressed with
+        extract_path = shlex.split(command)[2][2:]
+        with open(os.path.join(extract_path, "sent.txt"), 'wb') as f:
+            f.write(b'content')
+        return b'Everything is Ok'
+
+    monkeypatch.setattr(util, "check_output", extract)
+    assert util.uncompress_file(config, "7z", out_file_path)
+    assert open(out_file_path, 'rb').read() == b'content'
+    assert os.listdir(config.OUT_PATH_COMPRESSED) == []
+
+
+def test_7z_children_keep_the_fast_path(tmp_path, monkeypatch):
+    config = make_config("conf_srm_sender", str(tmp_path))
+    calls = list()
+
+    def compress(command, **kwargs):
+        calls.append(kwargs)
+        return b'Everything is Ok'
+
+    monkeypatch.setattr(util, "check_output", compress)
+    monkeypatch.setattr(realtime, "OTHER_CPUS", None)
+    assert util.compress_file(config, "7z")
+    assert calls[-1]["preexec_fn"] is None
+
+    # Only when the radio loop is pinned the children go to the other cores
+    monkeypatch.setattr(realtime, "OTHER_CPUS", {0})
+    assert util.compress_file(config, "7z")
+    assert calls[-1]["preexec_fn"] is realtime.release
+
+
+def test_batch_with_stream_codecs(tmp_path):
+    sender_config = make_config("conf_srm_sender", str(tmp_path / "tx"), BATCH_MODE=True, CODEC="zlib",
+                                SOLID_MAX_FILE_SIZE=10)
+    receiver_config = make_config("conf_srm_receiver", str(tmp_path / "rx"))
+    files = {"a.txt": b'first file ' * 100, os.path.join("dir", "b.txt"): b'second file ' * 100}
+    for name, data in files.items():
+        os.makedirs(os.path.dirname(os.path.join(sender_config.IN_PATH_RAW, name)), exist_ok=True)
+        with open(os.path.join(sender_config.IN_PATH_RAW, name), 'wb') as f:
+            f.write(data)
+    # Every file is big enough to get its own stream, compressed with zlib
+    assert util.compress_batch(sender_config)
+    shutil.copyfile(sender_config.IN_FILEPATH_COMPRESSED, receiver_config.OUT_FILEPATH_COMPRESSED)
+    assert util.uncompress_batch(receiver_config)
+    for name, data in files.items():
+        assert open(os.path.join(receiver_config.OUT_PATH_RAW, name), 'rb').read() == data
+    compressed_name = os.path.basename(receiver_config.OUT_FILEPATH_COMPRESSED)
+    assert os.listdir(receiver_config.OUT_PATH_COMPRESSED) == [compressed_name]
+
+
+def test_batch_only_writes_the_manifest_files(tmp_path, monkeypatch):
+    config = make_config("conf_srm_receiver", str(tmp_path))
+    manifest = json.dumps({"streams": [{"codec": "7z", "size": 4, "files": [
+        {"name": "listed.txt", "size": 7, "md5": hashlib.md5(b'content').hexdigest()}]}]}).encode("utf-8")
+    with open(config.OUT_FILEPATH_COMPRESSED, 'wb') as f:
+        f.write(len(manifest).to_bytes(const.MANIFEST_LEN_SIZE, byteorder='big') + manifest + b'7z..')
+
+    def extract(command, **kwargs):
+        # The archive has an entry that is not in the manifest
+        extract_path = shlex.split(command)[3][2:]
+        for name, data in (("listed.txt", b'content'), ("other.txt", b'not listed')):
+            with open(os.path.join(extract_path, name), 'wb') as f:
+                f.write(data)
+        return b'Everything is Ok'
+
+    monkeypatch.setattr(util, "check_output", extract)
+    assert util.uncompress_batch(config)
+    assert os.listdir(config.OUT_PATH_RAW) == ["listed.txt"]
+    assert os.listdir(config.OUT_PATH_COMPRESSED) == [os.path.basename(config.OUT_FILEPATH_COMPRESSED)]